@@ -11,12 +11,16 @@
 #   * different workflows should be a matter of enabling different plugins
 
 import datetime
-import json
+import hashlib
 import logging
+import multiprocessing
 import os
+import threading
 
 from copy import deepcopy
+from functools import partial
 from pprint import pprint
+from queue import Empty
 
 import ansibullbot.constants as C
 
@@ -26,7 +30,14 @@ from ansibullbot.utils.botmetadata import BotMetadataParser
 from ansibullbot.defaulttriager import DefaultActions, DefaultTriager, render_boilerplate
 from ansibullbot.utils.component_tools import AnsibleComponentMatcher
 from ansibullbot.utils.extractors import extract_pr_number_from_comment
+from ansibullbot.utils.fact_graph import FactGraph, FactPlugin
+from ansibullbot.utils.fingerprint import get_fingerprint
+from ansibullbot.utils.github import ADB
+from ansibullbot.utils.instrumentation import STATS
+from ansibullbot.utils.issue_memory import IssueMemory
+from ansibullbot.utils.issue_store import flush_issue_stores
 from ansibullbot.utils.moduletools import ModuleIndexer
+from ansibullbot.utils.prefetch import Prefetcher
 from ansibullbot.utils.receiver_client import post_to_receiver
 from ansibullbot.utils.timetools import strip_time_safely
 from ansibullbot.utils.version_tools import AnsibleVersionIndexer, get_version_major_minor
@@ -134,12 +145,32 @@ class AnsibleTriager(DefaultTriager):
         self.ci = None
         self.ci_class = ci_class
 
+        self.botmeta_hash = None
+        self.git_head = None
+        self.fact_memo = None
+        self.meta_fingerprint = None
+
+        self._hydrate_lock = threading.Lock()
+
+        self.issue_memory = None
+        if self.args.memory_cache > 0:
+            self.issue_memory = IssueMemory(self.args.memory_cache, self.args.memory_cache_mb * 1024 * 1024)
+
+        if self.args.workers > 1 and not (self.args.force or self.args.dry_run):
+            raise ValueError('--workers requires either --force or --dry-run, workers can not prompt')
+        if self.args.workers > 1 and self.args.always_pause:
+            raise ValueError('--workers can not be combined with --pause')
+        if self.args.workers > 1 and self.args.async_actions:
+            # forking while the executor thread holds the database or logging locks deadlocks the workers
+            raise ValueError('--workers can not be combined with --async_actions')
+
     def load_botmeta(self, gitrepo):
         if self.args.botmetafile is not None:
             with open(self.args.botmetafile, 'rb') as f:
                 rdata = f.read()
         else:
             rdata = gitrepo.get_file_content('.github/BOTMETA.yml')
+        self.botmeta_hash = hashlib.sha1(to_bytes(rdata)).hexdigest()
         logging.info('ansible triager [re]loading botmeta')
         return BotMetadataParser.parse_yaml(rdata)
 
@@ -160,142 +191,397 @@ class AnsibleTriager(DefaultTriager):
 
         return True
 
+    def _inputs_unchanged(self, repopath, repodata, number):
+        '''Does the fingerprint saved with the meta still match the inputs?'''
+        if self.args.ignore_fingerprint or number in repodata['stale']:
+            return False
+
+        summary = repodata['summaries'].get(str(number))
+        if not summary or not summary.get('updated_at'):
+            return False
+
+        if not (lmeta := self.load_meta(repopath, str(number))) or not lmeta.get('fingerprint'):
+            return False
+
+        return lmeta['fingerprint'] == get_fingerprint(summary, lmeta, self.botmeta_hash, self.git_head)
+
+    def skip_reason(self, repopath, repodata, number, inputs=True):
+        '''Why the number does not need a triage, None when it does'''
+        if self.args.skip_no_update and self._should_skip_issue(repodata['summaries'][str(number)]):
+            return 'no changes since last run'
+
+        if inputs and self._inputs_unchanged(repopath, repodata, number):
+            return 'inputs unchanged since the last triage'
+
+        return None
+
     def run(self):
         '''Primary execution method'''
         ts1 = datetime.datetime.now()
+        STATS.reset()
 
-        self.collect_repos()
+        with STATS.stage('collect'):
+            self.collect_repos()
 
         if self.args.collect_only:
             return
 
         icount = 0
         for repopath, repodata in self.repos.items():
-            repo = repodata['repo']
-            cachedir = os.path.join(self.cachedir_base, repopath)
-
-            logging.info('loading botmeta')
-            self.botmeta = self.load_botmeta(repodata['gitrepo'])
-
-            logging.info('creating version indexer')
-            self.version_indexer = AnsibleVersionIndexer(checkoutdir=repodata['gitrepo'].checkoutdir)
-
-            logging.info('creating module indexer')
-            self.module_indexer = ModuleIndexer(
-                botmeta=self.botmeta,
-                gh_client=self.gqlc,
-                cachedir=self.cachedir_base,
-                gitrepo=repodata['gitrepo'],
-                commits=not self.args.ignore_module_commits
-            )
+            with STATS.stage('index'):
+                self.build_indexers(repodata)
 
-            logging.info('creating component matcher')
-            self.component_matcher = AnsibleComponentMatcher(
-                cachedir=self.cachedir_base,
-                gitrepo=repodata['gitrepo'],
-                botmeta=self.botmeta,
-                email_cache=self.module_indexer.emails_cache,
-                usecache=True,
-                use_galaxy=not self.args.ignore_galaxy
-            )
+            if self.args.workers > 1:
+                self.run_workers(repopath, repodata)
+                icount += len(repodata['numbers'])
+                continue
 
-            for issue in (
-                repodata['issuecache'].get(n, repodata['repo'].get_issue(n)) for n in repodata['numbers']
-            ):
+            if self.args.prefetch > 0:
+                prefetcher = Prefetcher(
+                    partial(self.prefetch_number, repopath, repodata),
+                    repodata['numbers'],
+                    lookahead=self.args.prefetch,
+                )
+                for number, iw in prefetcher:
+                    icount += 1
+                    self.triage_number(repopath, repodata, number, prefetched=iw)
+                continue
+
+            for number in repodata['numbers']:
                 icount += 1
+                self.triage_number(repopath, repodata, number)
 
-                self.meta = {}
-                self.processed_meta = {}
-                self.set_resume(repopath, issue.number)
+        flush_issue_stores()
 
-                # keep track of how many times this isssue has been re-done
-                loopcount = 0
-
-                its1 = datetime.datetime.now()
-                redo = True
-                while redo:
-                    redo = False
-
-                    # use the loopcount to check new data
-                    loopcount += 1
-
-                    if loopcount <= 1:
-                        logging.info('starting triage for %s' % issue.html_url)
-                    else:
-                        # if >1 get latest data
-                        logging.info('restarting triage for %s' % issue.number)
-                        issue = repo.get_issue(issue.number)
-
-                    if self.args.skip_no_update and self._should_skip_issue(repodata['summaries'][str(issue.number)]):
-                        logging.info('skipping: no changes since last run')
-                        continue
-
-                    # create the wrapper on each loop iteration
-                    iw = IssueWrapper(
-                        github=self.ghw,
-                        repo=repo,
-                        issue=issue,
-                        cachedir=cachedir,
-                        gitrepo=repodata['gitrepo'],
-                    )
-                    iw.updated_at = strip_time_safely(repodata['summaries'][str(issue.number)]['updated_at'])
-                    if iw.is_pullrequest():
-                        logging.info('creating CI wrapper')
-                        self.ci = self.ci_class(self.cachedir_base, iw)
-                    else:
-                        self.ci = None
-
-                    # force an update on the PR data
-                    iw.update_pullrequest()
-
-                    self.process(iw, repodata['labels'])
-
-                    # build up actions from the meta
-                    actions = AnsibleActions()
-                    self.create_actions(iw, actions, repodata['labels'])
-                    self.save_meta(iw, self.meta, actions)
-
-                    # DEBUG!
-                    logging.info('url: %s' % iw.html_url)
-                    logging.info('title: %s' % iw.title)
-                    if iw.is_pullrequest():
-                        for fn in iw.files:
-                            logging.info('component[f]: %s' % fn)
-                    else:
-                        for line in iw.template_data.get('component_raw', '').split('\n'):
-                            logging.info('component[t]: %s' % line)
-                        for fn in self.meta['component_filenames']:
-                            logging.info('component[m]: %s' % fn)
-
-                    if self.meta['template_missing_sections']:
-                        logging.info(
-                            'missing sections: ' +
-                            ', '.join(self.meta['template_missing_sections'])
-                        )
-                    if self.meta['is_needs_revision']:
-                        logging.info('needs_revision')
-                        for msg in self.meta['is_needs_revision_msgs']:
-                            logging.info('needs_revision_msg: %s' % msg)
-                    if self.meta['is_needs_rebase']:
-                        logging.info('needs_rebase')
-                        for msg in self.meta['is_needs_rebase_msgs']:
-                            logging.info('needs_rebase_msg: %s' % msg)
-
-                    pprint(vars(actions))
-
-                    action_meta = self.apply_actions(iw, actions)
-                    if action_meta['REDO']:
-                        redo = True
-
-                its2 = datetime.datetime.now()
-                td = (its2 - its1).total_seconds()
-                logging.info('finished triage for %s in %ss' % (str(issue.number), td))
+        if self.issue_memory is not None:
+            logging.info('issue memory: %s hits, %s misses, %s issues in %s bytes' % (
+                self.issue_memory.hits, self.issue_memory.misses, len(self.issue_memory), self.issue_memory.size
+            ))
 
         ts2 = datetime.datetime.now()
         td = (ts2 - ts1).total_seconds()
         logging.info('triaged %s issues in %s seconds' % (icount, td))
 
-    def save_meta(self, issuewrapper, meta, actions):
+        STATS.report(self.args.stats_file or os.path.join(self.cachedir_base, 'stats.json'))
+
+    def run_events(self, numbers):
+        '''Triage the numbers from webhook events with the indexers of the last run'''
+        for repopath, repo_numbers in numbers.items():
+            if repopath not in self.repos:
+                continue
+            repodata = self.repos[repopath]
+            self.collect_numbers(repopath, repo_numbers)
+            if 'indexers' in repodata:
+                self.botmeta, self.version_indexer, self.module_indexer, self.component_matcher = repodata['indexers']
+            else:
+                self.build_indexers(repodata)
+            for number in repodata['numbers']:
+                self.triage_number(repopath, repodata, number)
+        flush_issue_stores()
+
+    def build_indexers(self, repodata):
+        '''Create the indexers shared by every issue in the repo'''
+        logging.info('loading botmeta')
+        self.botmeta = self.load_botmeta(repodata['gitrepo'])
+        self.git_head = repodata['gitrepo'].head
+
+        logging.info('creating version indexer')
+        self.version_indexer = AnsibleVersionIndexer(checkoutdir=repodata['gitrepo'].checkoutdir)
+
+        logging.info('creating module indexer')
+        self.module_indexer = ModuleIndexer(
+            botmeta=self.botmeta,
+            gh_client=self.gqlc,
+            cachedir=self.cachedir_base,
+            gitrepo=repodata['gitrepo'],
+            commits=not self.args.ignore_module_commits
+        )
+
+        logging.info('creating component matcher')
+        self.component_matcher = AnsibleComponentMatcher(
+            cachedir=self.cachedir_base,
+            gitrepo=repodata['gitrepo'],
+            botmeta=self.botmeta,
+            email_cache=self.module_indexer.emails_cache,
+            usecache=True,
+            use_galaxy=not self.args.ignore_galaxy
+        )
+
+        repodata['indexers'] = (self.botmeta, self.version_indexer, self.module_indexer, self.component_matcher)
+
+    def run_workers(self, repopath, repodata):
+        '''Triage the repo's numbers with a pool of forked workers
+
+        The indexers are built once in the parent and inherited by each
+        worker, chunks of numbers are handed out through a shared queue.
+        '''
+        # resolve anything lazy before forking so the workers inherit it
+        self.maintainer_team
+        # the workers start with an empty write buffer
+        flush_issue_stores()
+
+        ctx = multiprocessing.get_context('fork')
+        queue = ctx.Queue()
+        results = ctx.Queue()
+
+        # hand out whole graphql hydration batches so no two workers
+        # fetch overlapping batches
+        numbers = repodata['numbers']
+        chunksize = max(1, self.args.hydrate)
+        chunks = [numbers[idx:idx + chunksize] for idx in range(0, len(numbers), chunksize)]
+        for chunk in enumerate(chunks):
+            queue.put(chunk)
+
+        workercount = min(self.args.workers, len(repodata['numbers']))
+        for x in range(workercount):
+            queue.put(None)
+
+        logging.info('starting %s workers for %s numbers' % (workercount, len(repodata['numbers'])))
+        workers = []
+        for x in range(workercount):
+            worker = ctx.Process(target=self._triage_worker, args=(queue, results, repopath, repodata))
+            worker.start()
+            workers.append(worker)
+
+        # drain before joining, a worker blocks on exit until its put is read
+        finished = set()
+        resumed = 0
+        pending = len(workers)
+        while pending:
+            try:
+                kind, value = results.get(timeout=1)
+            except Empty:
+                if not any(x.is_alive() for x in workers):
+                    logging.error('missing stage timings from %s workers' % pending)
+                    break
+                continue
+
+            if kind == 'stats':
+                STATS.merge(value)
+                pending -= 1
+                continue
+
+            # only resume past the chunks every earlier one is done with
+            finished.add(value)
+            if resumed in finished:
+                while resumed in finished:
+                    resumed += 1
+                if resumed < len(chunks):
+                    self.set_resume(repopath, chunks[resumed][0])
+                else:
+                    self.set_resume(repopath, chunks[-1][-1])
+
+        for worker in workers:
+            worker.join()
+            if worker.exitcode != 0:
+                logging.error('worker %s exited with %s' % (worker.pid, worker.exitcode))
+
+    def _triage_worker(self, queue, results, repopath, repodata):
+        # connections inherited from the parent can not be shared
+        ADB.reconnect()
+        # the parent keeps the stages it recorded before forking
+        STATS.reset()
+        # the workers would overwrite each other's position, the parent
+        # records it as the chunks finish
+        self.args.resume_enabled = False
+
+        try:
+            while True:
+                chunk = queue.get()
+                if chunk is None:
+                    break
+                idx, numbers = chunk
+                for number in numbers:
+                    self.triage_number(repopath, repodata, number)
+                results.put(('chunk', idx))
+        finally:
+            # forked processes exit without running the atexit hooks
+            flush_issue_stores()
+            results.put(('stats', STATS.snapshot()))
+
+    def prefetch_number(self, repopath, repodata, number):
+        '''Fetch the issue and warm its github data ahead of triage'''
+        with STATS.stage('prefetch'):
+            return self._prefetch_number(repopath, repodata, number)
+
+    def _prefetch_number(self, repopath, repodata, number):
+        # triage_number skips these before fetching anything
+        if self.skip_reason(repopath, repodata, number) is not None:
+            return None
+
+        # PyGithub's requester is not safe to share between threads, only
+        # the graphql and session based timeline requests run here. The
+        # issue object and the PR data are left to triage_number.
+        issue = repodata['issuecache'].get(number)
+        if issue is None:
+            return None
+
+        iw = self.create_wrapper(repopath, repodata, issue, update=False)
+
+        # the timeline lands in the on-disk cache, the hydrated data is
+        # kept on the wrapper which is handed to triage_number
+        iw.events
+
+        return iw
+
+    def create_wrapper(self, repopath, repodata, issue, hydrate=True, update=True):
+        '''Build the IssueWrapper for an issue with up to date PR data
+
+        Without update the PR data is fetched on first use instead.
+        '''
+        iw = IssueWrapper(
+            github=self.ghw,
+            repo=repodata['repo'],
+            issue=issue,
+            cachedir=os.path.join(self.cachedir_base, repopath),
+            gitrepo=repodata['gitrepo'],
+        )
+        iw.updated_at = strip_time_safely(repodata['summaries'][str(issue.number)]['updated_at'])
+
+        # force an update on the PR data
+        if update:
+            iw.update_pullrequest()
+
+        if hydrate and self.issue_memory is not None:
+            if self.issue_memory.load(iw, repopath, repodata['summaries'][str(issue.number)]):
+                return iw
+
+        if hydrate and self.args.hydrate > 0:
+            data = self.get_hydrated(repopath, repodata, issue.number)
+            if data is not None:
+                iw.hydrate(data)
+
+        return iw
+
+    def get_hydrated(self, repopath, repodata, number):
+        '''Return the batched graphql data for a number
+
+        On a miss the batch starting at the number is fetched, so walking
+        the numbers in order costs one query per --hydrate numbers.
+        '''
+        with self._hydrate_lock:
+            hydrated = repodata.setdefault('hydrated', {})
+            if number not in hydrated:
+                try:
+                    idx = repodata['numbers'].index(number)
+                    batch = repodata['numbers'][idx:idx + self.args.hydrate]
+                except ValueError:
+                    batch = [number]
+                try:
+                    hydrated.update(self.gqlc.hydrate_issues(repopath, batch))
+                except Exception as e:
+                    logging.warning('graphql hydration failed, using the REST api: %s' % e)
+            return hydrated.pop(number, None)
+
+    def triage_number(self, repopath, repodata, number, prefetched=None):
+        '''Process, create and apply the actions for a single number'''
+        with STATS.stage('triage'):
+            self._triage_number(repopath, repodata, number, prefetched=prefetched)
+
+    def _triage_number(self, repopath, repodata, number, prefetched=None):
+        repo = repodata['repo']
+
+        if prefetched is not None:
+            issue = prefetched.instance
+        else:
+            issue = repodata['issuecache'].get(number)
+            if issue is None:
+                issue = repo.get_issue(number)
+
+        self.meta = {}
+        self.processed_meta = {}
+        # facts a REDO can reuse when their inputs did not change
+        self.fact_memo = {}
+        self.set_resume(repopath, issue.number)
+
+        # keep track of how many times this isssue has been re-done
+        loopcount = 0
+
+        its1 = datetime.datetime.now()
+        redo = True
+        while redo:
+            redo = False
+
+            # use the loopcount to check new data
+            loopcount += 1
+
+            if loopcount <= 1:
+                logging.info('starting triage for %s' % issue.html_url)
+            else:
+                # if >1 get latest data
+                logging.info('restarting triage for %s' % issue.number)
+                issue = repo.get_issue(issue.number)
+
+            reason = self.skip_reason(repopath, repodata, issue.number, inputs=loopcount <= 1)
+            if reason is not None:
+                logging.info('skipping: %s' % reason)
+                continue
+
+            with STATS.stage('fetch'):
+                if prefetched is not None and loopcount <= 1:
+                    # the PR data is fetched on this thread on first use
+                    iw = prefetched
+                else:
+                    # create the wrapper on each loop iteration, a redo
+                    # wants the latest data rather than the batched one
+                    iw = self.create_wrapper(repopath, repodata, issue, hydrate=loopcount <= 1)
+
+                if iw.is_pullrequest():
+                    logging.info('creating CI wrapper')
+                    self.ci = self.ci_class(self.cachedir_base, iw)
+                else:
+                    self.ci = None
+
+            with STATS.stage('process'):
+                self.process(iw, repodata['labels'])
+
+            # build up actions from the meta
+            actions = AnsibleActions()
+            with STATS.stage('create_actions'):
+                self.create_actions(iw, actions, repodata['labels'])
+            with STATS.stage('save_meta'):
+                self.save_meta(iw, self.meta, actions, summary=repodata['summaries'].get(str(iw.number)))
+
+            # DEBUG!
+            logging.info('url: %s' % iw.html_url)
+            logging.info('title: %s' % iw.title)
+            if iw.is_pullrequest():
+                for fn in iw.files:
+                    logging.info('component[f]: %s' % fn)
+            else:
+                for line in iw.template_data.get('component_raw', '').split('\n'):
+                    logging.info('component[t]: %s' % line)
+                for fn in self.meta['component_filenames']:
+                    logging.info('component[m]: %s' % fn)
+
+            if self.meta['template_missing_sections']:
+                logging.info(
+                    'missing sections: ' +
+                    ', '.join(self.meta['template_missing_sections'])
+                )
+            if self.meta['is_needs_revision']:
+                logging.info('needs_revision')
+                for msg in self.meta['is_needs_revision_msgs']:
+                    logging.info('needs_revision_msg: %s' % msg)
+            if self.meta['is_needs_rebase']:
+                logging.info('needs_rebase')
+                for msg in self.meta['is_needs_rebase_msgs']:
+                    logging.info('needs_rebase_msg: %s' % msg)
+
+            pprint(vars(actions))
+
+            with STATS.stage('apply_actions'):
+                action_meta = self.apply_actions(iw, actions)
+            if action_meta['REDO']:
+                redo = True
+            elif self.issue_memory is not None:
+                self.issue_memory.save(iw, repopath, repodata['summaries'][str(iw.number)])
+
+        its2 = datetime.datetime.now()
+        td = (its2 - its1).total_seconds()
+        logging.info('finished triage for %s in %ss' % (str(issue.number), td))
+
+    def save_meta(self, issuewrapper, meta, actions, summary=None):
         # save the meta+actions
         dmeta = meta.copy()
         dmeta['submitter'] = issuewrapper.submitter
@@ -329,6 +615,14 @@ class AnsibleTriager(DefaultTriager):
         else:
             dmeta['pullrequest_reviews'] = []
 
+        # only a triage that settled with nothing left to do can be skipped
+        # next time, otherwise the actions it takes change the inputs anyway
+        self.meta_fingerprint = None
+        if summary and summary.get('updated_at') and not self.args.dry_run:
+            self.meta_fingerprint = get_fingerprint(summary, dmeta, self.botmeta_hash, self.git_head)
+            if not actions.count():
+                dmeta['fingerprint'] = self.meta_fingerprint
+
         self.dump_meta(issuewrapper, dmeta)
         namespace, reponame = issuewrapper.repo_full_name.split('/', 1)
 
@@ -351,15 +645,9 @@ class AnsibleTriager(DefaultTriager):
         self.processed_meta = dmeta_copy.copy()
 
     def dump_meta(self, issuewrapper, meta):
-        mfile = os.path.join(
-            issuewrapper.full_cachedir,
-            'meta.json'
-        )
         meta['time'] = to_text(datetime.datetime.now().isoformat())
-        logging.info('dump meta to %s' % mfile)
-
-        with open(mfile, 'w', encoding='utf-8') as f:
-            json.dump(meta, f)
+        logging.info('dump meta for %s' % issuewrapper.number)
+        issuewrapper.records.put('meta', meta, updated_at=meta.get('updated_at'))
 
     def create_actions(self, iw, actions, valid_labels):
         '''Parse facts and make actions from them'''
@@ -1157,199 +1445,311 @@ class AnsibleTriager(DefaultTriager):
     def process(self, iw, valid_labels):
         '''Do initial processing of the issue'''
 
-        # clear the actions+meta
-        self.meta = {}
+        # the plugins share the IssueWrapper, the indexers and the CI
+        # object, none of them thread safe, so they run one at a time
+        graph = FactGraph(self.get_fact_plugins(iw, valid_labels))
+        self.meta = graph.run(
+            inputs=self.get_fact_inputs(iw),
+            memo=self.fact_memo,
+        )
 
-        self.meta['state'] = iw.state
-        self.meta['submitter'] = iw.submitter
+    def get_fact_inputs(self, iw):
+        '''Signatures of the outside data the fact plugins read'''
+        def _pullrequest():
+            if not iw.is_pullrequest():
+                return None
+            return [iw.pullrequest.head.sha, iw.pullrequest.base.sha]
+
+        def _ci():
+            if self.ci is None:
+                return None
+            return [self.ci.build_id, self.ci.state, self.ci.updated_at]
+
+        return {
+            'body': lambda: [iw.title, iw.body],
+            # anything on the timeline bumps the issue's own updated_at
+            'history': lambda: iw.instance.updated_at,
+            'labels': lambda: sorted(iw.labels),
+            'pullrequest': _pullrequest,
+            'ci': _ci,
+        }
+
+    def get_fact_plugins(self, iw, valid_labels):
+        '''The fact plugins in the order their facts are merged'''
+        return [
+            FactPlugin(
+                'basics',
+                lambda meta: self.get_basic_facts(iw),
+                provides=('state', 'submitter', 'issue_type', 'is_issue', 'is_pullrequest'),
+                inputs=('body', 'history'),
+            ),
+            FactPlugin(
+                'ansible_version',
+                lambda meta: self.get_ansible_version_facts(iw),
+                provides=('ansible_version', 'ansible_label_version'),
+                inputs=('body', 'pullrequest'),
+            ),
+            # what component(s) is this about?
+            FactPlugin(
+                'component_match',
+                lambda meta: get_component_match_facts(iw, self.component_matcher, valid_labels),
+                provides=(
+                    'component_matches', 'component_filenames', 'component_maintainers',
+                    'component_namespace_maintainers', 'component_notifiers',
+                    'component_match_strategy', 'module_match', 'is_module', 'is_module_util',
+                    'is_new_module', 'is_new_directory', 'is_bad_pr',
+                ),
+                inputs=('body', 'history', 'pullrequest'),
+            ),
+            # collections? runs before backports, is_backport is never set yet
+            FactPlugin(
+                'collection',
+                lambda meta: get_collection_facts(iw, self.component_matcher, meta),
+                requires=('component_matches',),
+                inputs=('body', 'history', 'pullrequest'),
+            ),
+            FactPlugin(
+                'backports',
+                lambda meta: get_backport_facts(iw),
+                provides=('is_backport',),
+                inputs=('body', 'pullrequest'),
+            ),
+            FactPlugin('traceback', lambda meta: get_traceback_facts(iw), inputs=('body',)),
+            FactPlugin('small_patch', lambda meta: get_small_patch_facts(iw), inputs=('labels', 'pullrequest')),
+            FactPlugin('docs_only', lambda meta: get_docs_facts(iw), inputs=('pullrequest',)),
+            FactPlugin(
+                'needs_revision',
+                lambda meta: get_needs_revision_facts(iw, meta, self.ci, self.maintainer_team, C.DEFAULT_BOT_NAMES),
+                requires=('component_maintainers',),
+                provides=(
+                    'is_needs_revision', 'is_needs_rebase', 'has_ci', 'ci_state', 'ci_stale',
+                    'mergeable', 'merge_commits', 'has_commit_mention',
+                ),
+                inputs=('history', 'labels', 'pullrequest', 'ci'),
+            ),
+            FactPlugin(
+                'needs_contributor',
+                lambda meta: get_needs_contributor_facts(iw.history.history, C.DEFAULT_BOT_NAMES),
+                provides=('is_needs_contributor',),
+                inputs=('history',),
+            ),
+            # who needs to be notified or assigned?
+            FactPlugin(
+                'notifications',
+                lambda meta: get_notification_facts(iw, meta, botmeta=self.botmeta),
+                requires=('component_matches', 'component_maintainers', 'component_notifiers', 'module_match'),
+                inputs=('history',),
+            ),
+            # ci_verified and test results
+            FactPlugin(
+                'ci_run',
+                lambda meta: get_ci_run_facts(iw, meta, self.ci),
+                requires=('has_ci', 'ci_state'),
+                inputs=('history', 'labels', 'ci'),
+            ),
+            FactPlugin(
+                'needs_info',
+                lambda meta: {'is_needs_info': is_needsinfo(iw, C.DEFAULT_BOT_NAMES)},
+                provides=('is_needs_info',),
+                inputs=('history',),
+            ),
+            FactPlugin(
+                'comment_commands',
+                lambda meta: self.get_comment_command_facts(iw, meta),
+                requires=('component_maintainers', 'component_notifiers'),
+                inputs=('history',),
+            ),
+            FactPlugin(
+                'needs_info_template',
+                lambda meta: needs_info_template_facts(iw, meta),
+                requires=('is_needs_info', 'component_match_strategy'),
+                provides=('is_needs_info',),
+                inputs=('body', 'history'),
+            ),
+            FactPlugin(
+                'needs_info_timeout',
+                lambda meta: needs_info_timeout_facts(iw.history, meta),
+                requires=('is_needs_info',),
+                inputs=('history',),
+            ),
+            FactPlugin(
+                'shipit',
+                lambda meta: get_shipit_facts(
+                    iw, meta, self.botmeta['files'],
+                    maintainer_team=self.maintainer_team, botnames=C.DEFAULT_BOT_NAMES,
+                ),
+                requires=(
+                    'component_matches', 'component_maintainers', 'component_namespace_maintainers',
+                    'is_module_util', 'is_new_module', 'is_needs_revision', 'is_needs_rebase',
+                ),
+                provides=('shipit', 'supershipit'),
+                inputs=('history', 'pullrequest'),
+            ),
+            # bot_status needed?
+            FactPlugin(
+                'bot_status',
+                lambda meta: get_bot_status_facts(
+                    iw, self.module_indexer.all_maintainers,
+                    maintainer_team=self.maintainer_team, bot_names=C.DEFAULT_BOT_NAMES,
+                ),
+                inputs=('history',),
+            ),
+            # who is this waiting on?
+            FactPlugin(
+                'waiting_on',
+                lambda meta: self.get_waiting_on_facts(iw, meta),
+                requires=('is_needs_info', 'is_needs_contributor', 'is_needs_revision', 'is_needs_rebase'),
+            ),
+            # community label manipulation
+            FactPlugin(
+                'label_commands',
+                lambda meta: get_label_command_facts(
+                    iw, self.module_indexer.all_maintainers,
+                    maintainer_team=self.maintainer_team, valid_labels=valid_labels,
+                ),
+                inputs=('history', 'labels'),
+            ),
+            # waffling overrides [label_waffling_overrides]
+            FactPlugin(
+                'waffling_overrides',
+                lambda meta: get_waffling_overrides(
+                    iw, self.module_indexer.all_maintainers, maintainer_team=self.maintainer_team,
+                ),
+                inputs=('history',),
+            ),
+            # get_filament_facts sets its fact on the dict it is given
+            FactPlugin('filament', lambda meta: get_filament_facts(iw, {}), inputs=('pullrequest',)),
+            FactPlugin(
+                'test_support_plugins',
+                lambda meta: get_test_support_plugins_facts(iw, self.component_matcher),
+                inputs=('pullrequest',),
+            ),
+            FactPlugin('ci', lambda meta: get_ci_facts(iw, self.ci), inputs=('ci',)),
+            # ci rebuilds
+            FactPlugin(
+                'rebuild',
+                lambda meta: get_rebuild_facts(iw, meta),
+                requires=('ci_stale', 'is_needs_revision', 'is_needs_rebase', 'has_ci', 'shipit', 'ci_state'),
+                provides=('needs_rebuild', 'needs_rebuild_all'),
+                inputs=('pullrequest',),
+            ),
+            # ci rebuild + merge
+            FactPlugin(
+                'rebuild_merge',
+                lambda meta: get_rebuild_merge_facts(iw, meta, self.maintainer_team, self.ci),
+                requires=('needs_rebuild', 'needs_rebuild_all', 'is_needs_revision', 'is_needs_rebase'),
+                provides=('needs_rebuild', 'needs_rebuild_all'),
+                inputs=('history', 'pullrequest', 'ci'),
+            ),
+            # ci rebuild requested?
+            FactPlugin(
+                'rebuild_command',
+                lambda meta: get_rebuild_command_facts(iw, meta, self.ci),
+                requires=('needs_rebuild', 'needs_rebuild_all', 'needs_rebuild_failed'),
+                provides=('needs_rebuild', 'needs_rebuild_all', 'needs_rebuild_failed'),
+                inputs=('history', 'pullrequest', 'ci'),
+            ),
+            # first time contributor?
+            FactPlugin('contributor', lambda meta: get_contributor_facts(iw), inputs=('history',)),
+            # is it deprecated?
+            FactPlugin(
+                'deprecation',
+                lambda meta: get_deprecation_facts(meta),
+                requires=('is_module', 'module_match'),
+            ),
+            # does it have a pr or does it have an issue?
+            FactPlugin('cross_references', lambda meta: get_cross_reference_facts(iw), inputs=('history',)),
+            # need these keys to always exist
+            FactPlugin(
+                'defaults',
+                lambda meta: {
+                    'merge_commits': meta.get('merge_commits', []),
+                    'is_bad_pr': meta.get('is_bad_pr', False),
+                },
+                requires=('merge_commits', 'is_bad_pr'),
+                provides=('merge_commits', 'is_bad_pr'),
+            ),
+            # spam!
+            FactPlugin('spam', lambda meta: get_spam_facts(iw), inputs=('history',)),
+            FactPlugin(
+                'automerge',
+                lambda meta: get_automerge_facts(iw, meta),
+                requires=(
+                    'shipit', 'supershipit', 'is_backport', 'merge_commits', 'has_commit_mention',
+                    'is_needs_revision', 'is_needs_rebase', 'is_needs_info', 'has_ci', 'mergeable',
+                    'ci_stale', 'ci_state', 'component_matches', 'is_new_module', 'is_new_directory',
+                    'is_module', 'module_match',
+                ),
+                inputs=('body', 'pullrequest'),
+            ),
+            # community working groups
+            FactPlugin(
+                'community_workgroups',
+                lambda meta: get_community_workgroup_facts(iw, meta),
+                requires=('component_matches', 'component_maintainers'),
+                inputs=('body',),
+            ),
+        ]
+
+    def get_basic_facts(self, iw):
+        facts = {
+            'state': iw.state,
+            'submitter': iw.submitter,
+        }
 
         # set the issue type
         issue_type = iw.template_data.get('issue type')
         if issue_type in self.ISSUE_TYPES:
-            self.meta['issue_type'] = issue_type
+            facts['issue_type'] = issue_type
         else:
             # look for best match?
             for key in self.ISSUE_TYPES.keys():
                 if iw.body and key in iw.body.lower():
-                    self.meta['issue_type'] = key
+                    facts['issue_type'] = key
                     break
             else:
-                self.meta['issue_type'] = None
+                facts['issue_type'] = None
 
         # needed for bot status
-        self.meta['is_issue'] = iw.is_issue()
-        self.meta['is_pullrequest'] = iw.is_pullrequest()
+        facts['is_issue'] = iw.is_issue()
+        facts['is_pullrequest'] = iw.is_pullrequest()
 
-        # get ansible version
+        return facts
+
+    def get_ansible_version_facts(self, iw):
         if iw.is_issue():
             try:
-                self.meta['ansible_version'] = self.version_indexer.version_by_issue(iw)
+                ansible_version = self.version_indexer.version_by_issue(iw)
             except ValueError:
-                self.meta['ansible_version'] = self.version_indexer.version_by_date(iw.created_at)
+                ansible_version = self.version_indexer.version_by_date(iw.created_at)
         else:
-            self.meta['ansible_version'] = self.version_indexer.version_by_commit(iw.pullrequest.base.sha)
-
-        self.meta['ansible_label_version'] = get_version_major_minor(self.meta['ansible_version'])
-        logging.info('ansible version: %s' % self.meta['ansible_version'])
-
-        # what component(s) is this about?
-        self.meta.update(
-            get_component_match_facts(
-                iw,
-                self.component_matcher,
-                valid_labels
-            )
-        )
-
-        # collections?
-        self.meta.update(
-            get_collection_facts(
-                iw,
-                self.component_matcher,
-                self.meta,
-            )
-        )
+            ansible_version = self.version_indexer.version_by_commit(iw.pullrequest.base.sha)
 
-        # backports
-        self.meta.update(get_backport_facts(iw))
-
-        # traceback
-        self.meta.update(get_traceback_facts(iw))
+        logging.info('ansible version: %s' % ansible_version)
+        return {
+            'ansible_version': ansible_version,
+            'ansible_label_version': get_version_major_minor(ansible_version),
+        }
 
-        # small_patch
-        self.meta.update(get_small_patch_facts(iw))
-
-        # docs_only
-        self.meta.update(get_docs_facts(iw))
-
-        # shipit?
-        self.meta.update(
-            get_needs_revision_facts(
-                iw,
-                self.meta,
-                self.ci,
-                self.maintainer_team,
-                C.DEFAULT_BOT_NAMES,
-            )
-        )
-
-        # needs_contributor?
-        self.meta.update(get_needs_contributor_facts(iw.history.history, C.DEFAULT_BOT_NAMES))
-
-        # who needs to be notified or assigned?
-        self.meta.update(get_notification_facts(iw, self.meta, botmeta=self.botmeta))
-
-        # ci_verified and test results
-        self.meta.update(
-            get_ci_run_facts(iw, self.meta, self.ci)
-        )
-
-        # needsinfo?
-        self.meta['is_needs_info'] = is_needsinfo(iw, C.DEFAULT_BOT_NAMES)
-        self.meta.update(self.process_comment_commands(iw, self.meta))
-        self.meta.update(needs_info_template_facts(iw, self.meta))
-        self.meta.update(needs_info_timeout_facts(iw.history, self.meta))
-
-        # shipit?
-        self.meta.update(
-            get_shipit_facts(
-                iw, self.meta, self.botmeta['files'],
-                maintainer_team=self.maintainer_team, botnames=C.DEFAULT_BOT_NAMES,
-            )
-        )
+    def get_comment_command_facts(self, iw, meta):
+        # process_comment_commands adds its facts to the dict it is given
+        cmeta = self.process_comment_commands(iw, meta.copy())
+        return {k: v for k, v in cmeta.items() if k not in meta}
 
-        # bot_status needed?
-        self.meta.update(get_bot_status_facts(iw, self.module_indexer.all_maintainers, maintainer_team=self.maintainer_team, bot_names=C.DEFAULT_BOT_NAMES))
-
-        # who is this waiting on?
+    @staticmethod
+    def get_waiting_on_facts(iw, meta):
         wo = 'maintainer'
-        if self.meta['is_needs_info']:
+        if meta['is_needs_info']:
             wo = iw.submitter
         if iw.is_issue():
-            if self.meta['is_needs_contributor']:
+            if meta['is_needs_contributor']:
                 wo = 'contributor'
         else:
-            if self.meta['is_needs_revision'] or self.meta['is_needs_rebase']:
+            if meta['is_needs_revision'] or meta['is_needs_rebase']:
                 wo = iw.submitter
             else:
                 wo = 'ansible'
-        self.meta.update({'waiting_on': wo})
-
-        # community label manipulation
-        self.meta.update(
-            get_label_command_facts(
-                iw,
-                self.module_indexer.all_maintainers,
-                maintainer_team=self.maintainer_team,
-                valid_labels=valid_labels
-            )
-        )
-
-        # waffling overrides [label_waffling_overrides]
-        self.meta.update(
-            get_waffling_overrides(
-                iw,
-                self.module_indexer.all_maintainers,
-                maintainer_team=self.maintainer_team,
-            )
-        )
-
-        # filament
-        self.meta.update(get_filament_facts(iw, self.meta))
-
-        # test_support_plugins
-        self.meta.update(
-            get_test_support_plugins_facts(iw, self.component_matcher)
-        )
-
-        # ci
-        self.meta.update(get_ci_facts(iw, self.ci))
-
-        # ci rebuilds
-        self.meta.update(get_rebuild_facts(iw, self.meta))
-
-        # ci rebuild + merge
-        self.meta.update(
-            get_rebuild_merge_facts(
-                iw,
-                self.meta,
-                self.maintainer_team,
-                self.ci,
-            )
-        )
-
-        # ci rebuild requested?
-        self.meta.update(
-            get_rebuild_command_facts(
-                iw,
-                self.meta,
-                self.ci,
-            )
-        )
-
-        # first time contributor?
-        self.meta.update(get_contributor_facts(iw))
-
-        # is it deprecated?
-        self.meta.update(get_deprecation_facts(self.meta))
-
-        # does it have a pr or does it have an issue?
-        self.meta.update(get_cross_reference_facts(iw))
-
-        # need these keys to always exist
-        if 'merge_commits' not in self.meta:
-            self.meta['merge_commits'] = []
-        if 'is_bad_pr' not in self.meta:
-            self.meta['is_bad_pr'] = False
-
-        # spam!
-        self.meta.update(get_spam_facts(iw))
-
-        # automerge
-        self.meta.update(get_automerge_facts(iw, self.meta))
-
-        # community working groups
-        self.meta.update(get_community_workgroup_facts(iw, self.meta))
+        return {'waiting_on': wo}
 
     def process_comment_commands(self, issuewrapper, meta):
 
@@ -1452,6 +1852,19 @@ class AnsibleTriager(DefaultTriager):
 
         super().execute_actions(iw, actions)
 
+        self.execute_ci_actions(iw, actions)
+
+    def queue_actions(self, iw, actions, fingerprint=None):
+        """Queue the github actions, the CI ones need this triage's CI data"""
+
+        self.post_actions_to_receiver(iw, actions, self.processed_meta)
+
+        self.execute_ci_actions(iw, actions)
+
+        super().queue_actions(iw, actions, fingerprint=fingerprint or self.meta_fingerprint)
+
+    def execute_ci_actions(self, iw, actions):
+        """Rebuild or cancel the PR's CI runs"""
         if actions.rebuild:
             runid = self.meta.get('ci_run_number')
             if runid:
@@ -1493,6 +1906,8 @@ class AnsibleTriager(DefaultTriager):
                              " the repo in question.)"
         parser.add_argument("--skip_no_update", action="store_true",
                             help="skip processing if updated_at hasn't changed")
+        parser.add_argument("--ignore_fingerprint", action="store_true",
+                            help="reprocess issues even if none of their inputs changed")
         parser.add_argument("--collect_only", action="store_true",
                             help="stop after caching issues")
         parser.add_argument("--ignore_bot_broken", action="store_true",
@@ -1503,6 +1918,18 @@ class AnsibleTriager(DefaultTriager):
                             help="Use a specific commit for the indexers")
         parser.add_argument('--ignore_galaxy', action='store_true',
                             help='do not index or search for components in galaxy')
+        parser.add_argument("--workers", type=int, default=1,
+                            help="Number of forked worker processes to triage with")
+        parser.add_argument("--prefetch", type=int, default=0,
+                            help="Fetch github data for the next N numbers in the background (ignored with --workers)")
+        parser.add_argument("--hydrate", type=int, default=0,
+                            help="Fetch labels, timelines, reviews and check runs for N numbers per graphql query")
+        parser.add_argument("--stats_file", type=str, default=None,
+                            help="Write the stage timings of a run to this json file [<cachedir>/stats.json]")
+        parser.add_argument("--memory_cache", type=int, default=0,
+                            help="Keep the fetched data of the last N triaged issues in memory between daemonize loops")
+        parser.add_argument("--memory_cache_mb", type=int, default=512,
+                            help="Memory the --memory_cache issues may take")
         parser.add_argument("--ci", type=str, choices=VALID_CI_PROVIDERS,
                             default=C.DEFAULT_CI_PROVIDER,
                             help="Specify a CI provider that repo uses")
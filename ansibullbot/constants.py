@@ -259,6 +259,16 @@ DEFAULT_GITHUB_TOKEN = get_config(
     value_type='string'
 )
 
+# Additional tokens to spread the api calls over along with github_token
+DEFAULT_GITHUB_TOKENS = get_config(
+    p,
+    DEFAULTS,
+    'github_tokens',
+    '%s_GITHUB_TOKENS' % PROG_NAME.upper(),
+    [],
+    value_type='list'
+)
+
 DEFAULT_GITHUB_REPOS = get_config(
     p,
     DEFAULTS,
@@ -324,6 +334,66 @@ DEFAULT_STALE_WINDOW = get_config(
     value_type='int'
 )
 
+# Seconds between full resyncs of the issue summaries, the loops in
+# between only fetch the summaries updated since the last one
+DEFAULT_SUMMARY_RESYNC_INTERVAL = get_config(
+    p,
+    DEFAULTS,
+    'summary_resync_interval',
+    '%s_SUMMARY_RESYNC_INTERVAL' % PROG_NAME.upper(),
+    24 * 60 * 60,
+    value_type='int'
+)
+
+# How many pages of a REST list endpoint to fetch at once
+DEFAULT_PAGINATION_WORKERS = get_config(
+    p,
+    DEFAULTS,
+    'pagination_workers',
+    '%s_PAGINATION_WORKERS' % PROG_NAME.upper(),
+    4,
+    value_type='int'
+)
+
+# Connections kept alive per host by the shared http session
+DEFAULT_HTTP_POOL_MAXSIZE = get_config(
+    p,
+    'http',
+    'pool_maxsize',
+    '%s_HTTP_POOL_MAXSIZE' % PROG_NAME.upper(),
+    10,
+    value_type='int'
+)
+
+# The github api host gets its own pool, every prefetch thread can have
+# pagination_workers requests in flight
+DEFAULT_HTTP_GITHUB_POOL_MAXSIZE = get_config(
+    p,
+    'http',
+    'github_pool_maxsize',
+    '%s_HTTP_GITHUB_POOL_MAXSIZE' % PROG_NAME.upper(),
+    32,
+    value_type='int'
+)
+
+DEFAULT_HTTP_RETRIES = get_config(
+    p,
+    'http',
+    'retries',
+    '%s_HTTP_RETRIES' % PROG_NAME.upper(),
+    3,
+    value_type='int'
+)
+
+DEFAULT_HTTP_BACKOFF = get_config(
+    p,
+    'http',
+    'backoff',
+    '%s_HTTP_BACKOFF' % PROG_NAME.upper(),
+    0.5,
+    value_type='float'
+)
+
 
 # Pickle the issue objects?
 DEFAULT_PICKLE_ISSUES = get_config(
@@ -406,6 +476,38 @@ DEFAULT_RECEIVER_PORT = get_config(
     value_type='int'
 )
 
+###########################################
+#   WEBHOOKS
+###########################################
+
+DEFAULT_WEBHOOK_HOST = get_config(
+    p,
+    'webhooks',
+    'host',
+    '%s_WEBHOOK_HOST' % PROG_NAME.upper(),
+    '127.0.0.1',
+    value_type='string'
+)
+
+DEFAULT_WEBHOOK_PORT = get_config(
+    p,
+    'webhooks',
+    'port',
+    '%s_WEBHOOK_PORT' % PROG_NAME.upper(),
+    8090,
+    value_type='int'
+)
+
+# The secret configured on the github webhook, payloads are signed with it
+DEFAULT_WEBHOOK_SECRET = get_config(
+    p,
+    'webhooks',
+    'secret',
+    '%s_WEBHOOK_SECRET' % PROG_NAME.upper(),
+    '',
+    value_type='string'
+)
+
 ###########################################
 #   SENTRY ERROR REPORTING
 ###########################################
@@ -24,17 +24,26 @@ import sys
 import time
 import typing as t
 
-import requests
 from jinja2 import Environment, FileSystemLoader
 
 from ansibullbot import constants as C
-from ansibullbot.utils.github import RateLimited
+from ansibullbot.utils.action_queue import ActionExecutor
+from ansibullbot.utils.cache_gc import collect_garbage
+from ansibullbot.utils.github import ADB, RateLimited
 from ansibullbot.utils.gh_gql_client import GithubGraphQLClient
 from ansibullbot.utils.git_tools import GitRepoWrapper
+from ansibullbot.utils import http_archive
+from ansibullbot.utils.issue_store import get_issue_store
 from ansibullbot.utils.logs import set_logger
+from ansibullbot.utils.net_tools import get_session
+from ansibullbot.utils.summary_store import SummaryIndex
 from ansibullbot.utils.systemtools import run_command
 from ansibullbot.utils.timetools import strip_time_safely
+from ansibullbot.utils.webhooks import start_webhook_listener
+from ansibullbot.utils.work_queue import PRIORITY_CI, PRIORITY_STALE, PRIORITY_TIMER, PRIORITY_UPDATED, WorkQueue, has_due_timer
 from ansibullbot.ghapiwrapper import GithubWrapper, RepoWrapper
+from ansibullbot.historywrapper import COMMENT_BREAK
+from ansibullbot.issuewrapper import IssueWrapper
 
 
 basepath = os.path.dirname(__file__).split('/')
@@ -98,6 +107,12 @@ class DefaultTriager:
         set_logger(debug=self.args.debug, logfile=self.args.logfile)
         logging.info('starting bot')
 
+        if self.args.webhooks:
+            if not C.DEFAULT_WEBHOOK_SECRET:
+                raise ValueError('--webhooks requires a webhook secret to verify deliveries')
+            # the reconciliation runs use the daemonize since cursor and work queue
+            self.args.daemonize = True
+
         self.cachedir_base = os.path.expanduser(self.args.cachedir_base)
         self.repos = {}
 
@@ -109,23 +124,39 @@ class DefaultTriager:
             else:
                 self.args.start_at = resume['number'] + 1
 
+        if self.args.async_actions and not self.args.force:
+            raise ValueError('--async_actions requires --force, queued actions can not prompt')
+
+        if self.args.http_record and self.args.http_replay:
+            raise ValueError('--http_record and --http_replay are mutually exclusive')
+        if self.args.http_record:
+            http_archive.install('record', self.args.http_record)
+        elif self.args.http_replay:
+            http_archive.install('replay', self.args.http_replay, latency=self.args.http_replay_latency)
+
         logging.info('creating api wrapper')
         self.ghw = GithubWrapper(
             url=C.DEFAULT_GITHUB_URL,
             user=C.DEFAULT_GITHUB_USERNAME,
             passw=C.DEFAULT_GITHUB_PASSWORD,
             token=C.DEFAULT_GITHUB_TOKEN,
-            cachedir=self.cachedir_base
+            cachedir=self.cachedir_base,
+            tokens=C.DEFAULT_GITHUB_TOKENS
         )
 
         logging.info('creating graphql client')
         self.gqlc = GithubGraphQLClient(
             C.DEFAULT_GITHUB_TOKEN,
-            server=C.DEFAULT_GITHUB_URL
+            server=C.DEFAULT_GITHUB_URL,
+            tokens=C.DEFAULT_GITHUB_TOKENS
         )
 
         self._maintainer_team = None
 
+        # the executor thread's own api objects, see execute_queued_actions
+        self.action_ghw = None
+        self.action_repos = {}
+
     @property
     def maintainer_team(self):
         # Note: this assumes that the token used by the bot has access to check
@@ -141,15 +172,21 @@ class DefaultTriager:
     @classmethod
     def create_parser(cls):
         parser = argparse.ArgumentParser()
+        parser.add_argument("--async_actions", action="store_true", help="queue the actions and execute them in the background, requires --force")
         parser.add_argument("--botmetafile", type=str, default=None, help="Use this filepath for botmeta instead of from the repo")
         parser.add_argument("--cachedir", type=str, dest='cachedir_base', default='~/.ansibullbot/cache')
+        parser.add_argument("--cache-gc", action="store_true", dest="cache_gc", help="trim the cache to its size and age budgets and exit")
         parser.add_argument("--daemonize", action="store_true", help="run in a continuos loop")
         parser.add_argument("--daemonize_interval", type=int, default=(30 * 60), help="seconds to sleep between loop iterations")
         parser.add_argument("--debug", "-d", action="store_true", help="Debug output")
         parser.add_argument("--dry-run", "-n", action="store_true", help="Don't make any changes")
         parser.add_argument("--dump_actions", action="store_true", help="serialize the actions to disk [/tmp/actions]")
         parser.add_argument("--force", "-f", action="store_true", help="Do not ask questions")
+        parser.add_argument("--full_sync", action="store_true", help="resync every issue summary instead of only the updated ones")
         parser.add_argument("--logfile", type=str, help="Send logging to this file")
+        parser.add_argument("--http_record", type=str, help="record the github and azp http traffic to this archive")
+        parser.add_argument("--http_replay", type=str, help="answer github and azp requests from this archive instead of the network")
+        parser.add_argument("--http_replay_latency", type=float, default=1.0, help="scale the recorded response times by this when replaying, 0 to not wait")
         parser.add_argument("--ignore_state", action="store_true", help="Do not skip processing closed issues")
         parser.add_argument("--last", type=int, help="triage the last N issues or PRs")
         parser.add_argument("--only_closed", action="store_true", help="Triage closed issues|prs only")
@@ -157,30 +194,114 @@ class DefaultTriager:
         parser.add_argument("--only_prs", action="store_true", help="Triage pullrequests only")
         parser.add_argument("--pause", "-p", action="store_true", dest="always_pause", help="Always pause between prs|issues")
         parser.add_argument("--pr", "--id", type=str, help="Triage only the specified pr|issue (separated by commas)")
+        parser.add_argument("--reconcile_interval", type=int, default=(6 * 60 * 60), help="seconds between full runs in --webhooks mode")
         parser.add_argument("--resume", action="store_true", dest="resume_enabled", help="pickup right after where the bot last stopped")
         parser.add_argument("--repo", "-r", type=str, help="Github repo to triage (defaults to all)")
         parser.add_argument("--skiprepo", action='append', help="Github repo to skip triaging")
+        parser.add_argument("--stale_limit", type=int, help="re-check at most N stale issues per daemonize loop")
         parser.add_argument("--start-at", type=int, help="Start triage at the specified pr|issue")
+        parser.add_argument("--webhooks", action="store_true", help="triage as github webhook events arrive, polling only to reconcile")
         parser.add_argument("--sort", default='desc', choices=['asc', 'desc'], help="Direction to sort issues [desc=9-0 asc=0-9]")
         return parser
 
     def start(self):
-        if self.args.daemonize:
-            logging.info('starting daemonize loop')
-            while True:
+        if self.args.cache_gc:
+            logging.info('collecting cache garbage')
+            collect_garbage(self.cachedir_base)
+            return
+
+        executor = None
+        if self.args.async_actions and not self.args.dry_run:
+            logging.info('starting action executor')
+            executor = self.start_action_executor()
+
+        try:
+            if self.args.webhooks:
+                logging.info('starting webhook loop')
+                self.run_webhooks()
+            elif self.args.daemonize:
+                logging.info('starting daemonize loop')
+                while True:
+                    self.run()
+                    collect_garbage(self.cachedir_base)
+                    interval = self.args.daemonize_interval
+                    logging.info('sleep %ss (%sm)' % (interval, interval / 60))
+                    time.sleep(interval)
+            else:
+                logging.info('starting single run')
                 self.run()
-                interval = self.args.daemonize_interval
-                logging.info('sleep %ss (%sm)' % (interval, interval / 60))
-                time.sleep(interval)
-        else:
-            logging.info('starting single run')
-            self.run()
+        finally:
+            if executor is not None:
+                logging.info('waiting for the queued actions')
+                executor.stop()
         logging.info('stopping bot')
 
+    def start_action_executor(self):
+        '''Execute the queued actions in a thread with its own api wrapper'''
+        # PyGithub's requester is not safe to share between threads
+        self.action_ghw = GithubWrapper(
+            url=C.DEFAULT_GITHUB_URL,
+            user=C.DEFAULT_GITHUB_USERNAME,
+            passw=C.DEFAULT_GITHUB_PASSWORD,
+            token=C.DEFAULT_GITHUB_TOKEN,
+            cachedir=self.cachedir_base,
+            tokens=C.DEFAULT_GITHUB_TOKENS
+        )
+        executor = ActionExecutor(self.execute_queued_actions)
+        executor.start()
+        return executor
+
+    def run_webhooks(self):
+        """Triage numbers as their webhook events arrive
+
+        A full run still happens every --reconcile_interval seconds to
+        catch anything a missed or failed delivery left behind.
+        """
+        server = start_webhook_listener(
+            C.DEFAULT_WEBHOOK_HOST,
+            C.DEFAULT_WEBHOOK_PORT,
+            C.DEFAULT_WEBHOOK_SECRET,
+            C.DEFAULT_GITHUB_REPOS,
+        )
+        # left claimed by a run that died while triaging them
+        ADB.release_webhook_events()
+        last_run = None
+        try:
+            while True:
+                if last_run is None or time.time() - last_run >= self.args.reconcile_interval:
+                    logging.info('reconciling with a full run')
+                    self.run()
+                    last_run = time.time()
+                    continue
+
+                events = ADB.claim_webhook_events()
+                if not events:
+                    time.sleep(1)
+                    continue
+
+                numbers = {}
+                for event in events:
+                    numbers.setdefault(event['repo'], []).append(event['number'])
+                event_ids = [x['id'] for x in events]
+                try:
+                    self.run_events(numbers)
+                except BaseException:
+                    # keep them for the next start
+                    ADB.release_webhook_events(event_ids)
+                    raise
+                ADB.finish_webhook_events(event_ids)
+        finally:
+            server.shutdown()
+
     @abc.abstractmethod
     def run(self):
         pass
 
+    @abc.abstractmethod
+    def run_events(self, numbers):
+        """Triage the numbers from webhook events, keyed by repo"""
+        pass
+
     def apply_actions(self, iw, actions):
         action_meta = {'REDO': False}
 
@@ -191,6 +312,10 @@ class DefaultTriager:
             if self.args.dry_run:
                 print("Dry-run specified, skipping execution of actions")
             else:
+                if self.args.async_actions:
+                    print("Queueing actions to be executed in the background.")
+                    self.queue_actions(iw, actions)
+                    return action_meta
                 if self.args.force:
                     print("Running actions non-interactive as you forced.")
                     self.execute_actions(iw, actions)
@@ -223,38 +348,110 @@ class DefaultTriager:
         # let the upper level code redo this issue
         return action_meta
 
-    def execute_actions(self, iw, actions):
-        """Turns the actions into API calls"""
-        for commentid in actions.uncomment:
-            iw.remove_comment_by_id(commentid)
-
-        for comment in actions.comments:
-            logging.info("acton: comment - " + comment)
-            iw.add_comment(comment=comment)
-
+    def execute_actions(self, iw, actions, done=(), progress=None):
+        """Turns the actions into API calls
+
+        Each kind of change is sent in as few calls as possible, the
+        comments are posted as one and the labels are written in one
+        call, together with the state when the issue gets closed.
+
+        The steps in `done` are skipped and `progress` is called with
+        each step once it is executed, so retried actions resume where
+        they failed instead of posting the comment again.
+        """
+        def finished(step):
+            if progress is not None:
+                progress(step)
+
+        if 'uncomment' not in done:
+            for commentid in actions.uncomment:
+                iw.remove_comment_by_id(commentid)
+            finished('uncomment')
+
+        if actions.comments and 'comment' not in done:
+            for comment in actions.comments:
+                logging.info("acton: comment - " + comment)
+            iw.add_comment(comment=('\n\n---\n%s\n\n' % COMMENT_BREAK).join(actions.comments))
+            finished('comment')
+
+        if 'labels' not in done:
+            self.execute_label_actions(iw, actions)
+            finished('labels')
+
+        if not actions.close and actions.merge:
+            iw.merge()
+
+    def execute_label_actions(self, iw, actions):
+        """Write the label changes, and close the issue with them"""
         if actions.close:
-            for newlabel in actions.newlabel:
-                if newlabel in self.CLOSING_LABELS:
-                    logging.info('action: label - ' + newlabel)
-                    iw.add_label(label=newlabel)
-
-            for unlabel in actions.unlabel:
-                logging.info('action: unlabel - ' + unlabel)
-                iw.remove_label(label=unlabel)
+            newlabels = [x for x in actions.newlabel if x in self.CLOSING_LABELS]
+        else:
+            newlabels = actions.newlabel
+
+        current = list(iw.labels)
+        removed = [x for x in actions.unlabel if x in current]
+        added = [x for x in newlabels if x not in current]
+        for unlabel in removed:
+            logging.info('action: unlabel - ' + unlabel)
+        for newlabel in added:
+            logging.info('action: label - ' + newlabel)
+
+        if removed or (actions.close and added):
+            # the whole label set gets replaced, start from the labels the
+            # issue has now so the ones set since the triage are kept
+            current = iw.get_current_labels()
+            labels = [x for x in current if x not in actions.unlabel]
+            labels += [x for x in newlabels if x not in labels]
+            changed = set(labels) != set(current)
+        else:
+            labels = None
+            changed = bool(added)
 
+        if actions.close:
             logging.info('action: close')
-            iw.instance.edit(state='closed')
+            iw.close(labels=labels if changed else None)
+        elif changed:
+            if labels is None:
+                iw.add_labels(added)
+            else:
+                iw.set_labels(labels)
+
+    def queue_actions(self, iw, actions, fingerprint=None):
+        """Queue the issue's actions for the executor thread
+
+        Pending actions queued for the issue by an earlier triage are
+        replaced, the same actions for the same inputs are only queued
+        once.
+        """
+        if fingerprint is None:
+            fingerprint = iw.updated_at.isoformat()
+        data = {name: getattr(actions, name) for name in vars(DefaultActions())}
+        if not ADB.enqueue_actions(iw.repo_full_name, iw.number, fingerprint, json.dumps(data, sort_keys=True)):
+            logging.info('actions for %s are already queued' % iw.number)
+
+    def execute_queued_actions(self, entry):
+        """Execute actions from the queue against the issue's current state"""
+        repo = self.action_repos.get(entry['repo'])
+        if repo is None:
+            repo = self.action_repos[entry['repo']] = RepoWrapper(self.action_ghw.gh, entry['repo'], cachedir=self.cachedir_base)
+
+        iw = IssueWrapper(
+            github=self.action_ghw,
+            repo=repo,
+            issue=repo.repo.get_issue(entry['number']),
+            cachedir=os.path.join(self.cachedir_base, entry['repo']),
+        )
 
-        else:
-            for unlabel in actions.unlabel:
-                logging.info('action: unlabel - ' + unlabel)
-                iw.remove_label(label=unlabel)
-            for newlabel in actions.newlabel:
-                logging.info('action: label - ' + newlabel)
-                iw.add_label(label=newlabel)
+        actions = DefaultActions()
+        for name, value in entry['actions'].items():
+            setattr(actions, name, value)
 
-            if actions.merge:
-                iw.merge()
+        # not the subclass's, the inline parts already ran when queueing
+        DefaultTriager.execute_actions(
+            self, iw, actions,
+            done=entry['done'],
+            progress=lambda step: ADB.record_actions_step(entry['id'], step)
+        )
 
     def dump_action_dict(self, issue, actions):
         """Serialize the action dict to disk for quick(er) debugging"""
@@ -303,7 +500,7 @@ class DefaultTriager:
             pr = int(pr)
 
         elif pr.startswith('http'):
-            rr = requests.get(pr)
+            rr = get_session().get(pr)
             numbers = rr.json()
             pr = numbers[:]
 
@@ -337,46 +534,50 @@ class DefaultTriager:
         return pr
 
     def load_meta(self, reponame: str, number: str) -> t.Dict[str, t.Any]:
-        mfile = os.path.join(
-            self.cachedir_base,
-            reponame,
-            'issues',
-            number,
-            'meta.json'
-        )
-        meta = {}
-        try:
-            with open(mfile, 'rb') as f:
-                meta = json.load(f)
-        except ValueError as e:
-            logging.error("Could not load json from '%s' because: '%s'. Removing the file...", mfile, e)
-            os.remove(mfile)
-        except OSError:
-            pass
-        return meta
+        store = get_issue_store(os.path.join(self.cachedir_base, reponame))
+        return store.get(reponame, number, 'meta') or {}
 
-    def get_stale_numbers(self, reponame: str, issue_summaries: t.Dict[str, t.Dict[str, t.Any]]) -> t.List[int]:
-        stale = []
+    def queue_scheduled_numbers(self, reponame: str, issue_summaries: SummaryIndex, queue: WorkQueue) -> None:
+        """Queue the open issues whose bot timers fired or whose triage is stale"""
         for summary in issue_summaries.values():
             number = summary['number']
-            if number in stale:
-                continue
-            if summary['state'] == 'closed':
+            if summary['state'] != 'open':
                 continue
 
             if not (meta := self.load_meta(reponame, str(number))):
-                stale.append(number)
+                queue.add(number, PRIORITY_STALE)
+                continue
+
+            if has_due_timer(meta):
+                queue.add(number, PRIORITY_TIMER)
                 continue
 
             days_stale = (datetime.datetime.now() - strip_time_safely(meta['time'])).days
             if days_stale > C.DEFAULT_STALE_WINDOW:
-                stale.append(number)
-
-        stale = sorted(stale)
-        if 10 >= len(stale) > 0:
-            logging.info('stale: %s' % stale)
+                queue.add(number, PRIORITY_STALE, key=meta['time'])
+
+    def get_summaries_for_numbers(self, repo, numbers):
+        summaries = {}
+        for num in numbers:
+            for object_type in ('pullRequest', 'issue'):
+                node = self.gqlc.get_summary(repo, object_type, num)
+                if node is not None:
+                    summaries[str(num)] = node
+                    break
+        return summaries
+
+    def collect_numbers(self, repo, numbers):
+        """Refresh the summaries of a few numbers in an already collected repo"""
+        repodata = self.repos[repo]
+        repodata['summaries'].update(self.get_summaries_for_numbers(repo, numbers))
+
+        numbers = {int(x) for x in numbers}
+        if not self.args.ignore_state:
+            issues_state = 'closed' if self.args.only_closed else 'open'
+            numbers &= repodata['summaries'].select(state=issues_state)
 
-        return stale
+        repodata['numbers'] = sorted(numbers)
+        repodata['issuecache'] = {}
 
     @RateLimited
     def _collect_repo(self, repo, issuenums=None):
@@ -413,53 +614,34 @@ class DefaultTriager:
             self.repos[repo]['loopcount'] += 1
 
         logging.info('getting issue objs for %s' % repo)
-        issue_summaries = {}
         if issuenums and len(issuenums) <= 10:
-            for num in issuenums:
-                for object_type in ('pullRequest', 'issue'):
-                    node = self.gqlc.get_summary(repo, object_type, num)
-                    if node is not None:
-                        issue_summaries[str(num)] = node
-                        break
+            issue_summaries = SummaryIndex(self.get_summaries_for_numbers(repo, issuenums), repo=repo)
         else:
-            issue_summaries = self.gqlc.get_issue_summaries(repo)
+            issue_summaries = self.gqlc.sync_issue_summaries(
+                repo,
+                self.cachedir_base,
+                full=self.args.full_sync
+            )
 
         issuecache = {}
-        numbers = [int(x) for x in issue_summaries.keys()]
+        numbers = issue_summaries.select()
         if issuenums:
-            numbers = set(numbers)
-            numbers.intersection_update(issuenums)
-            numbers = list(numbers)
+            numbers.intersection_update(int(x) for x in issuenums)
         logging.info('%s known numbers' % len(numbers))
 
+        queue = None
         if self.args.daemonize:
-            if not self.repos[repo]['since']:
-                ts = [
-                    x[1]['updated_at'] for x in
-                    issue_summaries.items()
-                    if x[1]['updated_at']
-                ]
-                ts += [
-                    x[1]['created_at'] for x in
-                    issue_summaries.items()
-                    if x[1]['created_at']
-                ]
-                ts = sorted(set(ts))
-                if ts:
-                    self.repos[repo]['since'] = ts[-1]
-            else:
+            if self.repos[repo]['since']:
                 since = strip_time_safely(self.repos[repo]['since'])
                 api_since = self.repos[repo]['repo'].get_issues(since=since)
 
-                numbers = []
+                queue = WorkQueue()
                 for x in api_since:
-                    numbers.append(x.number)
+                    queue.add(x.number, PRIORITY_UPDATED)
                     issuecache[x.number] = x
-
-                numbers = sorted({int(n) for n in numbers})
                 logging.info(
                     '%s numbers after [api] since == %s' %
-                    (len(numbers), since)
+                    (len(queue), since)
                 )
 
                 for k, v in issue_summaries.items():
@@ -468,58 +650,77 @@ class DefaultTriager:
                         continue
 
                     if v['updated_at'] > self.repos[repo]['since']:
-                        numbers.append(k)
+                        # the summary's updated_at includes the last CI run
+                        if v.get('ci_updated_at') and v['ci_updated_at'] > self.repos[repo]['since']:
+                            queue.add(k, PRIORITY_CI)
+                        else:
+                            queue.add(k, PRIORITY_UPDATED)
 
-                numbers = sorted({int(n) for n in numbers})
+                numbers = queue.ordered()
                 logging.info(
                     '%s numbers after [www] since == %s' %
                     (len(numbers), since)
                 )
 
+            # the next loop only needs what changed after these summaries
+            ts = [
+                x[1]['updated_at'] for x in
+                issue_summaries.items()
+                if x[1]['updated_at']
+            ]
+            ts += [
+                x[1]['created_at'] for x in
+                issue_summaries.items()
+                if x[1]['created_at']
+            ]
+            ts = sorted(set(ts))
+            if ts:
+                self.repos[repo]['since'] = ts[-1]
+
         if self.args.start_at and self.repos[repo]['loopcount'] == 0:
-            numbers = [x for x in numbers if x <= self.args.start_at]
+            numbers = set(numbers) & set(range(1, self.args.start_at + 1))
             logging.info('%s numbers after start-at' % len(numbers))
 
-        # Get stale numbers if not targeting
-        if self.args.daemonize and self.repos[repo]['loopcount'] > 0:
-            logging.info('checking for stale numbers')
-            self.repos[repo]['stale'] = self.get_stale_numbers(repo, issue_summaries)
-            numbers.extend(self.repos[repo]['stale'])
-            numbers = sorted(set(numbers))
+        # Get stale numbers and fired timers if not targeting
+        if queue is not None:
+            logging.info('checking for stale numbers and pending timers')
+            self.queue_scheduled_numbers(repo, issue_summaries, queue)
+            self.repos[repo]['stale'] = [x for x in queue.ordered() if queue.priority(x) == PRIORITY_STALE]
+            numbers = queue.ordered()
             logging.info('%s numbers after stale check' % len(numbers))
 
         ################################################################
         # PRE-FILTERING TO PREVENT EXCESSIVE API CALLS
         ################################################################
 
+        numbers = set(numbers)
         if not self.args.ignore_state:
             issues_state = 'closed' if self.args.only_closed else 'open'
-            numbers = [
-                x for x in numbers
-                if issue_summaries.get(str(x), {}).get('state') == issues_state
-            ]
+            numbers &= issue_summaries.select(state=issues_state)
             logging.info('%s numbers after checking state' % len(numbers))
 
         if self.args.only_issues:
-            numbers = [
-                x for x in numbers
-                if issue_summaries[str(x)]['type'] == 'issue'
-            ]
+            numbers &= issue_summaries.select(type='issue')
             logging.info('%s numbers after checking type' % len(numbers))
         elif self.args.only_prs:
-            numbers = [
-                x for x in numbers
-                if issue_summaries[str(x)]['type'] == 'pullrequest'
-            ]
+            numbers &= issue_summaries.select(type='pullrequest')
             logging.info('%s numbers after checking type' % len(numbers))
 
-        numbers = sorted({int(x) for x in numbers})
+        numbers = sorted(numbers)
         if self.args.sort == 'desc':
             numbers = [x for x in reversed(numbers)]
 
         if self.args.last and len(numbers) > self.args.last:
             numbers = numbers[0 - self.args.last:]
 
+        if queue is not None:
+            numbers = queue.ordered(
+                numbers,
+                reverse=self.args.sort == 'desc',
+                stale_limit=self.args.stale_limit
+            )
+            logging.info('%s numbers queued %s' % (len(numbers), queue.counts(numbers)))
+
         self.repos[repo]['numbers'] = numbers
         self.repos[repo]['issuecache'] = issuecache
         self.repos[repo]['summaries'] = issue_summaries
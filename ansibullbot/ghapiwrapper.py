@@ -1,18 +1,35 @@
+import hashlib
+import json
 import logging
 import os
-import pickle
-import shutil
+import re
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from urllib.parse import parse_qs, urlencode, urlparse, urlunparse
 
-import requests
 from github import Github
+from github.Issue import Issue
+from github.Label import Label
+from github.NamedUser import NamedUser
+from github.Requester import Requester
+from requests.structures import CaseInsensitiveDict
+from requests.utils import parse_header_links
 
 import ansibullbot.constants as C
 
-from ansibullbot.utils.github import RateLimited
+from ansibullbot.utils.github import ADB, RateLimited, TokenPool, get_limiter
+from ansibullbot.utils.instrumentation import STATS
+from ansibullbot.utils.issue_store import get_issue_store, raw_record
+from ansibullbot.utils.net_tools import get_session
 from ansibullbot.exceptions import RateLimitError
 
 
+# what the repo properties load_update_fetch caches are rebuilt as
+REPO_PROPERTY_CLASSES = {
+    'assignees': NamedUser,
+    'labels': Label,
+}
+
 HEADERS = [
     'application/json',
     'application/vnd.github.mockingbird-preview',
@@ -23,12 +40,136 @@ HEADERS = [
 ]
 
 
+# the endpoints the bot reads again on every triage of an issue, only
+# those are worth keeping on disk for revalidation
+REVALIDATED_PATHS = re.compile(
+    r'/repos/[^/]+/[^/]+('
+    r'|/labels|/assignees'
+    r'|/issues/\d+(/timeline|/labels|/comments|/events)?'
+    r'|/pulls/\d+(/files|/commits|/reviews)?'
+    r'|/commits/[0-9a-f]{40}/check-runs'
+    r')$'
+)
+
+
+class RequestCache:
+    """Keep GET payloads on disk so they can be revalidated with an ETag
+
+    The validators live in the GithubApiRequest table and the payloads
+    in the datafile it points to. A 304 is served from the datafile and
+    does not count against the rate limit. Only the urls matching
+    REVALIDATED_PATHS are kept, others are rarely read twice.
+    """
+
+    def __init__(self, cachedir, token=None):
+        self.cachedir = cachedir
+        self.token = token
+
+    @staticmethod
+    def caches(url):
+        return REVALIDATED_PATHS.search(urlparse(url).path) is not None
+
+    def conditional_headers(self, url):
+        """Return the validator headers and stored meta for a url"""
+        if not self.caches(url):
+            return {}, None
+
+        meta = ADB.get_github_api_request_meta(url, token=self.token)
+        if not meta or not meta['datafile'] or not os.path.isfile(meta['datafile']):
+            return {}, None
+
+        headers = {}
+        if meta['etag']:
+            headers['If-None-Match'] = meta['etag']
+        if meta['last_modified']:
+            headers['If-Modified-Since'] = meta['last_modified']
+        return headers, meta
+
+    def load(self, meta):
+        with open(meta['datafile']) as f:
+            return f.read()
+
+    def save(self, url, headers, text):
+        if not self.caches(url):
+            return
+
+        headers = CaseInsensitiveDict(headers)
+        if not headers.get('ETag') and not headers.get('Last-Modified'):
+            return
+
+        if not os.path.isdir(self.cachedir):
+            os.makedirs(self.cachedir)
+        datafile = os.path.join(self.cachedir, hashlib.sha256(url.encode('utf-8')).hexdigest() + '.json')
+        with open(datafile, 'w') as f:
+            f.write(text)
+
+        ADB.set_github_api_request_meta(url, headers, datafile, token=self.token)
+
+
+class ConditionalRequester(Requester):
+    """A PyGithub requester that revalidates its GETs against a RequestCache
+    and sends each request with a token from the pool"""
+
+    request_cache = None
+    token_pool = None
+
+    @classmethod
+    def install(cls, requester, request_cache, token_pool=None):
+        # swap the class rather than wrapping the method so issues
+        # holding this requester can still be pickled
+        requester.__class__ = cls
+        requester.request_cache = request_cache
+        requester.token_pool = token_pool
+
+    def _Requester__authenticate(self, url, requestHeaders, parameters):
+        # keep the token picked from the pool
+        if 'Authorization' not in requestHeaders:
+            Requester._Requester__authenticate(self, url, requestHeaders, parameters)
+
+    def requestJson(self, verb, url, parameters=None, headers=None, input=None, cnx=None):
+        STATS.count('github')
+        headers = dict(headers or {})
+
+        token = None
+        if self.token_pool is not None:
+            token = self.token_pool.acquire('core')
+            headers['Authorization'] = 'token %s' % token
+
+        # PyGithub sends its own validators on update()
+        key = None
+        meta = None
+        if self.request_cache is not None and verb == 'GET' and input is None and \
+                'If-None-Match' not in headers and 'If-Modified-Since' not in headers and \
+                self.request_cache.caches(url):
+            key = url
+            if parameters:
+                key += '?' + urlencode(sorted(parameters.items()))
+            validators, meta = self.request_cache.conditional_headers(key)
+            headers.update(validators)
+
+        status, response_headers, output = super().requestJson(verb, url, parameters, headers, input, cnx)
+        if self.token_pool is not None:
+            self.token_pool.update(token, response_headers)
+
+        if key is None:
+            return status, response_headers, output
+        if status == 304 and meta:
+            logging.debug('304 for %s, using the cached payload' % key)
+            return 200, {k.lower(): v for k, v in meta['headers'].items()}, self.request_cache.load(meta)
+        if status == 200:
+            self.request_cache.save(key, response_headers, output)
+        return status, response_headers, output
+
+
 class GithubWrapper:
-    def __init__(self, url=None, user=None, passw=None, token=None, cachedir='~/.ansibullbot/cache'):
+    def __init__(self, url=None, user=None, passw=None, token=None, cachedir='~/.ansibullbot/cache', tokens=None):
         self.gh = self._connect(url, user, passw, token)
         self.token = token
+        self.token_pool = TokenPool([token] + list(tokens or [])) if token else None
         self.cachedir = os.path.expanduser(cachedir)
         self.cached_requests_dir = os.path.join(self.cachedir, 'cached_requests')
+        self.request_cache = RequestCache(self.cached_requests_dir, token=token)
+        ConditionalRequester.install(self.gh._Github__requester, self.request_cache, token_pool=self.token_pool)
 
     @RateLimited
     def _connect(self, url, user, passw, token):
@@ -45,35 +186,100 @@ class GithubWrapper:
     @RateLimited
     def get_request(self, url):
         '''Get an arbitrary API endpoint'''
+        data, links = self._get_page(url)
+
+        # the first page tells us how many there are, fetch the rest at once
+        page_urls = self._page_urls(links)
+        if page_urls:
+            with ThreadPoolExecutor(max_workers=C.DEFAULT_PAGINATION_WORKERS) as executor:
+                for _data, _links in executor.map(STATS.bind(self._get_page), page_urls):
+                    data = self._merge_pages(data, _data)
+            return data
 
-        headers = {
-            'Accept': ','.join(HEADERS),
-            'Authorization': 'Bearer %s' % self.token,
-        }
+        while links and links.get('next'):
+            _data, links = self._get_page(links['next']['url'])
+            data = self._merge_pages(data, _data)
 
-        rr = requests.get(url, headers=headers)
-        data = rr.json()
+        return data
+
+    def _get_page(self, url):
+        '''Get a single page and its pagination links'''
+        # runs on the pagination threads too, every page waits its turn
+        if self.token_pool is not None:
+            token = self.token_pool.acquire('core')
+        else:
+            token = self.token
+            get_limiter(token).wait('core')
+        headers = {'Accept': ','.join(HEADERS)}
+        if token:
+            headers['Authorization'] = 'Bearer %s' % token
+
+        validators, meta = self.request_cache.conditional_headers(url)
+        headers.update(validators)
+
+        rr = get_session().get(url, headers=headers)
+        if self.token_pool is not None:
+            self.token_pool.update(token, rr.headers)
+        else:
+            get_limiter(token).update(rr.headers)
+        if rr.status_code == 304 and meta:
+            logging.debug('304 for %s, using the cached payload' % url)
+            data = json.loads(self.request_cache.load(meta))
+            links = {}
+            link_header = CaseInsensitiveDict(meta['headers']).get('Link')
+            if link_header:
+                for link in parse_header_links(link_header):
+                    links[link.get('rel') or link['url']] = link
+        else:
+            data = rr.json()
+            links = rr.links
+            if rr.status_code == 200:
+                self.request_cache.save(url, rr.headers, rr.text)
 
         # handle ratelimits ...
         if isinstance(data, dict) and data.get('message'):
             if data['message'].lower().startswith('api rate limit exceeded'):
                 raise RateLimitError()
 
-        # pagination
-        if hasattr(rr, 'links') and rr.links and rr.links.get('next'):
-            _data = self.get_request(rr.links['next']['url'])
-            if isinstance(data, list):
-                data += _data
-            elif isinstance(data, dict):
-                data.update(_data)
+        return data, links
+
+    @staticmethod
+    def _page_urls(links):
+        '''Build the urls for the remaining pages from the next and last links'''
+        if not links or not links.get('next') or not links.get('last'):
+            return []
 
+        next_url = urlparse(links['next']['url'])
+        next_query = parse_qs(next_url.query)
+        last_query = parse_qs(urlparse(links['last']['url']).query)
+        try:
+            first = int(next_query['page'][0])
+            last = int(last_query['page'][0])
+        except (KeyError, ValueError):
+            # cursor based pagination, has to be walked
+            return []
+
+        urls = []
+        for page in range(first, last + 1):
+            next_query['page'] = [str(page)]
+            urls.append(urlunparse(next_url._replace(query=urlencode(next_query, doseq=True))))
+        return urls
+
+    @staticmethod
+    def _merge_pages(data, _data):
+        if isinstance(data, list):
+            data += _data
+        elif isinstance(data, dict):
+            data.update(_data)
         return data
 
 
 class RepoWrapper:
     def __init__(self, gh, repo_path, cachedir='~/.ansibullbot/cache'):
         self.gh = gh
+        self.repo_path = repo_path
         self.cachedir = os.path.join(os.path.expanduser(cachedir), repo_path)
+        self.store = get_issue_store(self.cachedir)
 
         self._assignees = False
         self._labels = False
@@ -91,20 +297,13 @@ class RepoWrapper:
 
     @RateLimited
     def get_issue(self, number):
-        while True:
-            try:
-                issue = self.load_issue(number)
-                if issue and C.DEFAULT_GITHUB_TOKEN in issue._requester._Requester__authorizationHeader:
-                    if issue.update():
-                        self.save_issue(issue)
-                else:
-                    issue = self.repo.get_issue(number)
-                    self.save_issue(issue)
-                break
-            except UnicodeDecodeError:
-                # https://github.com/ansible/ansibullbot/issues/610
-                logging.warning('cleaning cache for %s' % number)
-                shutil.rmtree(os.path.join(self.cachedir, 'issues', str(number)))
+        issue = self.load_issue(number)
+        if issue:
+            if issue.update():
+                self.save_issue(issue)
+        else:
+            issue = self.repo.get_issue(number)
+            self.save_issue(issue)
 
         return issue
 
@@ -142,43 +341,22 @@ class RepoWrapper:
         if not C.DEFAULT_PICKLE_ISSUES:
             return False
 
-        pfile = os.path.join(
-            self.cachedir,
-            'issues',
-            str(number),
-            'issue.pickle'
-        )
-        if os.path.isfile(pfile):
-            with open(pfile, 'rb') as f:
-                try:
-                    issue = pickle.load(f)
-                except TypeError:
-                    return False
-            return issue
-        else:
+        record = self.store.get(self.repo_path, number, 'issue')
+        if record is None:
             return False
+        # bound to the current requester, whatever token cached it
+        return self.gh.create_from_raw_data(Issue, record['raw_data'], record['headers'])
 
     def save_issue(self, issue):
         if not C.DEFAULT_PICKLE_ISSUES:
             return
 
-        cfile = os.path.join(
-            self.cachedir,
-            'issues',
-            str(issue.number),
-            'issue.pickle'
-        )
-        cdir = os.path.dirname(cfile)
-        if not os.path.isdir(cdir):
-            os.makedirs(cdir)
-        logging.debug('dump %s' % cfile)
-        with open(cfile, 'wb') as f:
-            pickle.dump(issue, f)
+        logging.debug('dump issue %s' % issue.number)
+        self.store.put(self.repo_path, issue.number, 'issue', raw_record(issue))
 
     @RateLimited
     def load_update_fetch(self, property_name):
         '''Fetch a get() property for an object'''
-        edata = None
         events = []
         updated = None
         update = False
@@ -186,27 +364,13 @@ class RepoWrapper:
 
         self.repo.update()
 
-        pfile = os.path.join(self.cachedir, '%s.pickle' % property_name)
-        pdir = os.path.dirname(pfile)
-
-        if not os.path.isdir(pdir):
-            os.makedirs(pdir)
-
-        if os.path.isfile(pfile):
-            try:
-                with open(pfile, 'rb') as f:
-                    edata = pickle.load(f)
-            except Exception:
+        # check the timestamp on the cache
+        edata = self.store.get(self.repo_path, 0, property_name)
+        if edata:
+            updated = datetime.fromisoformat(edata['updated_at'])
+            events = [self.gh.create_from_raw_data(REPO_PROPERTY_CLASSES[property_name], x) for x in edata[property_name]]
+            if updated < self.repo.updated_at:
                 update = True
-                write_cache = True
-
-            # check the timestamp on the cache
-            if edata:
-                updated = edata[0]
-                events = edata[1]
-                if updated < self.repo.updated_at:
-                    update = True
-                    write_cache = True
 
         # pull all events if timestamp is behind or no events cached
         if update or not events:
@@ -215,12 +379,9 @@ class RepoWrapper:
             methodToCall = getattr(self.repo, 'get_' + property_name)
             events = [x for x in methodToCall()]
 
-        if C.DEFAULT_PICKLE_ISSUES:
-            if write_cache or not os.path.isfile(pfile):
-                # need to dump the pickle back to disk
-                edata = [updated, events]
-                with open(pfile, 'wb') as f:
-                    pickle.dump(edata, f)
+        if C.DEFAULT_PICKLE_ISSUES and write_cache:
+            edata = {'updated_at': updated.isoformat(), property_name: [x.raw_data for x in events]}
+            self.store.put(self.repo_path, 0, property_name, edata, updated_at=updated)
 
         return events
 
@@ -1,7 +1,5 @@
 import datetime
 import logging
-import os
-import pickle
 from collections.abc import Sequence
 from operator import itemgetter
 
@@ -9,6 +7,10 @@ import ansibullbot.constants as C
 from ansibullbot.utils.timetools import strip_time_safely
 
 
+# separates the messages the bot posts together as a single comment
+COMMENT_BREAK = '<!--- comment break --->'
+
+
 class HistoryWrapper:
     """A tool to ask questions about an issue's history.
 
@@ -19,15 +21,16 @@ class HistoryWrapper:
 
     SCHEMA_VERSION = 1.2
 
-    def __init__(self, events, labels, last_updated, usecache=True, cachedir=None):
+    def __init__(self, events, labels, last_updated, usecache=True, cachedir=None, records=None):
         self.labels = labels
         self.last_updated = last_updated
         self.cachedir = cachedir
+        # the issue's records in the cache store, see IssueWrapper.records
+        self.records = records
 
         self._waffled_labels = None
-        self.cachefile = os.path.join(cachedir, 'history.pickle')
 
-        if usecache:
+        if usecache and records is not None:
             cache = self._load_cache()
 
             if not self.validate_cache(cache):
@@ -78,41 +81,19 @@ class HistoryWrapper:
         return True
 
     def _load_cache(self):
-        if not os.path.isdir(self.cachedir):
-            os.makedirs(self.cachedir)
-        if not os.path.isfile(self.cachefile):
-            logging.info('!%s' % self.cachefile)
-            return
-        try:
-            with open(self.cachefile, 'rb') as f:
-                cachedata = pickle.load(f)
-        except Exception as e:
-            logging.debug(e)
-            logging.info('%s failed to load' % self.cachefile)
-            return
-
-        return cachedata
+        return self.records.get('history')
 
     def _dump_cache(self):
         if any(x for x in self.history if not isinstance(x['created_at'], datetime.datetime)):
             logging.error(self.history)
             raise AssertionError('found a non-datetime created_at in events data')
 
-        if not os.path.isdir(self.cachedir):
-            os.makedirs(self.cachedir)
-
         cachedata = {
             'version': self.SCHEMA_VERSION,
             'updated_at': self.last_updated,
             'history': self.history
         }
-
-        try:
-            with open(self.cachefile, 'wb') as f:
-                pickle.dump(cachedata, f)
-        except Exception as e:
-            logging.error(e)
-            raise
+        self.records.put('history', cachedata, updated_at=self.last_updated)
 
     def merge_commits(self, commits):
         for xc in commits:
@@ -369,8 +350,10 @@ class HistoryWrapper:
         for comment in comments:
             if not comment.get('body'):
                 continue
-            if 'boilerplate:' in comment['body']:
-                lines = [x for x in comment['body'].split('\n')
+            for body in comment['body'].split(COMMENT_BREAK):
+                if 'boilerplate:' not in body:
+                    continue
+                lines = [x for x in body.split('\n')
                          if x.strip() and 'boilerplate:' in x]
                 bp = lines[0].split()[2]
 
@@ -380,7 +363,7 @@ class HistoryWrapper:
                         bpc.append(comment['created_at'])
                     bpc.append(bp)
                     if content:
-                        bpc.append(comment['body'])
+                        bpc.append(body)
                     boilerplates.append(bpc)
                 else:
                     boilerplates.append(bp)
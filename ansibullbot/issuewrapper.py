@@ -15,22 +15,34 @@
 
 
 import datetime
-import json
 import logging
 import os
-import pickle
 import re
 import time
 
-import requests
+from github.File import File
 
 import ansibullbot.constants as C
 from ansibullbot.utils.github import RateLimited
+from ansibullbot.utils.issue_store import get_issue_store
+from ansibullbot.utils.net_tools import get_session
 from ansibullbot.utils.extractors import get_template_data
 from ansibullbot.utils.timetools import strip_time_safely
 from ansibullbot.historywrapper import HistoryWrapper
 
 
+# page size of the incremental timeline fetches
+TIMELINE_PAGE_SIZE = 100
+
+
+def _event_key(event):
+    '''What tells timeline events apart, not all of them have an id'''
+    for key in ('id', 'node_id', 'sha'):
+        if event.get(key):
+            return event[key]
+    return (event.get('event'), event.get('created_at'))
+
+
 class UnsetValue:
     def __str__(self):
         return "AnsibullbotUnsetValue()"
@@ -62,6 +74,26 @@ class IssueWrapper:
         self._renamed_files = UnsetValue
         self._pullrequest_check_runs = UnsetValue
         self._updated_at = UnsetValue
+        self._records = UnsetValue
+
+    @property
+    def records(self):
+        '''The issue's records in the repo's cache store'''
+        if self._records is UnsetValue:
+            self._records = get_issue_store(self.cachedir).records(self.repo_full_name, self.number)
+        return self._records
+
+    def hydrate(self, data):
+        '''Seed the wrapper with batched graphql data instead of REST calls'''
+        self._labels = data['labels']
+        self._assignees = data['assignees']
+        if data['events'] is not None:
+            self._events = self._parse_events(data['events'])
+        if self.is_pullrequest():
+            if data['reviews'] is not None:
+                self._pr_reviews = data['reviews']
+            if data['check_runs'] is not None:
+                self._pullrequest_check_runs = data['check_runs']
 
     @property
     def url(self):
@@ -112,7 +144,11 @@ class IssueWrapper:
             if dd['event'] == 'committed' and 'message' not in dd:
                 dd['message'] = ''
 
-            if not dd.get('id'):
+            if dd['event'] != 'commented' and dd.get('node_id'):
+                # graphql only knows the node ids of the events, use them
+                # whichever api the event came from
+                dd['id'] = dd['node_id']
+            elif not dd.get('id'):
                 # set id as graphql node_id OR make one up
                 if 'node_id' in dd:
                     dd['id'] = dd['node_id']
@@ -148,84 +184,83 @@ class IssueWrapper:
     def _get_timeline(self):
         '''Use python-requests instead of pygithub'''
         data = None
+        url = self.url + '/timeline'
 
-        cache_data = os.path.join(self.full_cachedir, 'timeline_data.json')
-        cache_meta = os.path.join(self.full_cachedir, 'timeline_meta.json')
-        logging.debug(cache_data)
+        record = self.records.get('timeline')
+        if record:
+            data = record['data']
 
-        if not os.path.exists(self.full_cachedir):
-            os.makedirs(self.full_cachedir)
+            # validate the data is not infected by ratelimit errors
+            if not isinstance(data, list) or any(x for x in data if not isinstance(x, dict)):
+                data = None
+            elif record.get('updated_at', '') < self.updated_at.isoformat():
+                data = self._get_timeline_delta(url, data, record['updated_at'])
+            else:
+                return data
 
-        meta = {}
-        fetch = False
-        if not os.path.exists(cache_data):
-            fetch = True
-        else:
-            with open(cache_meta) as f:
-                meta = json.loads(f.read())
+        if data is None:
+            data = self.github.get_request(url)
 
-        if not fetch and (not meta or meta.get('updated_at', 0) < self.updated_at.isoformat()):
-            fetch = True
+        self.records.put(
+            'timeline',
+            {'updated_at': self.updated_at.isoformat(), 'url': url, 'data': data},
+            updated_at=self.updated_at
+        )
 
-        # validate the data is not infected by ratelimit errors
-        if not fetch:
-            with open(cache_data) as f:
-                data = json.loads(f.read())
+        return data
 
-            if isinstance(data, list):
-                bad_events = [x for x in data if not isinstance(x, dict)]
-                if bad_events:
-                    fetch = True
-            else:
-                fetch = True
+    def _get_timeline_delta(self, url, cached, since):
+        '''Append the events added since the cached timeline was fetched
 
-        if data is None:
-            fetch = True
+        The events are in order, so only the pages from the last cached
+        event on are fetched. None is returned when an event was deleted,
+        which shifts the pages, and the whole timeline has to be refetched.
+        '''
+        if not cached:
+            return None
 
-        if fetch:
-            url = self.url + '/timeline'
-            data = self.github.get_request(url)
+        # the page holding the last cached event, so the pages overlap
+        # by at least one event that must still be in its place
+        page = (len(cached) - 1) // TIMELINE_PAGE_SIZE + 1
+        offset = (page - 1) * TIMELINE_PAGE_SIZE
+        fetched = self.github.get_request('%s?per_page=%s&page=%s' % (url, TIMELINE_PAGE_SIZE, page))
+        if not isinstance(fetched, list):
+            return None
 
-            with open(cache_meta, 'w') as f:
-                f.write(json.dumps({
-                    'updated_at': self.updated_at.isoformat(),
-                    'url': url
-                }))
-            with open(cache_data, 'w') as f:
-                f.write(json.dumps(data))
+        overlap = cached[offset:]
+        if [_event_key(x) for x in fetched[:len(overlap)]] != [_event_key(x) for x in overlap]:
+            logging.info('timeline of %s changed, refetching it' % self.html_url)
+            return None
+        data = cached[:offset] + fetched
+
+        # edits do not move anything, patch in the comments edited since
+        edited = self.github.get_request('%s/comments?since=%sZ' % (self.url, since[:19]))
+        if not isinstance(edited, list):
+            return None
+        edited = {x['id']: x for x in edited if isinstance(x, dict) and 'id' in x}
+        for event in data:
+            if event.get('event') == 'commented' and event.get('id') in edited:
+                event.update(edited[event['id']])
 
+        logging.debug(
+            'fetched %s new timeline events for %s' % (len(data) - len(cached), self.html_url)
+        )
         return data
 
     @RateLimited
     def load_update_fetch_files(self):
-        edata = None
         events = []
         updated = None
         update = False
         write_cache = False
 
-        pfile = os.path.join(self.full_cachedir, 'files.pickle')
-        pdir = os.path.dirname(pfile)
-        logging.debug(pfile)
-
-        if not os.path.isdir(pdir):
-            os.makedirs(pdir)
-
-        if os.path.isfile(pfile):
-            try:
-                with open(pfile, 'rb') as f:
-                    edata = pickle.load(f)
-            except Exception:
-                update = True
-                write_cache = True
-
         # check the timestamp on the cache
+        edata = self.records.get('files')
         if edata:
-            updated = edata[0]
-            events = edata[1]
+            updated = datetime.datetime.fromisoformat(edata['updated_at'])
+            events = [self.github.gh.create_from_raw_data(File, x) for x in edata['files']]
             if updated < self.updated_at:
                 update = True
-                write_cache = True
 
         # pull all events if timestamp is behind or no events cached
         if update or not events:
@@ -233,12 +268,9 @@ class IssueWrapper:
             updated = datetime.datetime.utcnow()
             events = [x for x in self.pullrequest.get_files()]
 
-        if C.DEFAULT_PICKLE_ISSUES:
-            if write_cache or not os.path.isfile(pfile):
-                # need to dump the pickle back to disk
-                edata = [updated, events]
-                with open(pfile, 'wb') as f:
-                    pickle.dump(edata, f)
+        if C.DEFAULT_PICKLE_ISSUES and write_cache:
+            edata = {'updated_at': updated.isoformat(), 'files': [x.raw_data for x in events]}
+            self.records.put('files', edata, updated_at=updated)
 
         return events
 
@@ -250,6 +282,11 @@ class IssueWrapper:
             labels.append(label.name)
         return labels
 
+    @RateLimited
+    def get_current_labels(self):
+        """Fetch the labels on this Issue right now, not when it was loaded"""
+        return [x.name for x in self.instance.get_labels()]
+
     @property
     def template_data(self):
         if self._template_data is UnsetValue:
@@ -266,6 +303,24 @@ class IssueWrapper:
         """Removes a label from the Issue using the GitHub API"""
         self.instance.remove_from_labels(label)
 
+    @RateLimited
+    def add_labels(self, labels):
+        """Adds several labels to the Issue with a single API call"""
+        self.instance.add_to_labels(*labels)
+
+    @RateLimited
+    def set_labels(self, labels):
+        """Replaces the labels on the Issue with a single API call"""
+        self.instance.set_labels(*labels)
+
+    @RateLimited
+    def close(self, labels=None):
+        """Closes the Issue, setting its labels in the same API call"""
+        if labels is None:
+            self.instance.edit(state='closed')
+        else:
+            self.instance.edit(state='closed', labels=labels)
+
     @RateLimited
     def add_comment(self, comment=None):
         """Adds a comment to the Issue using the GitHub API"""
@@ -287,7 +342,7 @@ class IssueWrapper:
             str(commentid)
         )
 
-        resp = requests.delete(
+        resp = get_session().delete(
             comment_url,
             headers={
                 'Accept': 'application/json',
@@ -417,7 +472,7 @@ class IssueWrapper:
     def pullrequest_check_runs(self):
         if self._pullrequest_check_runs is UnsetValue:
             logging.info('fetching pull request check runs')
-            self._pullrequest_check_runs = self.commits[-1].get_check_runs()
+            self._pullrequest_check_runs = list(self.commits[-1].get_check_runs())
         return self._pullrequest_check_runs
 
     @property
@@ -489,7 +544,7 @@ class IssueWrapper:
     @property
     def history(self):
         if self._history is UnsetValue:
-            self._history = HistoryWrapper(self.events, self.labels, self.updated_at, cachedir=self.full_cachedir)
+            self._history = HistoryWrapper(self.events, self.labels, self.updated_at, cachedir=self.full_cachedir, records=self.records)
 
             if self.is_pullrequest():
                 self._history.merge_reviews(self.reviews)
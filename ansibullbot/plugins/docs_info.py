@@ -3,7 +3,7 @@ import dataclasses
 import logging
 import re
 
-import requests
+from ansibullbot.utils.net_tools import get_session
 
 DOCS_PATH_PATTERNS = [
     "docs/",
@@ -78,7 +78,7 @@ class CommitFile:
     @property
     def file_content(self):
         if self.raw_url:
-            result = requests.get(self.raw_url)
+            result = get_session().get(self.raw_url)
             if result.ok:
                 return result.text
 
@@ -0,0 +1,65 @@
+import logging
+import threading
+
+from ansibullbot.utils.github import ADB
+
+
+# give up on a number's actions after this many failed attempts
+MAX_ATTEMPTS = 5
+
+# seconds before the first retry, doubled for every retry after it
+RETRY_DELAY = 60
+
+
+class ActionExecutor(threading.Thread):
+    '''Drain the queued actions in the background
+
+    `execute` is called with each claimed entry, an exception puts the
+    entry back in the queue to be retried with an exponential backoff.
+    '''
+
+    def __init__(self, execute, interval=1.0, batch=10, max_attempts=MAX_ATTEMPTS, retry_delay=RETRY_DELAY):
+        super().__init__(name='action-executor', daemon=True)
+        self.execute = execute
+        self.interval = interval
+        self.batch = batch
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._stopping = threading.Event()
+
+    def run(self):
+        # whatever a previous process claimed never finished
+        ADB.release_claimed_actions()
+
+        while True:
+            entries = ADB.claim_actions(limit=self.batch)
+            if not entries:
+                if self._stopping.is_set():
+                    break
+                self._stopping.wait(self.interval)
+                continue
+
+            for entry in entries:
+                self.execute_entry(entry)
+
+    def execute_entry(self, entry):
+        name = '%s#%s' % (entry['repo'], entry['number'])
+        try:
+            self.execute(entry)
+        except Exception as e:
+            attempts = entry['attempts'] + 1
+            if attempts >= self.max_attempts:
+                logging.error('dropping the actions for %s after %s attempts: %s' % (name, attempts, e))
+                ADB.finish_actions(entry['id'])
+            else:
+                delay = self.retry_delay * 2 ** (attempts - 1)
+                logging.warning('actions for %s failed, retrying in %ss: %s' % (name, delay, e))
+                ADB.retry_actions(entry['id'], delay)
+        else:
+            logging.info('executed the queued actions for %s' % name)
+            ADB.finish_actions(entry['id'])
+
+    def stop(self, timeout=None):
+        '''Finish the due actions, the ones waiting to be retried stay queued'''
+        self._stopping.set()
+        self.join(timeout)
@@ -0,0 +1,138 @@
+import datetime
+import glob
+import logging
+import os
+import time
+
+from ansibullbot.utils.issue_store import STORE_FILENAME, get_issue_store
+from ansibullbot.utils.summary_store import SummaryIndex, SummaryStore
+from ansibullbot.utils.timetools import strip_time_safely
+
+
+GB = 1024 ** 3
+
+# closed issues untouched for this long lose their cached records
+CLOSED_ISSUE_DAYS = 30
+
+
+class CacheNamespace:
+    '''A part of the cache with its own size and age budget
+
+    `paths` are globs of the files in it, relative to the cachedir unless
+    absolute. Files not used in `max_days` are deleted, then the least
+    recently used ones until the rest fits in `max_bytes`.
+    '''
+
+    def __init__(self, name, paths, max_bytes=None, max_days=None):
+        self.name = name
+        self.paths = paths
+        self.max_bytes = max_bytes
+        self.max_days = max_days
+
+    def files(self, cachedir):
+        found = set()
+        for pattern in self.paths:
+            found.update(glob.glob(os.path.join(cachedir, pattern), recursive=True))
+        return sorted(x for x in found if os.path.isfile(x))
+
+
+NAMESPACES = (
+    CacheNamespace('azp', ['azp.runs/*.pickle'], max_bytes=2 * GB, max_days=14),
+    CacheNamespace('cached_requests', ['cached_requests/*.json'], max_bytes=2 * GB, max_days=30),
+    CacheNamespace('module_extractor', ['module_extractor_cache/*.json'], max_days=30),
+    CacheNamespace('galaxy', ['galaxy/urls/*'], max_days=7),
+    # left behind by caches from before the issue stores
+    CacheNamespace('issue_files', ['*/*/issues/*/*'], max_days=30),
+    CacheNamespace('actions', ['/tmp/actions/**/*.json'], max_days=7),
+)
+
+
+def last_used(st):
+    '''Most mounts only update the atime once a day, that is enough here'''
+    return max(st.st_atime, st.st_mtime)
+
+
+def collect_namespace(cachedir, namespace, now=None):
+    '''Apply the namespace's budgets, return the bytes reclaimed'''
+    if now is None:
+        now = time.time()
+
+    files = []
+    for path in namespace.files(cachedir):
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        files.append((last_used(st), st.st_size, path))
+    # least recently used first
+    files.sort()
+
+    evict = []
+    if namespace.max_days is not None:
+        cutoff = now - namespace.max_days * 86400
+        evict = [x for x in files if x[0] < cutoff]
+        files = files[len(evict):]
+
+    if namespace.max_bytes is not None:
+        total = sum(x[1] for x in files)
+        while files and total > namespace.max_bytes:
+            total -= files[0][1]
+            evict.append(files.pop(0))
+
+    reclaimed = 0
+    for _, size, path in evict:
+        try:
+            os.remove(path)
+        except OSError as e:
+            logging.warning('could not remove %s: %s' % (path, e))
+            continue
+        reclaimed += size
+        _remove_empty_dirs(os.path.dirname(path), cachedir)
+
+    return reclaimed
+
+
+def _remove_empty_dirs(dirname, cachedir):
+    while dirname.startswith(cachedir.rstrip('/') + '/') and not os.listdir(dirname):
+        os.rmdir(dirname)
+        dirname = os.path.dirname(dirname)
+
+
+def collect_closed_issues(cachedir, closed_days=CLOSED_ISSUE_DAYS, now=None):
+    '''Evict the records of issues closed for a while, return the bytes reclaimed'''
+    if now is None:
+        now = datetime.datetime.now(datetime.timezone.utc)
+    cutoff = now - datetime.timedelta(days=closed_days)
+
+    reclaimed = 0
+    for dbfile in glob.glob(os.path.join(cachedir, '*', '*', STORE_FILENAME)):
+        repo_cachedir = os.path.dirname(dbfile)
+        repo = os.path.relpath(repo_cachedir, cachedir)
+        summaries = SummaryStore(cachedir, repo).summaries
+
+        numbers = []
+        for summary in summaries.values():
+            if summary.get('state') not in SummaryIndex.CLOSED_STATES or not summary.get('updated_at'):
+                continue
+            if strip_time_safely(summary['updated_at']).replace(tzinfo=datetime.timezone.utc) < cutoff:
+                numbers.append(summary['number'])
+
+        if numbers:
+            reclaimed += get_issue_store(repo_cachedir).evict(repo, numbers)
+
+    return reclaimed
+
+
+def collect_garbage(cachedir, namespaces=NAMESPACES, closed_days=CLOSED_ISSUE_DAYS):
+    '''Keep the cache within its budgets, return the bytes reclaimed per namespace'''
+    cachedir = os.path.abspath(os.path.expanduser(cachedir))
+    reclaimed = {}
+    for namespace in namespaces:
+        reclaimed[namespace.name] = collect_namespace(cachedir, namespace)
+    reclaimed['closed_issues'] = collect_closed_issues(cachedir, closed_days=closed_days)
+
+    for name, size in reclaimed.items():
+        if size:
+            logging.info('cache gc: reclaimed %s bytes from %s' % (size, name))
+    logging.info('cache gc: reclaimed %s bytes in total' % sum(reclaimed.values()))
+    return reclaimed
@@ -0,0 +1,144 @@
+import hashlib
+import json
+import logging
+import threading
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from ansibullbot.utils.instrumentation import STATS
+
+
+class FactPlugin:
+    '''A fact gathering step
+
+    `func` is called with a meta dict holding the facts of the plugins it
+    depends on and returns the facts it gathered. `requires` are the meta
+    keys it reads, `provides` the keys other plugins may read from it and
+    `inputs` the names of the outside data (issue body, PR head, CI run ...)
+    its result depends on.
+    '''
+
+    def __init__(self, name, func, requires=(), provides=(), inputs=()):
+        self.name = name
+        self.func = func
+        self.requires = tuple(requires)
+        self.provides = tuple(provides)
+        self.inputs = tuple(inputs)
+
+    def __repr__(self):
+        return '<FactPlugin %s>' % self.name
+
+
+class FactGraph:
+    '''Run fact plugins in dependency order
+
+    A plugin depends on every plugin registered before it that provides a
+    key it requires, so the facts come out the same as running them one
+    after another in registration order. Independent plugins can run
+    concurrently when they are thread safe, and with a memo dict a plugin
+    whose required facts and inputs did not change returns its previous
+    result.
+    '''
+
+    def __init__(self, plugins):
+        self.plugins = list(plugins)
+
+        names = [x.name for x in self.plugins]
+        if len(names) != len(set(names)):
+            raise ValueError('fact plugin names must be unique: %s' % names)
+
+        self.depends = []
+        for idx, plugin in enumerate(self.plugins):
+            deps = set()
+            for key in plugin.requires:
+                deps.update(x for x in range(idx) if key in self.plugins[x].provides)
+            self.depends.append(deps)
+
+        # everything a plugin sees in its meta, in registration order
+        self.ancestors = []
+        for idx, deps in enumerate(self.depends):
+            ancestors = set(deps)
+            for dep in deps:
+                ancestors.update(self.ancestors[dep])
+            self.ancestors.append(sorted(ancestors))
+
+    def run(self, inputs=None, memo=None, workers=1):
+        '''Return the merged facts of all plugins
+
+        `inputs` maps input names to callables returning something json
+        serializable that changes whenever the input does.
+        '''
+        signatures = _Signatures(inputs or {})
+        results = [None] * len(self.plugins)
+
+        def _run(idx):
+            plugin = self.plugins[idx]
+            meta = {}
+            for ancestor in self.ancestors[idx]:
+                meta.update(results[ancestor])
+
+            key = None
+            if memo is not None:
+                key = self._memo_key(plugin, meta, signatures)
+                if memo.get(plugin.name, (None,))[0] == key:
+                    logging.debug('facts: %s unchanged, reusing the last result' % plugin.name)
+                    return memo[plugin.name][1]
+
+            with STATS.stage('fact.%s' % plugin.name):
+                facts = plugin.func(meta) or {}
+            if key is not None:
+                memo[plugin.name] = (key, facts)
+            return facts
+
+        if workers <= 1:
+            for idx in range(len(self.plugins)):
+                results[idx] = _run(idx)
+        else:
+            self._run_concurrently(_run, results, workers)
+
+        meta = {}
+        for facts in results:
+            meta.update(facts)
+        return meta
+
+    def _run_concurrently(self, func, results, workers):
+        done = set()
+        pending = set(range(len(self.plugins)))
+        running = {}
+        func = STATS.bind(func)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='facts') as executor:
+            while pending or running:
+                for idx in sorted(pending):
+                    if self.depends[idx] <= done:
+                        pending.discard(idx)
+                        running[executor.submit(func, idx)] = idx
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    idx = running.pop(future)
+                    # re-raises a plugin failure, the with block waits for the rest
+                    results[idx] = future.result()
+                    done.add(idx)
+
+    @staticmethod
+    def _memo_key(plugin, meta, signatures):
+        data = {
+            'requires': [meta.get(x) for x in plugin.requires],
+            'inputs': [signatures.get(x) for x in plugin.inputs],
+        }
+        return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+class _Signatures:
+    '''Evaluate each input signature at most once per run'''
+
+    def __init__(self, inputs):
+        self._inputs = inputs
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        with self._lock:
+            if name not in self._values:
+                self._values[name] = self._inputs[name]()
+            return self._values[name]
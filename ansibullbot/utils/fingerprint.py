@@ -0,0 +1,55 @@
+import datetime
+import hashlib
+import json
+
+import ansibullbot.constants as C
+
+from ansibullbot.plugins.needs_revision import CI_STALE_DAYS
+from ansibullbot.utils.timetools import parse_time_utc
+from ansibullbot.utils.work_queue import timer_deadlines
+
+
+# bump when the inputs below change shape so old fingerprints never match
+FINGERPRINT_VERSION = 1
+
+# needs_revision flags change requests older than a week past the last commit
+STALE_REVIEW_DAYS = 7
+
+
+def time_deadlines(meta, summary):
+    '''Return the times at which a time based plugin would decide differently'''
+    deadlines = timer_deadlines(meta)
+
+    if summary.get('ci_updated_at'):
+        deadlines.append(parse_time_utc(summary['ci_updated_at']) + datetime.timedelta(days=CI_STALE_DAYS + 1))
+
+    commits = [x for x in meta.get('history') or [] if x.get('event') == 'committed']
+    if commits:
+        deadlines.append(parse_time_utc(commits[-1]['created_at']) + datetime.timedelta(days=STALE_REVIEW_DAYS + 1))
+
+    return deadlines
+
+
+def time_bucket(meta, summary, now=None):
+    '''How many of the deadlines have passed, it only changes when one fires'''
+    if now is None:
+        now = datetime.datetime.now(datetime.timezone.utc)
+    return sum(1 for x in time_deadlines(meta, summary) if x <= now)
+
+
+def get_fingerprint(summary, meta, botmeta_hash, git_head, now=None):
+    '''Hash everything the facts and actions for an issue are derived from
+
+    `meta` is the meta.json from the previous triage, its history gives
+    the timers that may have fired since.
+    '''
+    inputs = {
+        'version': FINGERPRINT_VERSION,
+        'bot_version': C.ANSIBULLBOT_VERSION,
+        'updated_at': summary.get('updated_at'),
+        'ci_updated_at': summary.get('ci_updated_at'),
+        'botmeta': botmeta_hash,
+        'git_head': git_head,
+        'time_bucket': time_bucket(meta, summary, now=now),
+    }
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode('utf-8')).hexdigest()
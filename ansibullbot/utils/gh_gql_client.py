@@ -2,14 +2,19 @@ import json
 import logging
 import time
 
-from collections import defaultdict
+from collections import defaultdict, namedtuple
 from operator import itemgetter
 from string import Template
 
 import requests
 
+import ansibullbot.constants as C
+
 from ansibullbot._text_compat import to_bytes, to_text
+from ansibullbot.utils.github import TokenPool
+from ansibullbot.utils.net_tools import get_session
 from ansibullbot.utils.receiver_client import post_to_receiver
+from ansibullbot.utils.summary_store import SummaryIndex, SummaryStore
 from ansibullbot.utils.timetools import strip_time_safely
 
 
@@ -82,6 +87,8 @@ QUERY_TEMPLATE_SINGLE_NODE = """
 }
 """
 
+ORDER_BY_UPDATED_AT = 'orderBy: {field: UPDATED_AT, direction: DESC}'
+
 SUBQUERY_CI_UPDATED_AT = """
       commits(last:1) {
         nodes {
@@ -104,6 +111,26 @@ SUBQUERY_CI_UPDATED_AT = """
       }
 """
 
+# only what a new CI run changes, it does not touch the PR's updatedAt
+QUERY_TEMPLATE_CI_UPDATED_AT = """
+{
+    repository(owner:"$owner", name:"$repo") {
+        pullRequests($object_params) {
+            pageInfo {
+                endCursor
+                hasNextPage
+            }
+            edges {
+                node {
+                    number
+                    $subquery
+                }
+            }
+        }
+    }
+}
+"""
+
 QUERY_TEMPLATE_BLAME = """
 query {
   repository(owner: "$owner", name: "$repo") {
@@ -133,14 +160,193 @@ query {
 """
 
 
+QUERY_TEMPLATE_HYDRATE = """
+{
+    repository(owner:"$owner", name:"$repo") {
+        $nodes
+    }
+}
+"""
+
+SUBQUERY_HYDRATE_NODE = """
+        n$number: issueOrPullRequest(number: $number) {
+            __typename
+            ... on Issue {
+                $issue_fields
+            }
+            ... on PullRequest {
+                $issue_fields
+                reviews(first: 100) {
+                    pageInfo {
+                        hasNextPage
+                    }
+                    nodes {
+                        databaseId
+                        author {
+                            login
+                        }
+                        state
+                        body
+                        submittedAt
+                        commit {
+                            oid
+                        }
+                    }
+                }
+                commits(last: 1) {
+                    nodes {
+                        commit {
+                            oid
+                            checkSuites(first: 20) {
+                                pageInfo {
+                                    hasNextPage
+                                }
+                                nodes {
+                                    checkRuns(first: 50) {
+                                        pageInfo {
+                                            hasNextPage
+                                        }
+                                        nodes {
+                                            databaseId
+                                            name
+                                            status
+                                            conclusion
+                                            detailsUrl
+                                        }
+                                    }
+                                }
+                            }
+                        }
+                    }
+                }
+            }
+        }
+"""
+
+SUBQUERY_HYDRATE_ISSUE_FIELDS = """
+                number
+                state
+                labels(first: 100) {
+                    nodes {
+                        name
+                    }
+                }
+                assignees(first: 100) {
+                    nodes {
+                        login
+                    }
+                }
+                timelineItems(first: 100, itemTypes: [ISSUE_COMMENT, LABELED_EVENT, UNLABELED_EVENT, ASSIGNED_EVENT, SUBSCRIBED_EVENT, CROSS_REFERENCED_EVENT, REFERENCED_EVENT]) {
+                    pageInfo {
+                        hasNextPage
+                    }
+                    nodes {
+                        __typename
+                        ... on IssueComment {
+                            id
+                            databaseId
+                            author {
+                                login
+                            }
+                            body
+                            createdAt
+                        }
+                        ... on LabeledEvent {
+                            id
+                            actor {
+                                login
+                            }
+                            createdAt
+                            label {
+                                name
+                            }
+                        }
+                        ... on UnlabeledEvent {
+                            id
+                            actor {
+                                login
+                            }
+                            createdAt
+                            label {
+                                name
+                            }
+                        }
+                        ... on AssignedEvent {
+                            id
+                            actor {
+                                login
+                            }
+                            createdAt
+                            assignee {
+                                ... on User {
+                                    login
+                                }
+                                ... on Bot {
+                                    login
+                                }
+                            }
+                        }
+                        ... on SubscribedEvent {
+                            id
+                            actor {
+                                login
+                            }
+                            createdAt
+                        }
+                        ... on CrossReferencedEvent {
+                            id
+                            actor {
+                                login
+                            }
+                            createdAt
+                            source {
+                                ... on Issue {
+                                    number
+                                    url
+                                }
+                                ... on PullRequest {
+                                    number
+                                    url
+                                }
+                            }
+                        }
+                        ... on ReferencedEvent {
+                            id
+                            actor {
+                                login
+                            }
+                            createdAt
+                            commit {
+                                oid
+                            }
+                        }
+                    }
+                }
+"""
+
+# graphql timeline item types and their REST timeline event names
+TIMELINE_EVENT_NAMES = {
+    'IssueComment': 'commented',
+    'LabeledEvent': 'labeled',
+    'UnlabeledEvent': 'unlabeled',
+    'AssignedEvent': 'assigned',
+    'SubscribedEvent': 'subscribed',
+    'CrossReferencedEvent': 'cross-referenced',
+    'ReferencedEvent': 'referenced',
+}
+
+HydratedCheckRun = namedtuple('HydratedCheckRun', ['id', 'name', 'status', 'conclusion', 'details_url'])
+
+
 class GithubGraphQLClient:
     baseurl = 'https://api.github.com/graphql'
 
-    def __init__(self, token, server=None):
+    def __init__(self, token, server=None, tokens=None):
         if server:
             # this is for testing
             self.baseurl = server.rstrip('/') + '/graphql'
         self.token = token
+        self.token_pool = TokenPool([token] + list(tokens or []))
         self.headers = {
             'Accept': 'application/json',
             'Authorization': 'Bearer %s' % self.token,
@@ -158,7 +364,7 @@ class GithubGraphQLClient:
         return sorted(set((e.get('node', {}).get('login') for e in edges)))
 
     def get_issue_summaries(self, repo_url):
-        """Return a dict of all issue summaries with numbers as keys
+        """Return a SummaryIndex of all issue summaries
 
         Adds a compatibility method for the webscraper
 
@@ -180,7 +386,100 @@ class GithubGraphQLClient:
         }
         post_to_receiver('summaries', repodata, issues)
 
-        return issues
+        return SummaryIndex(issues, repo=repo_url)
+
+    def sync_issue_summaries(self, repo_url, cachedir, full=False):
+        """Return all issue summaries, fetching only what changed since the last sync
+
+        The summaries are kept on disk. Issues and pullrequests are read
+        newest updatedAt first and the paging stops at the stored cursor,
+        in any state so closes and reopens are seen. A full sync runs on
+        the first call, when `full` is set and every
+        summary_resync_interval seconds.
+
+        Args:
+            repo_url  (str): username/repository
+            cachedir  (str): the bot's cache directory
+            full     (bool): ignore the cursor and resync everything
+        """
+        store = SummaryStore(cachedir, repo_url)
+        if full or store.needs_full_sync(C.DEFAULT_SUMMARY_RESYNC_INTERVAL):
+            logging.info('full summary sync for %s' % repo_url)
+            store.replace(self.get_issue_summaries(repo_url))
+            store.save()
+            return store.summaries
+
+        owner = repo_url.split('/', 1)[0]
+        repo = repo_url.split('/', 1)[1]
+        nodes = []
+        for otype in ('issues', 'pullRequests'):
+            nodes.extend(self.get_summaries(
+                owner, repo, otype=otype, states=None, orderby=ORDER_BY_UPDATED_AT, since=store.cursor
+            ))
+        logging.info('%s summaries changed since %s for %s' % (len(nodes), store.cursor, repo_url))
+
+        # CI runs finishing do not move a PR's own updatedAt
+        changed = {x['number'] for x in nodes}
+        for number, ci_updated_at in self.get_ci_updated_ats(owner, repo).items():
+            summary = store.summaries.get(str(number))
+            if number in changed or not summary or summary.get('type') != 'pullrequest':
+                continue
+            if not ci_updated_at or summary.get('ci_updated_at') == ci_updated_at:
+                continue
+            summary = dict(summary, ci_updated_at=ci_updated_at)
+            summary['updatedAt'] = summary['updated_at'] = str(
+                max(strip_time_safely(summary['updatedAt']), strip_time_safely(ci_updated_at)).isoformat()+'Z'
+            )
+            nodes.append(summary)
+
+        if nodes:
+            post_to_receiver(
+                'summaries',
+                {'user': owner, 'repo': repo},
+                {to_text(x['number']): x for x in nodes}
+            )
+        store.update(nodes)
+        store.save()
+        return store.summaries
+
+    def get_ci_updated_ats(self, owner, repo):
+        """Return the last CI update of each open pullrequest by number
+
+        Args:
+            owner (str): the github namespace
+            repo  (str): the github repository
+        """
+        templ = Template(QUERY_TEMPLATE_CI_UPDATED_AT)
+        after = None
+        ci_updated_ats = {}
+        while True:
+            params = ', '.join([x for x in ['states: OPEN', 'first: 100', after] if x])
+            query = templ.substitute(owner=owner, repo=repo, object_params=params, subquery=SUBQUERY_CI_UPDATED_AT)
+
+            payload = {
+                'query': to_text(query, 'ascii', 'ignore').strip(),
+                'variables': '{}',
+                'operationName': None
+            }
+            rr = self.post_request(payload)
+            if not rr.ok:
+                break
+            data = rr.json()
+            if not data:
+                break
+
+            prs = data.get('data', {}).get('repository', {}).get('pullRequests', {})
+            for edge in prs.get('edges', []):
+                node = edge['node']
+                ci = node.get('commits', {}).get('nodes', [{}])[0].get('commit', {}).get('checkSuites', {}).get('nodes', {})
+                ci_updated_ats[node['number']] = ci[0]['updatedAt'] if ci else None
+
+            pageinfo = prs.get('pageInfo')
+            if not pageinfo or not pageinfo.get('hasNextPage'):
+                break
+            after = 'after: "%s"' % pageinfo['endCursor']
+
+        return ci_updated_ats
 
     def get_all_summaries(self, owner, repo):
         """Collect all the summary data for issues and pullreuests
@@ -197,31 +496,10 @@ class GithubGraphQLClient:
         for prs in psummaries:
             summaries.append(prs)
 
-        if not summaries:
-            return []
-
-        numbers = [x['number'] for x in summaries]
-        if numbers:
-            missing = (x for x in range(1, numbers[-1]) if x not in numbers)
-        else:
-            missing = []
-        for x in missing:
-            data = {
-                'created_at': None,
-                'updated_at': None,
-                'id': None,
-                'number': x,
-                'state': 'closed',
-                'repository': {
-                    'nameWithOwner': '%s/%s' % (owner, repo)
-                },
-                'type': None
-            }
-            summaries.append(data)
-
+        # numbers that were not returned read as closed from the SummaryIndex
         return sorted(summaries, key=itemgetter('number'))
 
-    def get_summaries(self, owner, repo, otype='issues', last=None, first='first: 100', states='states: OPEN', paginate=True):
+    def get_summaries(self, owner, repo, otype='issues', last=None, first='first: 100', states='states: OPEN', paginate=True, orderby=None, since=None):
         """Collect all the summary data for issues or pullreuests
 
         Args:
@@ -232,6 +510,9 @@ class GithubGraphQLClient:
             last      (str): number of nodes per page, newest to oldest
             states    (str): open or closed issues
             paginate (bool): recurse through page results
+            orderby   (str): the order of the nodes
+            since     (str): stop at the first node updated before this,
+                             only useful when ordered by updatedAt desc
 
         """
 
@@ -243,7 +524,7 @@ class GithubGraphQLClient:
             logging.debug('%s/%s %s pagecount:%s nodecount: %s' %
                           (owner, repo, otype, pagecount, len(nodes)))
 
-            issueparams = ', '.join([x for x in [states, first, last, after] if x])
+            issueparams = ', '.join([x for x in [states, orderby, first, last, after] if x])
             if otype == 'pullRequests':
                 subquery = SUBQUERY_CI_UPDATED_AT
             else:
@@ -263,12 +544,16 @@ class GithubGraphQLClient:
                 break
 
             # keep each edge/node/issue
+            done = False
             for edge in data.get('data', {}).get('repository', {}).get(otype, {}).get('edges', []):
                 node = edge['node']
+                if since and node['updatedAt'] < since:
+                    done = True
+                    break
                 self.update_node(node, otype.lower()[:-1], owner, repo)
                 nodes.append(node)
 
-            if not paginate:
+            if done or not paginate:
                 break
 
             pageinfo = data.get('data', {}).get('repository', {}).get(otype, {}).get('pageInfo')
@@ -320,11 +605,15 @@ class GithubGraphQLClient:
         return node
 
     def update_node(self, node, node_type, owner, repo):
+        # the issue's own updatedAt is what UPDATED_AT ordering sorts on
+        node['issue_updated_at'] = node['updatedAt']
         updated_ats = [node['updatedAt'], node['timelineItems']['updatedAt']]
+        node['ci_updated_at'] = None
         if node_type == 'pullrequest':
             ci = node.get('commits', {}).get('nodes', [{}])[0].get('commit', {}).get('checkSuites', {}).get('nodes', {})
             if ci:
                 updated_ats.append(ci[0]['updatedAt'])
+                node['ci_updated_at'] = ci[0]['updatedAt']
 
         node['updatedAt'] = str(
             max((strip_time_safely(u) for u in updated_ats)).isoformat()+'Z'
@@ -341,6 +630,131 @@ class GithubGraphQLClient:
 
         node['type'] = node_type
 
+    def hydrate_issues(self, repo_url, numbers):
+        """Fetch the triage data for a batch of issues and pullrequests
+
+        One aliased query pulls the labels, assignees, timeline, reviews
+        and check runs for every number. The values are converted to the
+        shapes the REST api returns so IssueWrapper can use them as is.
+        Any list that did not fit in a single page is set to None so the
+        caller falls back to the REST api for it.
+
+        Args:
+            repo_url  (str): username/repository
+            numbers  (list): issue or pullrequest numbers
+        """
+        owner = repo_url.split('/', 1)[0]
+        repo = repo_url.split('/', 1)[1]
+
+        node_template = Template(SUBQUERY_HYDRATE_NODE)
+        nodes = ''.join(
+            node_template.substitute(number=number, issue_fields=SUBQUERY_HYDRATE_ISSUE_FIELDS)
+            for number in numbers
+        )
+        query = Template(QUERY_TEMPLATE_HYDRATE).substitute(owner=owner, repo=repo, nodes=nodes)
+
+        payload = {
+            'query': to_text(query, 'ascii', 'ignore').strip(),
+            'variables': '{}',
+            'operationName': None
+        }
+        rr = self.post_request(payload)
+        data = rr.json()
+
+        hydrated = {}
+        for node in (data.get('data', {}).get('repository') or {}).values():
+            if node is None:
+                continue
+            hydrated[node['number']] = self.hydrate_node(node)
+
+        logging.info('hydrated %s of %s numbers' % (len(hydrated), len(numbers)))
+        return hydrated
+
+    def hydrate_node(self, node):
+        """Convert a hydration node into REST shaped data"""
+        hydrated = {
+            'number': node['number'],
+            'type': node['__typename'].lower(),
+            'labels': [x['name'] for x in node['labels']['nodes']],
+            'assignees': [x['login'] for x in node['assignees']['nodes']],
+            'events': None,
+            'reviews': None,
+            'check_runs': None,
+        }
+
+        timeline = node['timelineItems']
+        if not timeline['pageInfo']['hasNextPage']:
+            hydrated['events'] = [self._rest_event(x) for x in timeline['nodes']]
+
+        if hydrated['type'] == 'pullrequest':
+            reviews = node['reviews']
+            if not reviews['pageInfo']['hasNextPage']:
+                hydrated['reviews'] = [
+                    {
+                        'id': x['databaseId'],
+                        'user': {'login': x['author']['login']} if x['author'] else None,
+                        'state': x['state'],
+                        'body': x['body'],
+                        'submitted_at': x['submittedAt'],
+                        'commit_id': x['commit']['oid'] if x['commit'] else None,
+                    }
+                    for x in reviews['nodes']
+                ]
+
+            commits = node['commits']['nodes']
+            if commits and not self._check_runs_truncated(commits[0]['commit']['checkSuites']):
+                hydrated['check_runs'] = [
+                    HydratedCheckRun(
+                        id=run['databaseId'],
+                        name=run['name'],
+                        status=run['status'].lower(),
+                        conclusion=run['conclusion'].lower() if run['conclusion'] else None,
+                        details_url=run['detailsUrl'],
+                    )
+                    for suite in commits[0]['commit']['checkSuites']['nodes']
+                    for run in suite['checkRuns']['nodes']
+                ]
+
+        return hydrated
+
+    @staticmethod
+    def _check_runs_truncated(suites):
+        if suites['pageInfo']['hasNextPage']:
+            return True
+        return any(x['checkRuns']['pageInfo']['hasNextPage'] for x in suites['nodes'])
+
+    def _rest_event(self, item):
+        actor = item.get('actor') or item.get('author')
+        event = {
+            'event': TIMELINE_EVENT_NAMES[item['__typename']],
+            'actor': {'login': actor['login']} if actor else None,
+            'created_at': item['createdAt'],
+        }
+
+        # the REST ids: graphql only has the integer id of comments, the
+        # other events are known by their node id, see _parse_events
+        event['node_id'] = item['id']
+        if item['__typename'] == 'IssueComment':
+            event['id'] = item['databaseId']
+            event['body'] = item['body']
+
+        if item['__typename'] in ('LabeledEvent', 'UnlabeledEvent'):
+            event['label'] = {'name': item['label']['name']}
+        elif item['__typename'] == 'AssignedEvent':
+            event['assignee'] = {'login': (item['assignee'] or {}).get('login')}
+        elif item['__typename'] == 'CrossReferencedEvent':
+            event['source'] = {
+                'type': 'issue',
+                'issue': {
+                    'number': item['source'].get('number'),
+                    'html_url': item['source'].get('url'),
+                }
+            }
+        elif item['__typename'] == 'ReferencedEvent':
+            event['commit_id'] = item['commit']['oid'] if item['commit'] else None
+
+        return event
+
     def get_usernames_from_filename_blame(self, owner, repo, branch, filepath):
         template = Template(QUERY_TEMPLATE_BLAME)
         committers = defaultdict(set)
@@ -393,7 +807,10 @@ class GithubGraphQLClient:
     def post_request(self, payload):
         exc = None
         for i in range(3):
-            response = requests.post(self.baseurl, headers=self.headers, data=json.dumps(payload))
+            token = self.token_pool.acquire('graphql')
+            headers = dict(self.headers, Authorization='Bearer %s' % token)
+            response = get_session().post(self.baseurl, headers=headers, data=json.dumps(payload))
+            self.token_pool.update(token, response.headers)
             try:
                 response.raise_for_status()
             except requests.exceptions.HTTPError as e:
@@ -61,6 +61,16 @@ class GitRepoWrapper:
             return _files
         return self._files
 
+    @property
+    def head(self):
+        '''The commit the checkout is at, or the tarball url'''
+        if not self._is_git:
+            return self.repo
+        (rc, so, se) = run_command('cd %s; git rev-parse HEAD' % self.checkoutdir)
+        if rc != 0:
+            return None
+        return to_text(so).strip()
+
     @property
     def module_files(self):
         return [x for x in self._files if x.startswith('lib/ansible/modules')]
@@ -5,9 +5,9 @@
 
 import http.client
 import logging
-import requests
 import socket
 import sys
+import threading
 import time
 import traceback
 
@@ -15,6 +15,8 @@ from requests.exceptions import ReadTimeout
 
 from ansibullbot._text_compat import to_text
 from ansibullbot.exceptions import RateLimitError
+from ansibullbot.utils.net_tools import get_session
+from ansibullbot.utils.rate_limiter import RateLimiter
 from ansibullbot.utils.sqlite_utils import AnsibullbotDatabase
 
 import ansibullbot.constants as C
@@ -22,6 +24,83 @@ import ansibullbot.constants as C
 
 ADB = AnsibullbotDatabase()
 
+_LIMITERS = {}
+_LIMITERS_LOCK = threading.Lock()
+
+
+def get_limiter(token):
+    '''Return the process wide budget tracker for a token'''
+    with _LIMITERS_LOCK:
+        limiter = _LIMITERS.get(token)
+        if limiter is None:
+            limiter = RateLimiter()
+            # start from whatever the last run knew about this token
+            rawjson = ADB.get_rate_limit_rawjson(token=token)
+            if rawjson:
+                limiter.update_from_json(rawjson)
+            _LIMITERS[token] = limiter
+        return limiter
+
+
+class TokenPool:
+    '''Spread api calls over several tokens
+
+    Each call goes to the token with the most budget left for the
+    resource. When every token is below its reserve the call waits on the
+    one that resets first. The budgets are written back to the rate_limit
+    table once a minute or when a window resets.
+    '''
+
+    SAVE_INTERVAL = 60
+
+    def __init__(self, tokens):
+        self.tokens = []
+        for token in tokens:
+            if token and token not in self.tokens:
+                self.tokens.append(token)
+        if not self.tokens:
+            self.tokens = [None]
+        self._saved = {}
+
+    def _rank(self, token, resource, now):
+        limiter = get_limiter(token)
+        remaining, reset = limiter.available(resource, now=now)
+        if remaining is None:
+            # unknown budgets get tried first so they are discovered
+            return 2, 0
+        if remaining > limiter.reserve:
+            return 1, remaining
+        return 0, -reset
+
+    def choose(self, resource='core'):
+        now = time.time()
+        return max(self.tokens, key=lambda x: self._rank(x, resource, now))
+
+    def acquire(self, resource='core'):
+        '''Pick a token and wait until its budget allows the call'''
+        token = self.choose(resource)
+        get_limiter(token).wait(resource)
+        return token
+
+    def update(self, token, headers):
+        limiter = get_limiter(token)
+        limiter.update(headers)
+
+        snapshot = limiter.snapshot()
+        resets = sorted((k, v['reset']) for k, v in snapshot['resources'].items())
+        saved = self._saved.get(token)
+        if saved and saved[0] == resets and time.time() - saved[1] < self.SAVE_INTERVAL:
+            return
+        self._saved[token] = (resets, time.time())
+        ADB.set_rate_limit(token=token, rawjson=snapshot)
+
+    def remaining(self, resource='core'):
+        counts = [get_limiter(x).remaining(resource) for x in self.tokens]
+        counts = [x for x in counts if x is not None]
+        if not counts:
+            return None
+        return sum(counts)
+
 
 def get_rate_limit():
     url = C.DEFAULT_GITHUB_URL
@@ -37,7 +116,7 @@ def get_rate_limit():
         while True:
             logging.debug(url)
             try:
-                rr = requests.get(
+                rr = get_session().get(
                     url,
                     headers={'Authorization': 'token %s' % token}
                 )
@@ -51,7 +130,7 @@ def get_rate_limit():
         while True:
             logging.debug(url)
             try:
-                rr = requests.get(
+                rr = get_session().get(
                     url,
                     auth=(username, password)
                 )
@@ -65,6 +144,7 @@ def get_rate_limit():
         return False
 
     ADB.set_rate_limit(username=username, token=token, rawjson=response)
+    get_limiter(token).update_from_json(response)
 
     return response
 
@@ -106,23 +186,12 @@ def RateLimited(fn):
         while not success:
             count += 1
 
-            # use cached ratelimit data and a query counter to reduce api calls for rate_limit
-            rl = ADB.get_rate_limit_rawjson(token=C.DEFAULT_GITHUB_TOKEN)
-            qcounter = ADB.get_rate_limit_query_counter(token=C.DEFAULT_GITHUB_TOKEN)
-            if rl is None or qcounter is None or qcounter > 100 or (rl and rl['resources']['core']['remaining'] < 100):
-                rl = get_rate_limit()
-                ADB.set_rate_limit(token=C.DEFAULT_GITHUB_TOKEN, rawjson=rl)
-                qcounter = ADB.get_rate_limit_query_counter(token=C.DEFAULT_GITHUB_TOKEN)
-
-            logging.debug('qcounter: %s' % qcounter)
-            rl['resources']['core']['remaining'] -= qcounter
-
-            if rl:
-                logging.debug('ratelimited call #%s [%s] [%s] [%s]' %
-                              (count,
-                               type(args[0]),
-                               fn.__name__,
-                               rl['resources']['core']['remaining']))
+            # the wrappers take a token from the pool for each request
+            # they send, which is where the budget is checked
+            logging.debug('ratelimited call #%s [%s] [%s]' %
+                          (count,
+                           type(args[0]),
+                           fn.__name__))
 
             if count > 10:
                 logging.error('HIT 10 loop iteration on call, giving up')
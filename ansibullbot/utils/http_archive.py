@@ -0,0 +1,217 @@
+import base64
+import datetime
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from collections import deque
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+
+from github.Requester import HTTPRequestsConnectionClass, HTTPSRequestsConnectionClass, Requester
+from requests.adapters import BaseAdapter
+from requests.exceptions import ConnectionError
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from ansibullbot.utils import net_tools
+
+
+ARCHIVE_MODES = ('record', 'replay')
+
+
+def request_key(method, url, body=None):
+    '''What a recorded response is looked up by
+
+    Request headers are left out, they hold the tokens and the ETag
+    validators, which differ between the recording and the replay.
+    '''
+    parts = urlsplit(url)
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    # PyGithub always spells out the port
+    netloc = parts.netloc.lower()
+    if (parts.scheme, parts.port) in (('https', 443), ('http', 80)):
+        netloc = parts.hostname
+    url = urlunsplit((parts.scheme, netloc, parts.path, query, ''))
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    digest = hashlib.sha256(body).hexdigest() if body else None
+    return '%s %s %s' % (method.upper(), url, digest)
+
+
+class HttpArchive:
+    '''GitHub and AZP exchanges recorded to a gzipped json lines file
+
+    Each exchange is appended as its own gzip member in a single write,
+    so the forked workers can share the file.
+    '''
+
+    def __init__(self, path):
+        self.path = os.path.expanduser(path)
+        self._lock = threading.Lock()
+
+    def record(self, request, response, elapsed):
+        content = response.content or b''
+        try:
+            text = content.decode('utf-8')
+            encoded = None
+        except UnicodeDecodeError:
+            text = base64.b64encode(content).decode('ascii')
+            encoded = 'base64'
+
+        entry = {
+            'key': request_key(request.method, request.url, request.body),
+            'method': request.method,
+            'url': request.url,
+            'status': response.status_code,
+            'reason': response.reason,
+            'headers': dict(response.headers),
+            'content': text,
+            'encoding': encoded,
+            'elapsed': elapsed,
+        }
+        data = gzip.compress((json.dumps(entry, sort_keys=True) + '\n').encode('utf-8'))
+
+        with self._lock:
+            dirname = os.path.dirname(self.path)
+            if dirname and not os.path.exists(dirname):
+                os.makedirs(dirname)
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+            try:
+                os.write(fd, data)
+            finally:
+                os.close(fd)
+
+    def entries(self):
+        with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    def load(self):
+        '''Map each request key to its responses in recorded order'''
+        exchanges = {}
+        for entry in self.entries():
+            exchanges.setdefault(entry['key'], deque()).append(entry)
+        return exchanges
+
+
+class RecordingAdapter(BaseAdapter):
+    '''Write every exchange the wrapped adapter makes to the archive'''
+
+    def __init__(self, archive, adapter):
+        super().__init__()
+        self.archive = archive
+        self.adapter = adapter
+
+    def send(self, request, **kwargs):
+        ts = time.perf_counter()
+        response = self.adapter.send(request, **kwargs)
+        # reads the body, nothing streams through the shared session
+        response.content
+        self.archive.record(request, response, time.perf_counter() - ts)
+        return response
+
+    def close(self):
+        self.adapter.close()
+
+
+class ReplayAdapter(BaseAdapter):
+    '''Answer requests from the archive instead of the network
+
+    Repeated requests get the responses in the order they were recorded,
+    once those run out the last one is served again. Each response is
+    delayed by its recorded round trip times `latency`.
+    '''
+
+    def __init__(self, archive, latency=1.0):
+        super().__init__()
+        self.archive = archive
+        self.latency = latency
+        self._exchanges = archive.load()
+        self._lock = threading.Lock()
+
+    def send(self, request, **kwargs):
+        key = request_key(request.method, request.url, request.body)
+        with self._lock:
+            responses = self._exchanges.get(key)
+            if not responses:
+                raise ConnectionError('no recorded response for %s %s' % (request.method, request.url), request=request)
+            entry = responses.popleft() if len(responses) > 1 else responses[0]
+
+        if self.latency:
+            time.sleep(entry['elapsed'] * self.latency)
+
+        content = entry['content']
+        if entry.get('encoding') == 'base64':
+            content = base64.b64decode(content)
+        else:
+            content = content.encode('utf-8')
+
+        response = requests.Response()
+        response.status_code = entry['status']
+        response.reason = entry['reason']
+        response.headers = CaseInsensitiveDict(entry['headers'])
+        response.encoding = get_encoding_from_headers(response.headers)
+        response._content = content
+        response._content_consumed = True
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        response.elapsed = datetime.timedelta(seconds=entry['elapsed'])
+        return response
+
+    def close(self):
+        pass
+
+
+class _SessionConnectionMixin:
+    '''Send PyGithub's requests through the shared session's adapters'''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        for prefix, adapter in net_tools.get_session().adapters.items():
+            self.session.mount(prefix, adapter)
+        # only the adapters are shared, ConditionalRequester.requestJson
+        # already counts these requests and the session's hook must not
+        self.session.hooks['response'] = []
+
+
+class HTTPSSessionConnection(_SessionConnectionMixin, HTTPSRequestsConnectionClass):
+    pass
+
+
+class HTTPSessionConnection(_SessionConnectionMixin, HTTPRequestsConnectionClass):
+    pass
+
+
+def install(mode, path, latency=1.0):
+    '''Record or replay all GitHub REST, GraphQL and AZP traffic
+
+    Has to run before the Github objects are created, their requesters
+    pick the connection class when they are constructed.
+    '''
+    if mode not in ARCHIVE_MODES:
+        raise ValueError('unknown http archive mode %s' % mode)
+
+    archive = HttpArchive(path)
+    if mode == 'record':
+        logging.info('recording http traffic to %s' % archive.path)
+        net_tools.set_adapter_wrapper(lambda adapter: RecordingAdapter(archive, adapter))
+    else:
+        logging.info('replaying http traffic from %s' % archive.path)
+        replay = ReplayAdapter(archive, latency=latency)
+        net_tools.set_adapter_wrapper(lambda adapter: replay)
+
+    Requester.injectConnectionClasses(HTTPSessionConnection, HTTPSSessionConnection)
+    return archive
+
+
+def uninstall():
+    net_tools.set_adapter_wrapper(None)
+    Requester.resetConnectionClasses()
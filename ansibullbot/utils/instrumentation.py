@@ -0,0 +1,156 @@
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+
+from urllib.parse import urlparse
+
+import ansibullbot.constants as C
+
+
+CALL_KINDS = ('github', 'azp', 'git', 'http', 'subprocess')
+
+
+def classify_url(url):
+    '''Which kind of remote call a url is'''
+    host = urlparse(url).hostname or ''
+    if host == 'github.com' or host.endswith('.github.com'):
+        return 'github'
+    # a github enterprise server
+    if host == urlparse(C.DEFAULT_GITHUB_URL).hostname:
+        return 'github'
+    if host == 'dev.azure.com' or host.endswith('.visualstudio.com'):
+        return 'azp'
+    return 'http'
+
+
+class Instrumentation:
+    '''Wall time, cpu time and remote call counts per triage stage
+
+    Stages nest, a call is counted for every stage open on the thread
+    that makes it, so the counts of a stage include its sub stages. Work
+    handed to other threads is wrapped with bind() to be counted for the
+    stages open where it was submitted.
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.stages = {}
+            self.started = time.time()
+
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def _stage(self, name):
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = self.stages[name] = {'count': 0, 'wall': 0.0, 'cpu': 0.0, 'calls': dict.fromkeys(CALL_KINDS, 0)}
+        return stage
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        stack = self._stack()
+        calls = dict.fromkeys(CALL_KINDS, 0)
+        stack.append(calls)
+        wall = time.perf_counter()
+        cpu = time.thread_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall
+            cpu = time.thread_time() - cpu
+            stack.pop()
+            with self._lock:
+                stage = self._stage(name)
+                stage['count'] += 1
+                stage['wall'] += wall
+                stage['cpu'] += cpu
+                for kind, count in calls.items():
+                    stage['calls'][kind] += count
+
+    def count(self, kind):
+        '''Count a remote call for the stages open on this thread'''
+        stack = self._stack()
+        if stack:
+            # the counters can be shared with bound threads
+            with self._lock:
+                for calls in stack:
+                    calls[kind] += 1
+
+    def bind(self, func):
+        '''Make func count its calls for the stages open on this thread
+
+        For functions that run on executor threads, the calls they make
+        belong to the stage that submitted them.
+        '''
+        stack = list(self._stack())
+
+        def bound(*args, **kwargs):
+            previous = getattr(self._local, 'stack', None)
+            self._local.stack = list(stack)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._local.stack = previous if previous is not None else []
+
+        return bound
+
+    def snapshot(self):
+        with self._lock:
+            return json.loads(json.dumps(self.stages))
+
+    def merge(self, stages):
+        '''Add the stages of another process, e.g. a forked worker'''
+        with self._lock:
+            for name, data in stages.items():
+                stage = self._stage(name)
+                stage['count'] += data['count']
+                stage['wall'] += data['wall']
+                stage['cpu'] += data['cpu']
+                for kind, count in data['calls'].items():
+                    stage['calls'][kind] = stage['calls'].get(kind, 0) + count
+
+    def table(self):
+        '''Return the stages as text rows, slowest first'''
+        header = '%-32s %7s %10s %9s %10s' % ('stage', 'count', 'wall', 'avg', 'cpu')
+        header += ''.join(' %7s' % x for x in CALL_KINDS)
+        rows = [header]
+        stages = self.snapshot()
+        for name in sorted(stages, key=lambda x: stages[x]['wall'], reverse=True):
+            data = stages[name]
+            row = '%-32s %7d %9.2fs %8.3fs %9.2fs' % (
+                name, data['count'], data['wall'], data['wall'] / max(1, data['count']), data['cpu'],
+            )
+            row += ''.join(' %7d' % data['calls'].get(x, 0) for x in CALL_KINDS)
+            rows.append(row)
+        return rows
+
+    def report(self, filename=None):
+        '''Log the summary table and dump the stages as json'''
+        logging.info('stage timings for this run:')
+        for row in self.table():
+            logging.info(row)
+
+        if filename:
+            dirname = os.path.dirname(filename)
+            if dirname and not os.path.exists(dirname):
+                os.makedirs(dirname)
+            with open(filename, 'w') as f:
+                json.dump({
+                    'started': self.started,
+                    'finished': time.time(),
+                    'stages': self.snapshot(),
+                }, f, indent=2, sort_keys=True)
+            logging.info('stage timings written to %s' % filename)
+
+
+STATS = Instrumentation()
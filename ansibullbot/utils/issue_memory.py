@@ -0,0 +1,107 @@
+import sys
+import threading
+
+from collections import OrderedDict
+
+from ansibullbot.issuewrapper import UnsetValue
+
+
+# the fetched and parsed IssueWrapper data kept between loops
+CACHED_ATTRIBUTES = (
+    '_events',
+    '_history',
+    '_pr_reviews',
+    '_commits',
+    '_pr_files',
+    '_pullrequest_check_runs',
+    '_merge_commits',
+    '_committer_emails',
+    '_committer_logins',
+    '_renamed_files',
+)
+
+
+def approx_size(obj, seen=None):
+    '''Roughly the bytes an object and everything it holds take'''
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(approx_size(k, seen) + approx_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(approx_size(x, seen) for x in obj)
+    elif hasattr(obj, '__dict__'):
+        # the PyGithub objects all share the one requester
+        size += sum(approx_size(v, seen) for k, v in vars(obj).items() if k != '_requester')
+    return size
+
+
+class IssueMemory:
+    '''The data of recently triaged issues, kept in memory between loops
+
+    An entry is only used while the issue's summary has the updated_at
+    and ci_updated_at it was stored with. The least recently used entries
+    are dropped once there are more than `max_entries` or they take more
+    than `max_bytes`.
+    '''
+
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        # the prefetcher loads from its threads
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def version(summary):
+        return (summary.get('updated_at'), summary.get('ci_updated_at'))
+
+    def load(self, iw, repo, summary):
+        '''Seed the wrapper from memory, False if there is nothing current'''
+        key = (repo, iw.number)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != self.version(summary):
+                self._discard(key)
+                self.misses += 1
+                return False
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+        for name, value in entry[2].items():
+            setattr(iw, name, value)
+        return True
+
+    def save(self, iw, repo, summary):
+        state = {}
+        for name in CACHED_ATTRIBUTES:
+            value = getattr(iw, name)
+            if value is not UnsetValue:
+                state[name] = value
+        size = approx_size(state)
+
+        key = (repo, iw.number)
+        with self._lock:
+            self._discard(key)
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (self.version(summary), size, state)
+            self.size += size
+            while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+                _, (_, evicted, _) = self._entries.popitem(last=False)
+                self.size -= evicted
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[1]
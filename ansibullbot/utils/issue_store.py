@@ -0,0 +1,329 @@
+import atexit
+import datetime
+import json
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import zlib
+
+
+STORE_FILENAME = 'issues.sqlite'
+
+# bump a kind when the shape of its data changes, records written with
+# another version are treated as missing
+RECORD_VERSIONS = {
+    'issue': 2,
+    'timeline': 2,
+    'files': 2,
+    'history': 1,
+    'meta': 2,
+    # the repo's own records are kept under number 0
+    'labels': 1,
+    'assignees': 1,
+}
+
+# the history holds datetimes, everything else is the api's json and is
+# stored as zlib compressed json
+PICKLED_KINDS = frozenset(('history',))
+
+# buffered writes committed together
+BATCH_SIZE = 200
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS records (
+    repo TEXT NOT NULL,
+    number INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    updated_at TEXT,
+    data BLOB NOT NULL,
+    PRIMARY KEY (repo, number, kind)
+)
+'''
+
+
+def encode(kind, data):
+    if kind in PICKLED_KINDS:
+        return pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+    return zlib.compress(json.dumps(data, separators=(',', ':')).encode('utf-8'))
+
+
+def decode(kind, blob):
+    if kind in PICKLED_KINDS:
+        return pickle.loads(blob)
+    return json.loads(zlib.decompress(blob).decode('utf-8'))
+
+
+def raw_record(obj):
+    '''What a PyGithub object is cached as, see Github.create_from_raw_data'''
+    return {'raw_data': obj.raw_data, 'headers': obj.raw_headers}
+
+
+class IssueStore:
+    '''A repo's cached issue data in a single sqlite file
+
+    Records are keyed by (repo, number, kind). Writes are buffered and
+    committed in one transaction once BATCH_SIZE of them piled up or
+    flush() is called, reads see the buffered writes.
+    '''
+
+    def __init__(self, path, batch_size=BATCH_SIZE):
+        self.path = path
+        self.batch_size = batch_size
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._pending = {}
+        self._pid = os.getpid()
+
+        dirname = os.path.dirname(self.path)
+        if dirname and not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        self._connection()
+
+    def _connection(self):
+        '''A connection per thread and process, sqlite ones can not be shared'''
+        if getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=60)
+            # only takes effect on a new file, see evict()
+            conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+            # readers do not block the writer, the forked workers write too
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(SCHEMA)
+            conn.commit()
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return self._local.conn
+
+    def _check_fork(self):
+        # the parent flushes what it buffered before forking
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._pending = {}
+
+    def get(self, repo, number, kind):
+        key = (repo, int(number), kind)
+        with self._lock:
+            self._check_fork()
+            row = self._pending.get(key)
+            if row is None:
+                row = self._connection().execute(
+                    'SELECT version, updated_at, data FROM records WHERE repo = ? AND number = ? AND kind = ?',
+                    key
+                ).fetchone()
+
+        if row is None or row[2] is None or row[0] != RECORD_VERSIONS[kind]:
+            return None
+        try:
+            return decode(kind, row[2])
+        except Exception as e:
+            logging.warning('could not load the %s record for %s#%s: %s' % (kind, repo, number, e))
+            return None
+
+    def put(self, repo, number, kind, data, updated_at=None):
+        if isinstance(updated_at, datetime.datetime):
+            updated_at = updated_at.isoformat()
+        # serialized right away so later changes to data do not leak in
+        blob = encode(kind, data)
+        with self._lock:
+            self._check_fork()
+            self._pending[(repo, int(number), kind)] = (RECORD_VERSIONS[kind], updated_at, blob)
+            if len(self._pending) >= self.batch_size:
+                self.flush()
+
+    def delete(self, repo, number, kind=None):
+        '''Drop one or all of the records for a number'''
+        with self._lock:
+            self._check_fork()
+            for _kind in [kind] if kind else RECORD_VERSIONS:
+                self._pending[(repo, int(number), _kind)] = (RECORD_VERSIONS[_kind], None, None)
+            if len(self._pending) >= self.batch_size:
+                self.flush()
+
+    def records(self, repo, number):
+        return IssueRecords(self, repo, number)
+
+    def numbers(self, repo, kind):
+        '''The numbers with a record of this kind'''
+        self.flush()
+        rows = self._connection().execute(
+            'SELECT number FROM records WHERE repo = ? AND kind = ? AND version = ? ORDER BY number',
+            (repo, kind, RECORD_VERSIONS[kind])
+        )
+        return [x[0] for x in rows]
+
+    def disk_size(self):
+        return sum(os.path.getsize(x) for x in (self.path, self.path + '-wal') if os.path.exists(x))
+
+    def evict(self, repo, numbers):
+        '''Drop every record of the numbers, return the bytes freed on disk'''
+        before = self.disk_size()
+        with self._lock:
+            for number in numbers:
+                self.delete(repo, number)
+            self.flush()
+
+            conn = self._connection()
+            if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+                # a one time rewrite of files created without it
+                conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+                conn.execute('VACUUM')
+            else:
+                conn.execute('PRAGMA incremental_vacuum')
+            conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        return max(0, before - self.disk_size())
+
+    def flush(self):
+        '''Commit the buffered writes in a single transaction'''
+        with self._lock:
+            self._check_fork()
+            if not self._pending:
+                return
+            writes = []
+            deletes = []
+            for key, (version, updated_at, data) in self._pending.items():
+                if data is None:
+                    deletes.append(key)
+                else:
+                    writes.append(key + (version, updated_at, data))
+
+            conn = self._connection()
+            with conn:
+                conn.executemany(
+                    'INSERT OR REPLACE INTO records (repo, number, kind, version, updated_at, data) VALUES (?, ?, ?, ?, ?, ?)',
+                    writes
+                )
+                conn.executemany('DELETE FROM records WHERE repo = ? AND number = ? AND kind = ?', deletes)
+            self._pending = {}
+
+
+class IssueRecords:
+    '''The records of a single issue'''
+
+    def __init__(self, store, repo, number):
+        self.store = store
+        self.repo = repo
+        self.number = number
+
+    def get(self, kind):
+        return self.store.get(self.repo, self.number, kind)
+
+    def put(self, kind, data, updated_at=None):
+        self.store.put(self.repo, self.number, kind, data, updated_at=updated_at)
+
+    def delete(self, kind=None):
+        self.store.delete(self.repo, self.number, kind=kind)
+
+
+_STORES = {}
+_STORES_LOCK = threading.Lock()
+
+
+def get_issue_store(cachedir):
+    '''The store for a repo's cachedir, shared by everything in the process'''
+    path = os.path.join(os.path.abspath(os.path.expanduser(cachedir)), STORE_FILENAME)
+    with _STORES_LOCK:
+        if path not in _STORES:
+            _STORES[path] = IssueStore(path)
+        return _STORES[path]
+
+
+def flush_issue_stores():
+    for store in list(_STORES.values()):
+        try:
+            store.flush()
+        except sqlite3.Error as e:
+            logging.error('could not flush %s: %s' % (store.path, e))
+
+
+atexit.register(flush_issue_stores)
+
+
+def _load_pickle(path):
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def _load_json(path):
+    with open(path, 'rb') as f:
+        return json.load(f)
+
+
+def _legacy_issue(pfile):
+    return raw_record(_load_pickle(pfile)), None
+
+
+def _legacy_timeline(datafile, metafile):
+    meta = _load_json(metafile)
+    data = {'updated_at': meta['updated_at'], 'url': meta.get('url'), 'data': _load_json(datafile)}
+    return data, meta['updated_at']
+
+
+def _legacy_files(pfile):
+    updated, files = _load_pickle(pfile)
+    return {'updated_at': updated.isoformat(), 'files': [x.raw_data for x in files]}, updated
+
+
+def _legacy_history(pfile):
+    data = _load_pickle(pfile)
+    return data, data.get('updated_at')
+
+
+def _legacy_meta(mfile):
+    data = _load_json(mfile)
+    return data, data.get('updated_at')
+
+
+# the files each kind was cached in under issues/<number>/
+LEGACY_FILES = (
+    ('issue', ('issue.pickle',), _legacy_issue),
+    ('timeline', ('timeline_data.json', 'timeline_meta.json'), _legacy_timeline),
+    ('files', ('files.pickle',), _legacy_files),
+    ('history', ('history.pickle',), _legacy_history),
+    ('meta', ('meta.json',), _legacy_meta),
+)
+
+
+def migrate_issue_cache(repo_cachedir, repo, remove=False):
+    '''Import a repo's issues/<number>/ cache files into its store
+
+    Returns the number of records imported, with `remove` the imported
+    files and the emptied directories are deleted.
+    '''
+    store = get_issue_store(repo_cachedir)
+    issuesdir = os.path.join(repo_cachedir, 'issues')
+    if not os.path.isdir(issuesdir):
+        return 0
+
+    count = 0
+    for number in sorted(os.listdir(issuesdir)):
+        issuedir = os.path.join(issuesdir, number)
+        if not number.isdigit() or not os.path.isdir(issuedir):
+            continue
+
+        imported = []
+        for kind, filenames, loader in LEGACY_FILES:
+            paths = [os.path.join(issuedir, x) for x in filenames]
+            if not all(os.path.isfile(x) for x in paths):
+                continue
+            try:
+                data, updated_at = loader(*paths)
+            except Exception as e:
+                logging.warning('skipping %s: %s' % (paths[0], e))
+                continue
+            store.put(repo, int(number), kind, data, updated_at=updated_at)
+            imported.extend(paths)
+            count += 1
+
+        if remove and imported:
+            # only once the records are safely in the store
+            store.flush()
+            for path in imported:
+                os.remove(path)
+            if not os.listdir(issuedir):
+                os.rmdir(issuedir)
+
+    store.flush()
+    return count
@@ -1,7 +1,17 @@
 import logging
+import os
+import threading
 import time
 
+from urllib.parse import urlparse
+
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import ansibullbot.constants as C
+
+from ansibullbot.utils.instrumentation import STATS, classify_url
 
 
 # FIXME should we only retry 5xx?
@@ -15,11 +25,88 @@ _DONT_RETRY_STATUSES = [
 ]
 
 
+_RETRY_STATUSES = [
+    429,  # Too Many Requests
+    500,  # Internal Server Error
+    502,  # Bad Gateway
+    503,  # Service Unavailable
+    504,  # Gateway Timeout
+]
+
+_SESSION = None
+_SESSION_PID = None
+_SESSION_LOCK = threading.Lock()
+_WRAP_ADAPTER = None
+
+
+def _count_response(resp, *args, **kwargs):
+    STATS.count(classify_url(resp.url))
+
+
+def set_adapter_wrapper(func):
+    '''Send the session's requests through func(adapter), e.g. to record them'''
+    global _SESSION, _WRAP_ADAPTER
+
+    with _SESSION_LOCK:
+        _WRAP_ADAPTER = func
+        _SESSION = None
+
+
+def _pool_sizes():
+    '''Return the pool size of each host prefix that gets its own pool'''
+    # the REST and graphql apis share the host
+    github = urlparse(C.DEFAULT_GITHUB_URL)
+    sizes = {'%s://%s/' % (github.scheme, github.netloc): C.DEFAULT_HTTP_GITHUB_POOL_MAXSIZE}
+    if C.DEFAULT_RECEIVER_HOST and 'none' not in C.DEFAULT_RECEIVER_HOST.lower():
+        # only ever posted to from the triage thread
+        sizes['http://%s:%s/' % (C.DEFAULT_RECEIVER_HOST, C.DEFAULT_RECEIVER_PORT)] = 1
+    return sizes
+
+
+def _adapter(pool_maxsize):
+    retry = Retry(
+        total=C.DEFAULT_HTTP_RETRIES,
+        backoff_factor=C.DEFAULT_HTTP_BACKOFF,
+        status_forcelist=_RETRY_STATUSES,
+        raise_on_status=False,
+        respect_retry_after_header=True,
+    )
+    adapter = HTTPAdapter(pool_maxsize=pool_maxsize, max_retries=retry)
+    if _WRAP_ADAPTER is not None:
+        adapter = _WRAP_ADAPTER(adapter)
+    return adapter
+
+
+def get_session():
+    """return the process wide keep-alive session
+
+    Connections are pooled per host, the github api and the receiver get
+    pools sized for the threads that use them. Idempotent requests are
+    retried with backoff on connection errors and 5xx. A forked child
+    gets its own session so sockets are never shared between processes.
+    """
+    global _SESSION, _SESSION_PID
+
+    with _SESSION_LOCK:
+        if _SESSION is None or _SESSION_PID != os.getpid():
+            session = requests.Session()
+            adapter = _adapter(C.DEFAULT_HTTP_POOL_MAXSIZE)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            for prefix, pool_maxsize in _pool_sizes().items():
+                session.mount(prefix, _adapter(pool_maxsize))
+            session.hooks['response'].append(_count_response)
+            _SESSION = session
+            _SESSION_PID = os.getpid()
+
+    return _SESSION
+
+
 def fetch(url, verb='get', **kwargs):
     """return response or None in case of failure, try twice"""
     for i in range(2):
         logging.info('%s %s' % (verb, url))
-        http_method = getattr(requests, verb)
+        http_method = getattr(get_session(), verb)
         resp = http_method(url, **kwargs)
         logging.info('status code: %s' % resp.status_code)
         logging.info('reason: %s' % resp.reason)
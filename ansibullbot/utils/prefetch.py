@@ -0,0 +1,50 @@
+import logging
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from ansibullbot.utils.instrumentation import STATS
+
+
+class Prefetcher:
+    """Run a fetch function for upcoming items in background threads.
+
+    Iterating yields (item, result) in the original order while keeping
+    at most `lookahead` fetches in flight ahead of the consumer. A fetch
+    that raises yields None so the consumer can fall back to fetching
+    the data itself.
+    """
+
+    def __init__(self, fetch, items, lookahead=5, workers=None):
+        self.fetch = fetch
+        self.items = items
+        self.lookahead = lookahead
+        self.workers = workers or lookahead
+
+    def _fetch(self, item):
+        try:
+            return self.fetch(item)
+        except Exception as e:
+            logging.warning('prefetch for %s failed: %s' % (item, e))
+            return None
+
+    def __iter__(self):
+        items = iter(self.items)
+        pending = deque()
+        # the calls count for the stages open where the items are consumed
+        fetch = STATS.bind(self._fetch)
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for item in islice(items, self.lookahead):
+                pending.append((item, executor.submit(fetch, item)))
+
+            while pending:
+                item, future = pending.popleft()
+                result = future.result()
+
+                # keep the window full while the consumer works on this one
+                nextitem = next(items, None)
+                if nextitem is not None:
+                    pending.append((nextitem, executor.submit(fetch, nextitem)))
+
+                yield item, result
@@ -0,0 +1,115 @@
+import logging
+import threading
+import time
+
+from requests.structures import CaseInsensitiveDict
+
+
+class RateLimiter:
+    """Track the GitHub api budget in memory from X-RateLimit-* headers.
+
+    Each resource (core, graphql, search ...) has its own bucket. Calls
+    take a token up front so concurrent threads see the spend right away,
+    and the next response header corrects the count. Once the remaining
+    budget drops below `pace_below` the calls are spread evenly over the
+    rest of the window, and below `reserve` they wait for the reset.
+    """
+
+    reserve = 100
+    pace_below = 500
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def update(self, headers):
+        """Refresh a bucket from the headers of a response"""
+        headers = CaseInsensitiveDict(headers)
+        remaining = headers.get('X-RateLimit-Remaining')
+        reset = headers.get('X-RateLimit-Reset')
+        if remaining is None or reset is None:
+            return
+
+        resource = headers.get('X-RateLimit-Resource') or 'core'
+        limit = headers.get('X-RateLimit-Limit') or remaining
+        self.set_budget(resource, int(limit), int(remaining), int(reset))
+
+    def update_from_json(self, rawjson):
+        """Refresh all buckets from a /rate_limit response"""
+        for resource, data in rawjson.get('resources', {}).items():
+            self.set_budget(resource, data['limit'], data['remaining'], data['reset'])
+
+    def set_budget(self, resource, limit, remaining, reset):
+        with self._lock:
+            bucket = self._buckets.get(resource)
+            next_slot = 0
+            if bucket and bucket['reset'] == reset:
+                next_slot = bucket['next_slot']
+            self._buckets[resource] = {
+                'limit': limit,
+                'remaining': remaining,
+                'reset': reset,
+                'next_slot': next_slot,
+            }
+
+    def remaining(self, resource='core'):
+        bucket = self._buckets.get(resource)
+        if bucket is None:
+            return None
+        return bucket['remaining']
+
+    def available(self, resource='core', now=None):
+        """Return (remaining, reset) as of now, or (None, None) if unknown"""
+        if now is None:
+            now = time.time()
+        bucket = self._buckets.get(resource)
+        if bucket is None:
+            return None, None
+        if now >= bucket['reset']:
+            return bucket['limit'], bucket['reset']
+        return bucket['remaining'], bucket['reset']
+
+    def snapshot(self):
+        """Return the buckets in the shape of a /rate_limit response"""
+        with self._lock:
+            return {'resources': {
+                resource: {
+                    'limit': bucket['limit'],
+                    'remaining': bucket['remaining'],
+                    'reset': bucket['reset'],
+                } for resource, bucket in self._buckets.items()
+            }}
+
+    def schedule(self, resource='core', now=None):
+        """Take a token and return how many seconds the caller should wait"""
+        if now is None:
+            now = time.time()
+
+        with self._lock:
+            bucket = self._buckets.get(resource)
+            if bucket is None:
+                # nothing seen yet, the first response fills it in
+                return 0
+
+            if now >= bucket['reset']:
+                bucket['remaining'] = bucket['limit']
+                bucket['next_slot'] = 0
+
+            available = bucket['remaining'] - self.reserve
+            if available <= 0:
+                # wait for the window to reset, and take a token from the new one
+                bucket['remaining'] -= 1
+                return bucket['reset'] - now + 1
+
+            slot = max(now, bucket['next_slot'])
+            if available < self.pace_below:
+                bucket['next_slot'] = slot + (bucket['reset'] - slot) / available
+            bucket['remaining'] -= 1
+            return slot - now
+
+    def wait(self, resource='core'):
+        delay = self.schedule(resource)
+        if delay > 0:
+            logging.info('%s rate limit budget low, waiting %.1fs' % (resource, delay))
+            time.sleep(delay)
+
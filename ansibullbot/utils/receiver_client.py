@@ -1,8 +1,7 @@
 import logging
 
-import requests
-
 import ansibullbot.constants as C
+from ansibullbot.utils.net_tools import get_session
 
 
 def post_to_receiver(path, params, data):
@@ -22,7 +21,7 @@ def post_to_receiver(path, params, data):
         receiverurl += path
         logging.info('RECEIVER: POST to %s' % receiverurl)
         try:
-            rr = requests.post(receiverurl, params=params, json=data)
+            rr = get_session().post(receiverurl, params=params, json=data)
         except Exception as e:
             logging.error(e)
 
@@ -65,7 +64,7 @@ def get_receiver_summaries(username, reponame, state=None, number=None):
 
         rr = None
         try:
-            rr = requests.get(
+            rr = get_session().get(
                 receiverurl,
                 params=params
             )
@@ -110,7 +109,7 @@ def get_receiver_metadata(username, reponame, number=None, keys=None):
 
         rr = None
         try:
-            rr = requests.get(
+            rr = get_session().get(
                 receiverurl,
                 params=params
             )
@@ -1,12 +1,17 @@
 import json
 import logging
 import os
+import time
 
+from requests.structures import CaseInsensitiveDict
 from sqlalchemy import create_engine
+from sqlalchemy import Boolean
 from sqlalchemy import Column
+from sqlalchemy import Float
 from sqlalchemy import Integer
 from sqlalchemy import String
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import scoped_session
 from sqlalchemy.orm import sessionmaker
 
 import ansibullbot.constants as C
@@ -54,13 +59,36 @@ class GithubApiRequest(Base):
     token = Column(String)
 
 
+class WebhookEvent(Base):
+    __tablename__ = 'webhook_event'
+    id = Column(Integer(), primary_key=True)
+    repo = Column(String)
+    number = Column(Integer)
+    events = Column(String)
+    claimed = Column(Boolean, default=False)
+
+
+class QueuedActions(Base):
+    __tablename__ = 'queued_actions'
+    id = Column(Integer(), primary_key=True)
+    repo = Column(String)
+    number = Column(Integer)
+    fingerprint = Column(String)
+    actions = Column(String)
+    attempts = Column(Integer, default=0)
+    not_before = Column(Float, default=0.0)
+    claimed = Column(Boolean, default=False)
+    # the steps already executed, a retry skips them
+    done = Column(String, default='')
+
+
 class AnsibullbotDatabase:
 
     '''A sqlite backed database to help with data caching [NOT CONFIG]'''
 
 
     # Use this to set the filename and avoid having to deal with migration
-    VERSION = '0.2'
+    VERSION = '0.4'
 
     def __init__(self, cachedir='/tmp'):
 
@@ -80,10 +108,16 @@ class AnsibullbotDatabase:
 
         self.engine = create_engine(self.unc)
         self.session_maker = sessionmaker(bind=self.engine)
-        self.session = self.session_maker()
+        # one session per thread, the prefetcher calls in from its own threads
+        self.session = scoped_session(self.session_maker)
 
         self.create_tables()
 
+    def reconnect(self):
+        '''Drop the pooled connections inherited from a parent process'''
+        self.engine.dispose(close=False)
+        self.session = scoped_session(self.session_maker)
+
     def delete_db_file(self):
         os.remove(self.dbfile)
 
@@ -96,6 +130,8 @@ class AnsibullbotDatabase:
                 Blame.metadata.create_all(self.engine)
                 RateLimit.metadata.create_all(self.engine)
                 GithubApiRequest.metadata.create_all(self.engine)
+                WebhookEvent.metadata.create_all(self.engine)
+                QueuedActions.metadata.create_all(self.engine)
                 break
             except Exception as e:
                 retries += 1
@@ -127,10 +163,11 @@ class AnsibullbotDatabase:
         return meta
 
     def set_github_api_request_meta(self, url, headers, datafile, token=None):
+        headers = CaseInsensitiveDict(headers)
         kwargs = {
             'url': url,
-            'date': headers['Date'],
-            'etag': headers['ETag'],
+            'date': headers.get('Date'),
+            'etag': headers.get('ETag'),
             'last_modified': headers.get('Last-Modified'),
             'datafile': datafile,
             'token': token,
@@ -146,6 +183,9 @@ class AnsibullbotDatabase:
             logging.error(e)
             return None
 
+        # update the existing row instead of adding one per request
+        if current is not None:
+            kwargs['id'] = current.id
         meta = GithubApiRequest(**kwargs)
         self.session.merge(meta)
         try:
@@ -158,15 +198,19 @@ class AnsibullbotDatabase:
 
         '''Store the ratelimit json data by user/token'''
 
+        core = rawjson['resources'].get('core', {})
         kwargs = {
             'username': username,
             'token': token,
-            'core_rate_limit': rawjson['resources']['core']['limit'],
-            'core_rate_limit_remaining': rawjson['resources']['core']['remaining'],
+            'core_rate_limit': core.get('limit'),
+            'core_rate_limit_remaining': core.get('remaining'),
             'rawjson': json.dumps(rawjson),
             'query_counter': 0
         }
         try:
+            current = self.session.query(RateLimit).filter(RateLimit.token == token).first()
+            if current is not None:
+                kwargs['id'] = current.id
             rl = RateLimit(**kwargs)
             self.session.merge(rl)
             self.session.flush()
@@ -245,3 +289,212 @@ class AnsibullbotDatabase:
         self.session.merge(rl)
         self.session.flush()
         self.session.commit()
+
+    def enqueue_webhook_event(self, repo, number, event):
+
+        '''Queue a number for triage, merging it with any pending event for it
+
+        A number that is being triaged gets a new row, the triage may have
+        read the issue before this event happened.
+        '''
+
+        try:
+            current = self.session.query(WebhookEvent).filter(WebhookEvent.repo == repo).filter(WebhookEvent.number == number).filter(WebhookEvent.claimed == False).first()  # noqa: E712
+            if current is None:
+                self.session.add(WebhookEvent(repo=repo, number=number, events=event, claimed=False))
+            elif event not in current.events.split(','):
+                current.events += ',' + event
+            self.session.flush()
+            self.session.commit()
+        except Exception as e:
+            logging.error(e)
+            self.session.rollback()
+
+    def claim_webhook_events(self, limit=None):
+
+        '''Claim the pending numbers in the order their first event arrived
+
+        The rows stay in the queue until finish_webhook_events() is called
+        for them once they were triaged.
+        '''
+
+        try:
+            query = self.session.query(WebhookEvent).filter(WebhookEvent.claimed == False).order_by(WebhookEvent.id)  # noqa: E712
+            if limit:
+                query = query.limit(limit)
+            rows = query.all()
+            claimed = []
+            for row in rows:
+                row.claimed = True
+                claimed.append({
+                    'id': row.id,
+                    'repo': row.repo,
+                    'number': row.number,
+                    'events': row.events.split(','),
+                })
+            self.session.flush()
+            self.session.commit()
+        except Exception as e:
+            logging.error(e)
+            self.session.rollback()
+            return []
+
+        return claimed
+
+    def finish_webhook_events(self, event_ids):
+
+        '''Remove triaged numbers from the queue'''
+
+        try:
+            self.session.query(WebhookEvent).filter(WebhookEvent.id.in_(event_ids)).delete(synchronize_session=False)
+            self.session.flush()
+            self.session.commit()
+        except Exception as e:
+            logging.error(e)
+            self.session.rollback()
+
+    def release_webhook_events(self, event_ids=None):
+
+        '''Requeue claimed numbers whose triage failed, or all of them
+
+        They are merged into the events that arrived for them meanwhile.
+        '''
+
+        try:
+            query = self.session.query(WebhookEvent).filter(WebhookEvent.claimed == True)  # noqa: E712
+            if event_ids is not None:
+                query = query.filter(WebhookEvent.id.in_(event_ids))
+            for row in query.all():
+                pending = self.session.query(WebhookEvent).filter(WebhookEvent.repo == row.repo).filter(WebhookEvent.number == row.number).filter(WebhookEvent.claimed == False).first()  # noqa: E712
+                if pending is None:
+                    row.claimed = False
+                    continue
+                events = row.events.split(',')
+                events += [x for x in pending.events.split(',') if x not in events]
+                row.events = ','.join(events)
+                row.claimed = False
+                self.session.delete(pending)
+            self.session.flush()
+            self.session.commit()
+        except Exception as e:
+            logging.error(e)
+            self.session.rollback()
+
+
+    def enqueue_actions(self, repo, number, fingerprint, actions):
+
+        '''Queue the actions for a number, superseding the pending ones for it
+
+        Returns False when the same actions for the same inputs are
+        already queued or being executed.
+        '''
+
+        try:
+            current = self.session.query(QueuedActions).filter(QueuedActions.repo == repo).filter(QueuedActions.number == number).all()
+            if any(x.fingerprint == fingerprint and x.actions == actions for x in current):
+                return False
+            # a newer triage knows better than the one that queued these
+            for row in current:
+                if not row.claimed:
+                    self.session.delete(row)
+            self.session.add(QueuedActions(repo=repo, number=number, fingerprint=fingerprint, actions=actions, attempts=0, not_before=0.0, claimed=False, done=''))
+            self.session.flush()
+            self.session.commit()
+        except Exception as e:
+            logging.error(e)
+            self.session.rollback()
+            return False
+
+        return True
+
+    def claim_actions(self, limit=None):
+
+        '''Claim the due actions in the order they were queued
+
+        Numbers that still have actions being executed are left alone, so
+        the actions for a number always run one after the other.
+        '''
+
+        try:
+            rows = self.session.query(QueuedActions).order_by(QueuedActions.id).all()
+            busy = {(x.repo, x.number) for x in rows if x.claimed}
+            now = time.time()
+            claimed = []
+            for row in rows:
+                if limit and len(claimed) >= limit:
+                    break
+                if row.claimed or row.not_before > now or (row.repo, row.number) in busy:
+                    continue
+                busy.add((row.repo, row.number))
+                row.claimed = True
+                claimed.append({
+                    'id': row.id,
+                    'repo': row.repo,
+                    'number': row.number,
+                    'fingerprint': row.fingerprint,
+                    'actions': json.loads(row.actions),
+                    'attempts': row.attempts,
+                    'done': row.done.split(',') if row.done else [],
+                })
+            self.session.flush()
+            self.session.commit()
+        except Exception as e:
+            logging.error(e)
+            self.session.rollback()
+            return []
+
+        return claimed
+
+    def finish_actions(self, actions_id):
+
+        '''Remove executed or abandoned actions from the queue'''
+
+        try:
+            self.session.query(QueuedActions).filter(QueuedActions.id == actions_id).delete()
+            self.session.flush()
+            self.session.commit()
+        except Exception as e:
+            logging.error(e)
+            self.session.rollback()
+
+    def record_actions_step(self, actions_id, step):
+
+        '''Remember that a step of the actions was executed'''
+
+        try:
+            row = self.session.query(QueuedActions).filter(QueuedActions.id == actions_id).first()
+            if row is not None and step not in row.done.split(','):
+                row.done = ','.join(x for x in (row.done, step) if x)
+            self.session.flush()
+            self.session.commit()
+        except Exception as e:
+            logging.error(e)
+            self.session.rollback()
+
+    def retry_actions(self, actions_id, delay):
+
+        '''Put failed actions back in the queue to run again after delay seconds'''
+
+        try:
+            row = self.session.query(QueuedActions).filter(QueuedActions.id == actions_id).first()
+            if row is not None:
+                row.attempts += 1
+                row.not_before = time.time() + delay
+                row.claimed = False
+            self.session.flush()
+            self.session.commit()
+        except Exception as e:
+            logging.error(e)
+            self.session.rollback()
+
+    def release_claimed_actions(self):
+
+        '''Requeue the actions a stopped or crashed executor had claimed'''
+
+        try:
+            self.session.query(QueuedActions).filter(QueuedActions.claimed == True).update({'claimed': False})  # noqa: E712
+            self.session.flush()
+            self.session.commit()
+        except Exception as e:
+            logging.error(e)
+            self.session.rollback()
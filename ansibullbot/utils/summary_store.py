@@ -0,0 +1,196 @@
+import datetime
+import json
+import logging
+import os
+
+
+class SummaryIndex:
+    '''The summaries of a repo keyed by number
+
+    Only the issues and pullrequests that were fetched have a record. The
+    state and type of every number up to the highest one live in two
+    bytearray columns, numbers that were never fetched read as closed
+    placeholders. It can be used like the old dict of summaries keyed by
+    the number as a string, and `select` answers the state/type filters
+    as sets without touching the records.
+    '''
+
+    STATES = (None, 'open', 'closed', 'merged')
+    # a merged pullrequest is closed too
+    CLOSED_STATES = ('closed', 'merged')
+    TYPES = (None, 'issue', 'pullrequest')
+
+    def __init__(self, records=None, repo=None):
+        self.repo = repo
+        self._records = {}
+        self._states = bytearray(1)
+        self._types = bytearray(1)
+        if records:
+            self.update(records)
+
+    @staticmethod
+    def _number(key):
+        return int(key)
+
+    @property
+    def max_number(self):
+        return len(self._states) - 1
+
+    def _grow(self, number):
+        if number > self.max_number:
+            missing = number - self.max_number
+            self._states.extend(bytes([self.STATES.index('closed')]) * missing)
+            self._types.extend(bytes(missing))
+
+    def __len__(self):
+        return len(self._records)
+
+    def __contains__(self, key):
+        return 0 < self._number(key) <= self.max_number
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __getitem__(self, key):
+        number = self._number(key)
+        if number in self._records:
+            return self._records[number]
+        if not 0 < number <= self.max_number:
+            raise KeyError(key)
+        return {
+            'created_at': None,
+            'updated_at': None,
+            'id': None,
+            'number': number,
+            'state': 'closed',
+            'repository': {
+                'nameWithOwner': self.repo
+            },
+            'type': None
+        }
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __setitem__(self, key, node):
+        number = self._number(key)
+        self._grow(number)
+        self._records[number] = node
+        self._states[number] = self.STATES.index(node.get('state'))
+        node_type = node.get('type')
+        self._types[number] = self.TYPES.index(node_type.lower() if node_type else None)
+        if self.repo is None:
+            self.repo = node.get('repository', {}).get('nameWithOwner')
+
+    def update(self, records):
+        for key, node in records.items():
+            self[key] = node
+
+    def keys(self):
+        return [str(x) for x in sorted(self._records)]
+
+    def values(self):
+        return [self._records[x] for x in sorted(self._records)]
+
+    def items(self):
+        return [(str(x), self._records[x]) for x in sorted(self._records)]
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def select(self, state=None, type=None):
+        '''Return the set of numbers with the given state and/or type'''
+        if state is None and type is None:
+            return set(range(1, self.max_number + 1))
+        if state is not None:
+            numbers = set()
+            for _state in self.CLOSED_STATES if state == 'closed' else (state,):
+                numbers |= self._find(self._states, self.STATES.index(_state))
+            if type is not None:
+                numbers &= self._find(self._types, self.TYPES.index(type))
+            return numbers
+        return self._find(self._types, self.TYPES.index(type))
+
+    @staticmethod
+    def _find(column, code):
+        found = set()
+        code = bytes([code])
+        idx = column.find(code, 1)
+        while idx != -1:
+            found.add(idx)
+            idx = column.find(code, idx + 1)
+        return found
+
+
+class SummaryStore:
+    '''Keep a repo's issue summaries on disk between loops
+
+    `cursor` is the newest issue updatedAt seen so far, an incremental
+    sync only has to ask for what changed at or after it.
+    '''
+
+    def __init__(self, cachedir, repo_url):
+        self.filename = os.path.join(os.path.expanduser(cachedir), repo_url, 'summaries.json')
+        self.repo_url = repo_url
+        self.summaries = SummaryIndex(repo=repo_url)
+        self.cursor = None
+        self.full_sync_at = None
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.filename) as f:
+                data = json.load(f)
+        except OSError:
+            return
+        except ValueError as e:
+            logging.error('Could not load summaries from %s: %s' % (self.filename, e))
+            return
+
+        self.summaries = SummaryIndex(data.get('summaries', {}), repo=self.repo_url)
+        self.cursor = data.get('cursor')
+        self.full_sync_at = data.get('full_sync_at')
+
+    def save(self):
+        dirname = os.path.dirname(self.filename)
+        if not os.path.exists(dirname):
+            os.makedirs(dirname)
+
+        # write aside and rename so a crash never leaves half a file
+        tmpfile = self.filename + '.tmp'
+        with open(tmpfile, 'w') as f:
+            json.dump({
+                'cursor': self.cursor,
+                'full_sync_at': self.full_sync_at,
+                'summaries': self.summaries.to_dict(),
+            }, f)
+        os.replace(tmpfile, self.filename)
+
+    def needs_full_sync(self, interval):
+        '''Is there no store yet, or is the last full sync older than interval seconds?'''
+        if not self.summaries or not self.full_sync_at:
+            return True
+        last = datetime.datetime.fromisoformat(self.full_sync_at)
+        return (datetime.datetime.now() - last).total_seconds() >= interval
+
+    def replace(self, summaries):
+        '''Start over from a full sync'''
+        self.summaries = SummaryIndex(summaries.to_dict() if isinstance(summaries, SummaryIndex) else summaries, repo=self.repo_url)
+        self.cursor = None
+        self._advance(self.summaries.values())
+        self.full_sync_at = datetime.datetime.now().isoformat()
+
+    def update(self, nodes):
+        '''Merge nodes from an incremental sync'''
+        for node in nodes:
+            self.summaries[str(node['number'])] = node
+        self._advance(nodes)
+
+    def _advance(self, nodes):
+        for node in nodes:
+            ts = node.get('issue_updated_at')
+            if ts and (self.cursor is None or ts > self.cursor):
+                self.cursor = ts
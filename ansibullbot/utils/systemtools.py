@@ -2,6 +2,8 @@ import copy
 import os
 import subprocess
 
+from ansibullbot.utils.instrumentation import STATS
+
 
 def run_command(cmd, cwd=None, env=None):
     if env:
@@ -10,6 +12,7 @@ def run_command(cmd, cwd=None, env=None):
         env = copy.deepcopy(_env)
         for k, v in env.items():
             env[k] = str(v)
+    STATS.count('git' if 'git ' in cmd else 'subprocess')
     p = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=cwd, env=env)
     (so, se) = p.communicate()
     return p.returncode, so, se
@@ -30,3 +30,12 @@ def strip_time_safely(tstring):
 
     logging.error(f'{tstring} could not be stripped')
     raise Exception(f'{tstring} could not be stripped')
+
+
+def parse_time_utc(ts):
+    """Parse an isoformat string into an aware utc datetime"""
+    dt = datetime.datetime.fromisoformat(ts.replace('Z', '+00:00'))
+    if dt.tzinfo is None:
+        # meta['time'] is written with the local clock
+        dt = dt.astimezone()
+    return dt.astimezone(datetime.timezone.utc)
@@ -0,0 +1,96 @@
+import hashlib
+import hmac
+import json
+import logging
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from ansibullbot.utils.github import ADB
+
+
+WEBHOOK_EVENTS = frozenset((
+    'issues',
+    'issue_comment',
+    'pull_request',
+    'pull_request_review',
+    'check_suite',
+))
+
+
+def verify_signature(secret, body, signature):
+    '''Check the X-Hub-Signature-256 header against the payload'''
+    if not secret or not signature or not signature.startswith('sha256='):
+        return False
+    digest = hmac.new(secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest('sha256=' + digest, signature)
+
+
+def get_event_numbers(event, payload):
+    '''Return the repo and the issue or pullrequest numbers an event is about'''
+    repo = payload.get('repository', {}).get('full_name')
+
+    if event in ('issues', 'issue_comment'):
+        numbers = [payload['issue']['number']]
+    elif event in ('pull_request', 'pull_request_review'):
+        numbers = [payload['pull_request']['number']]
+    elif event == 'check_suite':
+        numbers = [x['number'] for x in payload['check_suite'].get('pull_requests', [])]
+    else:
+        numbers = []
+
+    return repo, numbers
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    '''Accept github deliveries and queue the numbers they touch'''
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+        if not verify_signature(self.server.secret, body, self.headers.get('X-Hub-Signature-256')):
+            logging.warning('webhook: rejecting delivery %s with a bad signature' % self.headers.get('X-GitHub-Delivery'))
+            self.send_response(401)
+            self.end_headers()
+            return
+
+        event = self.headers.get('X-GitHub-Event')
+        if event not in WEBHOOK_EVENTS:
+            # ping and anything we do not triage on
+            self.send_response(204)
+            self.end_headers()
+            return
+
+        try:
+            repo, numbers = get_event_numbers(event, json.loads(body))
+        except (ValueError, KeyError, TypeError) as e:
+            logging.warning('webhook: unable to parse %s payload: %s' % (event, e))
+            self.send_response(400)
+            self.end_headers()
+            return
+
+        if repo in self.server.repos:
+            for number in numbers:
+                logging.info('webhook: %s for %s#%s' % (event, repo, number))
+                self.server.db.enqueue_webhook_event(repo, number, event)
+
+        self.send_response(202)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        logging.debug('webhook: ' + format % args)
+
+
+def start_webhook_listener(host, port, secret, repos, db=ADB):
+    '''Serve the webhook endpoint from a background thread'''
+    server = ThreadingHTTPServer((host, port), WebhookHandler)
+    server.daemon_threads = True
+    server.secret = secret
+    server.repos = frozenset(repos)
+    server.db = db
+
+    thread = threading.Thread(target=server.serve_forever, name='webhooks', daemon=True)
+    thread.start()
+    logging.info('webhook: listening on %s:%s' % server.server_address[:2])
+
+    return server
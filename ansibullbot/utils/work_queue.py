@@ -0,0 +1,121 @@
+import datetime
+
+import ansibullbot.constants as C
+
+from ansibullbot.utils.timetools import parse_time_utc
+
+
+PRIORITY_UPDATED = 0
+PRIORITY_CI = 1
+PRIORITY_TIMER = 2
+PRIORITY_STALE = 3
+
+PRIORITY_NAMES = {
+    PRIORITY_UPDATED: 'updated',
+    PRIORITY_CI: 'ci',
+    PRIORITY_TIMER: 'timer',
+    PRIORITY_STALE: 'stale',
+}
+
+
+def timer_deadlines(meta):
+    '''Return the times at which the bot would act on this issue without any new activity'''
+    needs_info_applied = None
+    needs_info_warned = None
+    waiting_applied = None
+    for event in meta.get('history') or []:
+        if event.get('event') == 'labeled' and event.get('label') == 'needs_info':
+            needs_info_applied = event['created_at']
+        elif event.get('event') == 'labeled' and event.get('label') == 'waiting_on_contributor':
+            waiting_applied = event['created_at']
+        elif event.get('event') == 'commented' and 'boilerplate: needs_info_base' in (event.get('body') or ''):
+            needs_info_warned = event['created_at']
+
+    deadlines = []
+    labels = meta.get('labels') or []
+    if 'needs_info' in labels:
+        if needs_info_applied:
+            deadlines.append(parse_time_utc(needs_info_applied) + datetime.timedelta(days=C.DEFAULT_NEEDS_INFO_WARN))
+        if needs_info_warned:
+            expire = C.DEFAULT_NEEDS_INFO_EXPIRE - C.DEFAULT_NEEDS_INFO_WARN
+            deadlines.append(parse_time_utc(needs_info_warned) + datetime.timedelta(days=expire))
+    if 'waiting_on_contributor' in labels and waiting_applied:
+        deadlines.append(parse_time_utc(waiting_applied) + datetime.timedelta(days=C.DEFAULT_WAITING_ON_CONTRIBUTOR_EXPIRE))
+
+    return deadlines
+
+
+def has_due_timer(meta, now=None):
+    '''Has a bot timer fired since the issue was last triaged?'''
+    if not meta.get('time'):
+        return False
+    if now is None:
+        now = datetime.datetime.now(datetime.timezone.utc)
+    last_triaged = parse_time_utc(meta['time'])
+    return any(last_triaged < x <= now for x in timer_deadlines(meta))
+
+
+class WorkQueue:
+    '''Order the numbers for a loop by why they need triage
+
+    Recently updated issues go first, then pullrequests with new CI
+    results, then issues whose needs_info or waiting_on_contributor
+    timers have fired. Stale re-checks fill whatever is left, oldest
+    first, optionally capped so a loop stays short.
+    '''
+
+    def __init__(self):
+        self._items = {}
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, number):
+        return number in self._items
+
+    def add(self, number, priority, key=None):
+        '''Queue a number, keeping its most urgent priority'''
+        number = int(number)
+        current = self._items.get(number)
+        if current is None or priority < current[0]:
+            self._items[number] = (priority, key)
+
+    def priority(self, number):
+        return self._items[int(number)][0]
+
+    def counts(self, numbers=None):
+        if numbers is None:
+            numbers = self._items.keys()
+        counts = dict.fromkeys(PRIORITY_NAMES.values(), 0)
+        for number in numbers:
+            counts[PRIORITY_NAMES[self.priority(number)]] += 1
+        return counts
+
+    def ordered(self, numbers=None, reverse=False, stale_limit=None):
+        '''Return the queued numbers, most urgent first
+
+        Stale numbers are sorted by their key, the last triage time, and
+        the rest by number, descending when reverse is set. Only numbers
+        in `numbers` are returned when it is given.
+        '''
+        if numbers is None:
+            numbers = self._items.keys()
+        numbers = {int(x) for x in numbers if int(x) in self._items}
+
+        buckets = {}
+        for number in numbers:
+            priority, key = self._items[number]
+            buckets.setdefault(priority, []).append((key, number))
+
+        result = []
+        for priority in sorted(buckets):
+            bucket = buckets[priority]
+            if priority == PRIORITY_STALE:
+                bucket = sorted(bucket, key=lambda x: (x[0] is not None, x[0] or '', x[1]))
+                if stale_limit is not None:
+                    bucket = bucket[:stale_limit]
+            else:
+                bucket = sorted(bucket, key=lambda x: x[1], reverse=reverse)
+            result.extend(x[1] for x in bucket)
+
+        return result
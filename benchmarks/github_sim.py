@@ -0,0 +1,1048 @@
+#!/usr/bin/env python
+'''A local stand-in for the GitHub api, for load and soak tests
+
+Serves a synthetic repository of any size through the REST endpoints
+PyGithub uses for the bot (issues, pulls, timeline, reviews, commits,
+files, labels, check-runs, assignees, rate_limit) and the graphql
+queries in ansibullbot.utils.gh_gql_client (summaries, single nodes,
+hydration, team members, blame). Responses can be delayed, rate limited
+per token and fail at random.
+
+    python -m benchmarks.github_sim --issues 40000 --pulls 20000 --latency_ms 80 --rate_limit 5000
+
+    ANSIBULLBOT_GITHUB_URL=http://127.0.0.1:8642 ANSIBULLBOT_GITHUB_TOKEN=x \\
+        ./triage_ansible.py --daemonize --dry-run --repo ansible/ansible
+
+The repository is generated from --seed, so two runs with the same
+arguments serve the same data. Writes (labels, comments, state) are kept
+in memory and show up in later reads.
+'''
+
+import argparse
+import datetime
+import hashlib
+import json
+import logging
+import random
+import re
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlencode, urlparse
+
+
+TIME_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+LABELS = [
+    'bug', 'feature', 'docs', 'module', 'plugins', 'python3', 'networking',
+    'cloud', 'needs_triage', 'needs_info', 'needs_revision', 'small_patch',
+    'support:core', 'support:community', 'affects_2.9', 'affects_2.12',
+    'P3', 'has_issue', 'stale_ci', 'ci_verified',
+]
+
+COMPONENTS = [
+    'lib/ansible/modules/apt.py', 'lib/ansible/modules/copy.py',
+    'lib/ansible/modules/file.py', 'lib/ansible/modules/git.py',
+    'lib/ansible/modules/lineinfile.py', 'lib/ansible/modules/service.py',
+    'lib/ansible/modules/shell.py', 'lib/ansible/modules/template.py',
+    'lib/ansible/modules/uri.py', 'lib/ansible/modules/user.py',
+    'lib/ansible/modules/yum.py', 'lib/ansible/plugins/action/copy.py',
+    'lib/ansible/executor/task_executor.py', 'docs/docsite/rst/index.rst',
+]
+
+ISSUE_BODY = '''##### SUMMARY
+Synthetic %(type)s %(number)s
+
+##### ISSUE TYPE
+- %(issue_type)s
+
+##### COMPONENT NAME
+%(component)s
+
+##### ANSIBLE VERSION
+```
+ansible 2.%(minor)s.0
+```
+'''
+
+CHECK_RUNS = ['sanity', 'units', 'integration']
+
+# graphql timeline item types for the REST timeline events
+GRAPHQL_EVENT_TYPES = {
+    'commented': 'IssueComment',
+    'labeled': 'LabeledEvent',
+    'unlabeled': 'UnlabeledEvent',
+    'assigned': 'AssignedEvent',
+    'subscribed': 'SubscribedEvent',
+    'cross-referenced': 'CrossReferencedEvent',
+    'referenced': 'ReferencedEvent',
+}
+
+
+def isotime(ts):
+    return datetime.datetime.fromtimestamp(ts, datetime.timezone.utc).strftime(TIME_FORMAT)
+
+
+def sha(*parts):
+    return hashlib.sha1('/'.join(str(x) for x in parts).encode('utf-8')).hexdigest()
+
+
+class SyntheticRepo:
+    '''A repository of generated issues and pullrequests
+
+    The per number metadata is generated up front, timelines, commits
+    and files on demand from a per number seed.
+    '''
+
+    def __init__(self, full_name, issues=1000, pulls=500, open_ratio=0.3, events=20, users=500, seed=0, now=None):
+        self.full_name = full_name
+        self.seed = seed
+        self.events = events
+        self.users = users
+        self.now = now or time.time()
+        self._lock = threading.Lock()
+        self._comment_ids = 10 ** 9
+
+        rng = random.Random(seed)
+        types = ['issue'] * issues + ['pullrequest'] * pulls
+        rng.shuffle(types)
+
+        self.items = {}
+        for idx, otype in enumerate(types):
+            number = idx + 1
+            created = self.now - rng.uniform(0, 5 * 365 * 86400)
+            updated = rng.uniform(created, self.now)
+            state = 'open' if rng.random() < open_ratio else 'closed'
+            item = {
+                'number': number,
+                'type': otype,
+                'state': state,
+                'merged': otype == 'pullrequest' and state == 'closed' and rng.random() < 0.7,
+                'created': created,
+                'updated': updated,
+                'closed': updated if state == 'closed' else None,
+                'user': 'user%s' % rng.randrange(users),
+                'labels': sorted(rng.sample(LABELS, rng.randrange(5))),
+                'assignees': [],
+                'component': rng.choice(COMPONENTS),
+                'comments': [],
+                'extra_events': [],
+            }
+            if otype == 'pullrequest':
+                item['ci_updated'] = rng.uniform(item['updated'], self.now) if state == 'open' else item['updated']
+                item['commits'] = 1 + rng.randrange(3)
+            self.items[number] = item
+
+    def get(self, number):
+        return self.items.get(number)
+
+    def rng(self, number, salt=''):
+        return random.Random('%s/%s/%s' % (self.seed, number, salt))
+
+    def touch(self, item):
+        item['updated'] = max(time.time(), item['updated'] + 1)
+
+    # generated data
+
+    def timeline(self, item):
+        rng = self.rng(item['number'], 'timeline')
+        count = rng.randrange(2 * self.events + 1)
+        times = sorted(rng.uniform(item['created'], item['updated']) for x in range(count))
+
+        events = []
+        for idx, ts in enumerate(times):
+            actor = 'user%s' % rng.randrange(self.users)
+            kind = rng.choice(['commented', 'commented', 'commented', 'labeled', 'unlabeled', 'subscribed', 'cross-referenced'])
+            event_id = int(sha(self.full_name, item['number'], idx)[:12], 16)
+            event = {
+                'id': event_id,
+                'node_id': 'E_%s' % event_id,
+                'event': kind,
+                'actor': {'login': actor},
+                'created_at': isotime(ts),
+            }
+            if kind == 'commented':
+                event['user'] = {'login': actor}
+                event['body'] = 'synthetic comment %s' % idx
+                event['updated_at'] = event['created_at']
+            elif kind in ('labeled', 'unlabeled'):
+                event['label'] = {'name': rng.choice(LABELS)}
+            elif kind == 'cross-referenced':
+                other = rng.randrange(1, len(self.items) + 1)
+                event['source'] = {'type': 'issue', 'issue': {
+                    'number': other,
+                    'html_url': 'https://github.com/%s/issues/%s' % (self.full_name, other),
+                }}
+            events.append(event)
+
+        for idx, commit in enumerate(self.commits(item)):
+            events.append({
+                'event': 'committed',
+                'sha': commit['sha'],
+                'author': commit['commit']['author'],
+                'committer': commit['commit']['committer'],
+                'message': commit['commit']['message'],
+            })
+
+        return events + item['comments'] + item['extra_events']
+
+    def commits(self, item):
+        if item['type'] != 'pullrequest':
+            return []
+        rng = self.rng(item['number'], 'commits')
+        commits = []
+        for idx in range(item['commits']):
+            ts = isotime(rng.uniform(item['created'], item['updated']))
+            login = item['user']
+            person = {'name': login, 'email': '%s@example.com' % login, 'date': ts}
+            commits.append({
+                'sha': sha(self.full_name, item['number'], 'commit', idx),
+                'commit': {'author': person, 'committer': person, 'message': 'synthetic commit %s' % idx},
+                'author': {'login': login},
+                'committer': {'login': login},
+            })
+        return sorted(commits, key=lambda x: x['commit']['committer']['date'])
+
+    def files(self, item):
+        rng = self.rng(item['number'], 'files')
+        filenames = {item['component']}
+        filenames.update(rng.sample(COMPONENTS, rng.randrange(3)))
+        files = []
+        for filename in sorted(filenames):
+            additions = 1 + rng.randrange(40)
+            deletions = rng.randrange(10)
+            files.append({
+                'sha': sha(filename, item['number']),
+                'filename': filename,
+                'status': 'modified',
+                'additions': additions,
+                'deletions': deletions,
+                'changes': additions + deletions,
+                'patch': '@@ -1,%s +1,%s @@\n' % (deletions, additions) + '+synthetic\n' * additions,
+            })
+        return files
+
+    def reviews(self, item):
+        rng = self.rng(item['number'], 'reviews')
+        commits = self.commits(item)
+        reviews = []
+        for idx in range(rng.randrange(3)):
+            reviews.append({
+                'id': int(sha(self.full_name, item['number'], 'review', idx)[:10], 16),
+                'user': {'login': 'user%s' % rng.randrange(self.users)},
+                'state': rng.choice(['APPROVED', 'COMMENTED', 'CHANGES_REQUESTED']),
+                'body': '',
+                'submitted_at': isotime(rng.uniform(item['created'], item['updated'])),
+                'commit_id': commits[-1]['sha'] if commits else None,
+            })
+        return reviews
+
+    def check_runs(self, item):
+        rng = self.rng(item['number'], 'ci')
+        runs = []
+        for idx, name in enumerate(CHECK_RUNS):
+            runs.append({
+                'id': int(sha(self.full_name, item['number'], name)[:10], 16),
+                'name': name,
+                'status': 'completed',
+                'conclusion': 'success' if rng.random() < 0.8 else 'failure',
+                'details_url': 'https://dev.azure.com/ansible/ansible/_build/results?buildId=%s' % (item['number'] * 10 + idx),
+                'completed_at': isotime(item.get('ci_updated') or item['updated']),
+            })
+        return runs
+
+    # writes
+
+    def add_labels(self, item, labels):
+        with self._lock:
+            for label in labels:
+                if label not in item['labels']:
+                    item['labels'].append(label)
+                    item['extra_events'].append(self._event(item, 'labeled', label={'name': label}))
+            self.touch(item)
+
+    def remove_label(self, item, label):
+        with self._lock:
+            if label not in item['labels']:
+                return False
+            item['labels'].remove(label)
+            item['extra_events'].append(self._event(item, 'unlabeled', label={'name': label}))
+            self.touch(item)
+            return True
+
+    def add_comment(self, item, body, login='ansibot'):
+        with self._lock:
+            self._comment_ids += 1
+            comment = self._event(item, 'commented', body=body, user={'login': login})
+            comment['id'] = self._comment_ids
+            comment['actor'] = {'login': login}
+            item['comments'].append(comment)
+            self.touch(item)
+            return comment
+
+    def delete_comment(self, comment_id):
+        with self._lock:
+            for item in self.items.values():
+                for comment in item['comments']:
+                    if comment['id'] == comment_id:
+                        item['comments'].remove(comment)
+                        self.touch(item)
+                        return True
+        return False
+
+    def edit(self, item, data):
+        with self._lock:
+            if data.get('state') in ('open', 'closed') and data['state'] != item['state']:
+                item['state'] = data['state']
+                item['closed'] = time.time() if data['state'] == 'closed' else None
+                item['extra_events'].append(self._event(item, 'closed' if data['state'] == 'closed' else 'reopened'))
+            if 'labels' in data:
+                item['labels'] = list(data['labels'])
+            if 'assignees' in data:
+                item['assignees'] = list(data['assignees'])
+            self.touch(item)
+
+    def merge(self, item):
+        with self._lock:
+            item['state'] = 'closed'
+            item['merged'] = True
+            item['closed'] = time.time()
+            self.touch(item)
+
+    def _event(self, item, kind, **kwargs):
+        event_id = int(sha(self.full_name, item['number'], kind, time.time(), len(item['extra_events']))[:12], 16)
+        event = {
+            'id': event_id,
+            'node_id': 'E_%s' % event_id,
+            'event': kind,
+            'actor': {'login': 'ansibot'},
+            'created_at': isotime(time.time()),
+        }
+        event.update(kwargs)
+        return event
+
+
+class Budget:
+    '''Per token rate limit windows, like GitHub's X-RateLimit-* headers'''
+
+    def __init__(self, limit, window):
+        self.limit = limit
+        self.window = window
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def _bucket(self, token, resource):
+        now = time.time()
+        bucket = self._buckets.get((token, resource))
+        if bucket is None or now >= bucket['reset']:
+            bucket = self._buckets[(token, resource)] = {'remaining': self.limit, 'reset': int(now + self.window)}
+        return bucket
+
+    def spend(self, token, resource):
+        '''Take one call from the budget, return False when it is exhausted'''
+        with self._lock:
+            bucket = self._bucket(token, resource)
+            if bucket['remaining'] <= 0:
+                return False
+            bucket['remaining'] -= 1
+            return True
+
+    def headers(self, token, resource):
+        with self._lock:
+            bucket = self._bucket(token, resource)
+            return {
+                'X-RateLimit-Limit': str(self.limit),
+                'X-RateLimit-Remaining': str(bucket['remaining']),
+                'X-RateLimit-Reset': str(bucket['reset']),
+                'X-RateLimit-Used': str(self.limit - bucket['remaining']),
+                'X-RateLimit-Resource': resource,
+            }
+
+    def resources(self, token):
+        data = {}
+        for resource in ('core', 'graphql', 'search'):
+            headers = self.headers(token, resource)
+            data[resource] = {
+                'limit': self.limit,
+                'remaining': int(headers['X-RateLimit-Remaining']),
+                'reset': int(headers['X-RateLimit-Reset']),
+            }
+        return data
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class GraphQL:
+    '''Answer the handful of queries the bot sends
+
+    This is not a graphql implementation, the queries are recognized by
+    their shape and answered with the fields the bot selects.
+    '''
+
+    RE_REPOSITORY = re.compile(r'repository\(owner:\s*"([^"]+)",\s*name:\s*"([^"]+)"\)')
+    RE_CONNECTION = re.compile(r'\b(issues|pullRequests)\(([^)]*?(?:\{[^}]*\}[^)]*?)?)\)\s*\{')
+    RE_SINGLE = re.compile(r'\b(issue|pullRequest)\(number:\s*(\d+)\)')
+    RE_HYDRATE = re.compile(r'(\w+):\s*issueOrPullRequest\(number:\s*(\d+)\)')
+    RE_TEAM = re.compile(r'organization\(login:\s*"([^"]+)"\)\s*\{\s*team\(slug:\s*"([^"]+)"\)')
+
+    def __init__(self, server):
+        self.server = server
+
+    def execute(self, query):
+        team = self.RE_TEAM.search(query)
+        if team:
+            members = ['maintainer%s' % x for x in range(10)]
+            return {'organization': {'team': {'members': {'edges': [{'node': {'login': x}} for x in members]}}}}
+
+        match = self.RE_REPOSITORY.search(query)
+        if not match:
+            raise HttpError(400, 'unsupported query')
+        repo = self.server.get_repo('%s/%s' % match.groups())
+
+        if 'blame(' in query:
+            return {'repository': {'ref': {'target': {'blame': {'ranges': []}}}}}
+
+        aliases = self.RE_HYDRATE.findall(query)
+        if aliases:
+            data = {}
+            for alias, number in aliases:
+                item = repo.get(int(number))
+                data[alias] = self.hydrate_node(repo, item) if item else None
+            return {'repository': data}
+
+        single = self.RE_SINGLE.search(query)
+        if single:
+            otype, number = single.groups()
+            item = repo.get(int(number))
+            if item and (item['type'] == 'pullrequest') != (otype == 'pullRequest'):
+                item = None
+            return {'repository': {otype: self.summary_node(repo, item) if item else None}}
+
+        connection = self.RE_CONNECTION.search(query)
+        if connection:
+            otype, params = connection.groups()
+            return {'repository': {otype: self.connection(repo, otype, params)}}
+
+        raise HttpError(400, 'unsupported query')
+
+    def connection(self, repo, otype, params):
+        wanted = 'pullrequest' if otype == 'pullRequests' else 'issue'
+        items = [x for x in repo.items.values() if x['type'] == wanted]
+
+        states = re.search(r'states:\s*\[?([A-Z, ]+)\]?', params)
+        if states:
+            states = {x.strip().lower() for x in states.group(1).split(',')}
+            items = [x for x in items if self.graphql_state(x).lower() in states]
+
+        if 'UPDATED_AT' in params:
+            items.sort(key=lambda x: x['updated'], reverse='DESC' in params)
+        else:
+            items.sort(key=lambda x: x['number'])
+
+        after = re.search(r'after:\s*"(\d+)"', params)
+        offset = int(after.group(1)) if after else 0
+        first = re.search(r'first:\s*(\d+)', params)
+        last = re.search(r'last:\s*(\d+)', params)
+        if last and not first:
+            count = int(last.group(1))
+            page = items[max(0, len(items) - count):]
+            end = len(items)
+        else:
+            count = int(first.group(1)) if first else 100
+            page = items[offset:offset + count]
+            end = offset + len(page)
+
+        return {
+            'pageInfo': {'endCursor': str(end), 'hasNextPage': end < len(items)},
+            'edges': [{'node': self.summary_node(repo, x)} for x in page],
+        }
+
+    @staticmethod
+    def graphql_state(item):
+        if item.get('merged'):
+            return 'MERGED'
+        return item['state'].upper()
+
+    def summary_node(self, repo, item):
+        node = {
+            'id': 'node%s' % item['number'],
+            'url': self.server.html_url(repo, item),
+            'number': item['number'],
+            'state': self.graphql_state(item),
+            'createdAt': isotime(item['created']),
+            'updatedAt': isotime(item['updated']),
+            'repository': {'nameWithOwner': repo.full_name},
+            'timelineItems': {'updatedAt': isotime(item['updated'])},
+        }
+        if item['type'] == 'pullrequest':
+            suite = {
+                'status': 'COMPLETED',
+                'conclusion': 'SUCCESS',
+                'createdAt': isotime(item['ci_updated']),
+                'updatedAt': isotime(item['ci_updated']),
+                'id': 'suite%s' % item['number'],
+                'app': {'slug': 'azure-pipelines', 'id': 9426},
+            }
+            node['commits'] = {'nodes': [{'commit': {'checkSuites': {'nodes': [suite]}}}]}
+        return node
+
+    def hydrate_node(self, repo, item):
+        timeline = [x for x in repo.timeline(item) if x['event'] in GRAPHQL_EVENT_TYPES]
+        node = {
+            '__typename': 'PullRequest' if item['type'] == 'pullrequest' else 'Issue',
+            'number': item['number'],
+            'state': self.graphql_state(item),
+            'labels': {'nodes': [{'name': x} for x in item['labels']]},
+            'assignees': {'nodes': [{'login': x} for x in item['assignees']]},
+            'timelineItems': {
+                'pageInfo': {'hasNextPage': len(timeline) > 100},
+                'nodes': [self.timeline_node(x) for x in timeline[:100]],
+            },
+        }
+        if item['type'] == 'pullrequest':
+            commits = repo.commits(item)
+            node['reviews'] = {
+                'pageInfo': {'hasNextPage': False},
+                'nodes': [{
+                    'databaseId': x['id'],
+                    'author': x['user'],
+                    'state': x['state'],
+                    'body': x['body'],
+                    'submittedAt': x['submitted_at'],
+                    'commit': {'oid': x['commit_id']} if x['commit_id'] else None,
+                } for x in repo.reviews(item)],
+            }
+            runs = [{
+                'databaseId': x['id'],
+                'name': x['name'],
+                'status': x['status'].upper(),
+                'conclusion': x['conclusion'].upper(),
+                'detailsUrl': x['details_url'],
+            } for x in repo.check_runs(item)]
+            node['commits'] = {'nodes': [{'commit': {
+                'oid': commits[-1]['sha'],
+                'checkSuites': {
+                    'pageInfo': {'hasNextPage': False},
+                    'nodes': [{'checkRuns': {'pageInfo': {'hasNextPage': False}, 'nodes': runs}}],
+                },
+            }}]}
+        return node
+
+    @staticmethod
+    def timeline_node(event):
+        node = {
+            '__typename': GRAPHQL_EVENT_TYPES[event['event']],
+            'id': event['node_id'],
+            'createdAt': event['created_at'],
+        }
+        if event['event'] == 'commented':
+            node['databaseId'] = event['id']
+            node['author'] = event['actor']
+            node['body'] = event['body']
+            return node
+
+        node['actor'] = event['actor']
+        if event['event'] in ('labeled', 'unlabeled'):
+            node['label'] = event['label']
+        elif event['event'] == 'assigned':
+            node['assignee'] = event.get('assignee')
+        elif event['event'] == 'cross-referenced':
+            node['source'] = {'number': event['source']['issue']['number'], 'url': event['source']['issue']['html_url']}
+        elif event['event'] == 'referenced':
+            node['commit'] = {'oid': event.get('commit_id')} if event.get('commit_id') else None
+        return node
+
+
+class GithubSimulator(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, repos, latency=0.0, jitter=0.0, rate_limit=5000, rate_window=3600, error_rate=0.0, seed=0):
+        super().__init__(address, SimulatorHandler)
+        self.repos = {x.full_name.lower(): x for x in repos}
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.budget = Budget(rate_limit, rate_window)
+        self.graphql = GraphQL(self)
+        self.rng = random.Random(seed)
+        self.stats = {'requests': 0, 'not_modified': 0, 'rate_limited': 0, 'errors': 0}
+        self._stats_lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return 'http://%s:%s' % (host, port)
+
+    def count(self, key):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def get_repo(self, full_name):
+        repo = self.repos.get(full_name.lower())
+        if repo is None:
+            raise HttpError(404, 'Not Found')
+        return repo
+
+    def delay(self):
+        if self.latency or self.jitter:
+            time.sleep(max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter)))
+
+    # REST representations
+
+    def user(self, login):
+        return {'login': login, 'id': int(sha(login)[:8], 16), 'type': 'User', 'url': '%s/users/%s' % (self.base_url, login)}
+
+    def label(self, repo, name):
+        return {
+            'id': int(sha(repo.full_name, name)[:8], 16),
+            'name': name,
+            'color': sha(name)[:6],
+            'url': '%s/repos/%s/labels/%s' % (self.base_url, repo.full_name, name),
+        }
+
+    def html_url(self, repo, item):
+        kind = 'pull' if item['type'] == 'pullrequest' else 'issues'
+        return 'https://github.com/%s/%s/%s' % (repo.full_name, kind, item['number'])
+
+    def repository(self, repo):
+        owner, name = repo.full_name.split('/')
+        return {
+            'id': int(sha(repo.full_name)[:8], 16),
+            'name': name,
+            'full_name': repo.full_name,
+            'owner': self.user(owner),
+            'private': False,
+            'url': '%s/repos/%s' % (self.base_url, repo.full_name),
+            'html_url': 'https://github.com/%s' % repo.full_name,
+            'default_branch': 'devel',
+        }
+
+    def issue(self, repo, item):
+        url = '%s/repos/%s/issues/%s' % (self.base_url, repo.full_name, item['number'])
+        data = {
+            'id': item['number'],
+            'node_id': 'node%s' % item['number'],
+            'number': item['number'],
+            'url': url,
+            'html_url': self.html_url(repo, item),
+            'labels_url': url + '/labels{/name}',
+            'comments_url': url + '/comments',
+            'events_url': url + '/events',
+            'title': 'Synthetic %s %s' % (item['type'], item['number']),
+            'body': ISSUE_BODY % {
+                'type': item['type'],
+                'number': item['number'],
+                'issue_type': 'Bugfix Pull Request' if item['type'] == 'pullrequest' else 'Bug Report',
+                'component': item['component'],
+                'minor': 9 + item['number'] % 5,
+            },
+            'user': self.user(item['user']),
+            'labels': [self.label(repo, x) for x in item['labels']],
+            'assignee': self.user(item['assignees'][0]) if item['assignees'] else None,
+            'assignees': [self.user(x) for x in item['assignees']],
+            'state': item['state'],
+            'locked': False,
+            'comments': len(item['comments']),
+            'created_at': isotime(item['created']),
+            'updated_at': isotime(item['updated']),
+            'closed_at': isotime(item['closed']) if item['closed'] else None,
+            'repository_url': '%s/repos/%s' % (self.base_url, repo.full_name),
+        }
+        if item['type'] == 'pullrequest':
+            data['pull_request'] = {
+                'url': '%s/repos/%s/pulls/%s' % (self.base_url, repo.full_name, item['number']),
+                'html_url': self.html_url(repo, item),
+            }
+        return data
+
+    def pull(self, repo, item):
+        data = self.issue(repo, item)
+        commits = repo.commits(item)
+        files = repo.files(item)
+        data.update({
+            'url': '%s/repos/%s/pulls/%s' % (self.base_url, repo.full_name, item['number']),
+            'issue_url': '%s/repos/%s/issues/%s' % (self.base_url, repo.full_name, item['number']),
+            'draft': False,
+            'merged': item['merged'],
+            'mergeable': True,
+            'mergeable_state': 'clean',
+            'merged_at': isotime(item['closed']) if item['merged'] else None,
+            'head': {
+                'ref': 'feature-%s' % item['number'],
+                'sha': commits[-1]['sha'],
+                'repo': self.repository(repo),
+                'user': self.user(item['user']),
+            },
+            'base': {
+                'ref': 'devel',
+                'sha': sha(repo.full_name, 'devel'),
+                'repo': self.repository(repo),
+            },
+            'commits': len(commits),
+            'changed_files': len(files),
+            'additions': sum(x['additions'] for x in files),
+            'deletions': sum(x['deletions'] for x in files),
+            'author_association': 'CONTRIBUTOR',
+        })
+        data.pop('pull_request', None)
+        return data
+
+    def comment(self, repo, item, comment):
+        return {
+            'id': comment['id'],
+            'body': comment['body'],
+            'user': self.user(comment['user']['login']),
+            'created_at': comment['created_at'],
+            'updated_at': comment['created_at'],
+            'url': '%s/repos/%s/issues/comments/%s' % (self.base_url, repo.full_name, comment['id']),
+            'html_url': '%s#issuecomment-%s' % (self.html_url(repo, item), comment['id']),
+        }
+
+
+class SimulatorHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    ROUTES = [
+        ('GET', r'/rate_limit', 'rate_limit'),
+        ('GET', r'/repos/([^/]+/[^/]+)', 'get_repository'),
+        ('GET', r'/repos/([^/]+/[^/]+)/labels', 'list_repo_labels'),
+        ('GET', r'/repos/([^/]+/[^/]+)/assignees', 'list_assignees'),
+        ('GET', r'/repos/([^/]+/[^/]+)/issues', 'list_issues'),
+        ('GET', r'/repos/([^/]+/[^/]+)/issues/(\d+)', 'get_issue'),
+        ('PATCH', r'/repos/([^/]+/[^/]+)/issues/(\d+)', 'edit_issue'),
+        ('GET', r'/repos/([^/]+/[^/]+)/issues/(\d+)/timeline', 'list_timeline'),
+        ('GET', r'/repos/([^/]+/[^/]+)/issues/(\d+)/events', 'list_timeline'),
+        ('GET', r'/repos/([^/]+/[^/]+)/issues/(\d+)/comments', 'list_comments'),
+        ('POST', r'/repos/([^/]+/[^/]+)/issues/(\d+)/comments', 'create_comment'),
+        ('DELETE', r'/repos/([^/]+/[^/]+)/issues/comments/(\d+)', 'delete_comment'),
+        ('GET', r'/repos/([^/]+/[^/]+)/issues/(\d+)/labels', 'list_labels'),
+        ('POST', r'/repos/([^/]+/[^/]+)/issues/(\d+)/labels', 'add_labels'),
+        ('PUT', r'/repos/([^/]+/[^/]+)/issues/(\d+)/labels', 'set_labels'),
+        ('DELETE', r'/repos/([^/]+/[^/]+)/issues/(\d+)/labels/([^/]+)', 'remove_label'),
+        ('POST', r'/repos/([^/]+/[^/]+)/issues/(\d+)/assignees', 'add_assignees'),
+        ('GET', r'/repos/([^/]+/[^/]+)/pulls/(\d+)', 'get_pull'),
+        ('GET', r'/repos/([^/]+/[^/]+)/pulls/(\d+)/commits', 'list_commits'),
+        ('GET', r'/repos/([^/]+/[^/]+)/pulls/(\d+)/files', 'list_files'),
+        ('GET', r'/repos/([^/]+/[^/]+)/pulls/(\d+)/reviews', 'list_reviews'),
+        ('PUT', r'/repos/([^/]+/[^/]+)/pulls/(\d+)/merge', 'merge_pull'),
+        ('GET', r'/repos/([^/]+/[^/]+)/commits/([0-9a-f]{40})', 'get_commit'),
+        ('GET', r'/repos/([^/]+/[^/]+)/commits/([0-9a-f]{40})/check-runs', 'list_check_runs'),
+        ('POST', r'/graphql', 'graphql'),
+    ]
+    ROUTES = [(verb, re.compile(pattern + '$'), name) for verb, pattern, name in ROUTES]
+
+    def log_message(self, format, *args):
+        logging.debug('%s %s' % (self.address_string(), format % args))
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def do_PATCH(self):
+        self.dispatch('PATCH')
+
+    def do_PUT(self):
+        self.dispatch('PUT')
+
+    def do_DELETE(self):
+        self.dispatch('DELETE')
+
+    @property
+    def token(self):
+        auth = self.headers.get('Authorization') or ''
+        return auth.split(None, 1)[-1] if auth else 'anonymous'
+
+    def dispatch(self, verb):
+        server = self.server
+        server.count('requests')
+
+        parsed = urlparse(self.path)
+        self.query = {k: v[-1] for k, v in parse_qs(parsed.query).items()}
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        self.payload = json.loads(body) if body else None
+        resource = 'graphql' if parsed.path == '/graphql' else 'core'
+
+        server.delay()
+
+        if server.error_rate and server.rng.random() < server.error_rate:
+            server.count('errors')
+            return self.reply(502, {'message': 'Server Error'}, resource=resource)
+
+        for route_verb, pattern, name in self.ROUTES:
+            match = pattern.match(parsed.path)
+            if match and route_verb == verb:
+                break
+        else:
+            return self.reply(404, {'message': 'Not Found'}, resource=resource)
+
+        if parsed.path != '/rate_limit' and not server.budget.spend(self.token, resource):
+            server.count('rate_limited')
+            return self.reply(403, {
+                'message': 'API rate limit exceeded for %s.' % self.token,
+                'documentation_url': 'https://docs.github.com/rest/overview/resources-in-the-rest-api#rate-limiting',
+            }, resource=resource)
+
+        try:
+            result = getattr(self, name)(*[unquote(x) for x in match.groups()])
+        except HttpError as e:
+            return self.reply(e.status, {'message': e.message}, resource=resource)
+
+        status, data, links = 200, result, None
+        if isinstance(result, tuple):
+            status, data, links = (result + (None,))[:3]
+        self.reply(status, data, resource=resource, links=links)
+
+    def reply(self, status, data, resource='core', links=None):
+        body = b'' if data is None else json.dumps(data).encode('utf-8')
+        headers = {'Content-Type': 'application/json; charset=utf-8'}
+        headers.update(self.server.budget.headers(self.token, resource))
+
+        if self.command == 'GET' and status == 200:
+            etag = '"%s"' % hashlib.sha1(body).hexdigest()
+            headers['ETag'] = etag
+            if self.headers.get('If-None-Match') == etag:
+                self.server.count('not_modified')
+                status, body = 304, b''
+        if links:
+            headers['Link'] = ', '.join('<%s>; rel="%s"' % (url, rel) for rel, url in links.items())
+
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    # helpers
+
+    def repo_item(self, repo_name, number, pullrequest=None):
+        repo = self.server.get_repo(repo_name)
+        item = repo.get(int(number))
+        if item is None or (pullrequest is True and item['type'] != 'pullrequest'):
+            raise HttpError(404, 'Not Found')
+        return repo, item
+
+    def paginate(self, items):
+        per_page = min(100, int(self.query.get('per_page', 30)))
+        page = max(1, int(self.query.get('page', 1)))
+        pages = max(1, (len(items) + per_page - 1) // per_page)
+
+        links = {}
+        base = self.server.base_url + urlparse(self.path).path
+        if page < pages:
+            links['next'] = '%s?%s' % (base, urlencode(dict(self.query, page=page + 1)))
+            links['last'] = '%s?%s' % (base, urlencode(dict(self.query, page=pages)))
+        if page > 1:
+            links['prev'] = '%s?%s' % (base, urlencode(dict(self.query, page=page - 1)))
+            links['first'] = '%s?%s' % (base, urlencode(dict(self.query, page=1)))
+
+        return 200, items[(page - 1) * per_page:page * per_page], links
+
+    # endpoints
+
+    def rate_limit(self):
+        resources = self.server.budget.resources(self.token)
+        return {'resources': resources, 'rate': resources['core']}
+
+    def get_repository(self, repo_name):
+        return self.server.repository(self.server.get_repo(repo_name))
+
+    def list_repo_labels(self, repo_name):
+        repo = self.server.get_repo(repo_name)
+        return self.paginate([self.server.label(repo, x) for x in LABELS])
+
+    def list_assignees(self, repo_name):
+        self.server.get_repo(repo_name)
+        return self.paginate([self.server.user('maintainer%s' % x) for x in range(10)])
+
+    def list_issues(self, repo_name):
+        repo = self.server.get_repo(repo_name)
+        state = self.query.get('state', 'open')
+        items = [x for x in repo.items.values() if state == 'all' or x['state'] == state]
+        if self.query.get('since'):
+            since = datetime.datetime.strptime(self.query['since'][:19], '%Y-%m-%dT%H:%M:%S')
+            since = since.replace(tzinfo=datetime.timezone.utc).timestamp()
+            items = [x for x in items if x['updated'] >= since]
+        key = 'updated' if self.query.get('sort') == 'updated' else 'created'
+        items.sort(key=lambda x: x[key], reverse=self.query.get('direction', 'desc') == 'desc')
+        status, page, links = self.paginate(items)
+        return status, [self.server.issue(repo, x) for x in page], links
+
+    def get_issue(self, repo_name, number):
+        repo, item = self.repo_item(repo_name, number)
+        return self.server.issue(repo, item)
+
+    def edit_issue(self, repo_name, number):
+        repo, item = self.repo_item(repo_name, number)
+        repo.edit(item, self.payload or {})
+        return self.server.issue(repo, item)
+
+    def list_timeline(self, repo_name, number):
+        repo, item = self.repo_item(repo_name, number)
+        return self.paginate(repo.timeline(item))
+
+    def list_comments(self, repo_name, number):
+        repo, item = self.repo_item(repo_name, number)
+        comments = [x for x in repo.timeline(item) if x['event'] == 'commented']
+        return self.paginate([self.server.comment(repo, item, dict(x, user=x.get('user') or x['actor'])) for x in comments])
+
+    def create_comment(self, repo_name, number):
+        repo, item = self.repo_item(repo_name, number)
+        comment = repo.add_comment(item, (self.payload or {}).get('body', ''))
+        return 201, self.server.comment(repo, item, comment)
+
+    def delete_comment(self, repo_name, comment_id):
+        repo = self.server.get_repo(repo_name)
+        if not repo.delete_comment(int(comment_id)):
+            raise HttpError(404, 'Not Found')
+        return 204, None
+
+    def list_labels(self, repo_name, number):
+        repo, item = self.repo_item(repo_name, number)
+        return self.paginate([self.server.label(repo, x) for x in item['labels']])
+
+    def add_labels(self, repo_name, number):
+        repo, item = self.repo_item(repo_name, number)
+        labels = self.payload or []
+        if isinstance(labels, dict):
+            labels = labels.get('labels', [])
+        repo.add_labels(item, labels)
+        return [self.server.label(repo, x) for x in item['labels']]
+
+    def set_labels(self, repo_name, number):
+        repo, item = self.repo_item(repo_name, number)
+        labels = self.payload or []
+        if isinstance(labels, dict):
+            labels = labels.get('labels', [])
+        for label in [x for x in item['labels'] if x not in labels]:
+            repo.remove_label(item, label)
+        repo.add_labels(item, labels)
+        return [self.server.label(repo, x) for x in item['labels']]
+
+    def remove_label(self, repo_name, number, label):
+        repo, item = self.repo_item(repo_name, number)
+        if not repo.remove_label(item, label):
+            raise HttpError(404, 'Label does not exist')
+        return [self.server.label(repo, x) for x in item['labels']]
+
+    def add_assignees(self, repo_name, number):
+        repo, item = self.repo_item(repo_name, number)
+        assignees = sorted(set(item['assignees']) | set((self.payload or {}).get('assignees', [])))
+        repo.edit(item, {'assignees': assignees})
+        return 201, self.server.issue(repo, item)
+
+    def get_pull(self, repo_name, number):
+        repo, item = self.repo_item(repo_name, number, pullrequest=True)
+        return self.server.pull(repo, item)
+
+    def list_commits(self, repo_name, number):
+        repo, item = self.repo_item(repo_name, number, pullrequest=True)
+        return self.paginate([dict(x, url='%s/repos/%s/commits/%s' % (self.server.base_url, repo.full_name, x['sha']))
+                              for x in repo.commits(item)])
+
+    def list_files(self, repo_name, number):
+        repo, item = self.repo_item(repo_name, number, pullrequest=True)
+        return self.paginate(repo.files(item))
+
+    def list_reviews(self, repo_name, number):
+        repo, item = self.repo_item(repo_name, number, pullrequest=True)
+        return self.paginate(repo.reviews(item))
+
+    def merge_pull(self, repo_name, number):
+        repo, item = self.repo_item(repo_name, number, pullrequest=True)
+        repo.merge(item)
+        return {'merged': True, 'message': 'Pull Request successfully merged', 'sha': sha(repo.full_name, 'merge', number)}
+
+    def _find_commit(self, repo_name, commit_sha):
+        repo = self.server.get_repo(repo_name)
+        for item in repo.items.values():
+            if item['type'] != 'pullrequest':
+                continue
+            for commit in repo.commits(item):
+                if commit['sha'] == commit_sha:
+                    return repo, item, commit
+        raise HttpError(404, 'No commit found for SHA: %s' % commit_sha)
+
+    def get_commit(self, repo_name, commit_sha):
+        repo, item, commit = self._find_commit(repo_name, commit_sha)
+        return dict(commit, files=repo.files(item))
+
+    def list_check_runs(self, repo_name, commit_sha):
+        repo, item, commit = self._find_commit(repo_name, commit_sha)
+        runs = repo.check_runs(item)
+        return {'total_count': len(runs), 'check_runs': runs}
+
+    def graphql(self):
+        query = (self.payload or {}).get('query') or ''
+        try:
+            return {'data': self.server.graphql.execute(query)}
+        except HttpError as e:
+            return {'data': None, 'errors': [{'message': e.message}]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve a synthetic repository through a local GitHub api')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8642)
+    parser.add_argument('--repo', action='append', help='owner/name of a repository to serve [ansible/ansible]')
+    parser.add_argument('--issues', type=int, default=20000, help='issues per repository')
+    parser.add_argument('--pulls', type=int, default=10000, help='pullrequests per repository')
+    parser.add_argument('--open_ratio', type=float, default=0.3, help='share of open issues and pullrequests')
+    parser.add_argument('--events', type=int, default=20, help='mean timeline length')
+    parser.add_argument('--users', type=int, default=2000, help='distinct authors and commenters')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--latency_ms', type=float, default=0.0, help='delay every response by this much')
+    parser.add_argument('--jitter_ms', type=float, default=0.0, help='randomly add or take up to this much from the delay')
+    parser.add_argument('--rate_limit', type=int, default=5000, help='calls per token and resource per window')
+    parser.add_argument('--rate_window', type=int, default=3600, help='seconds until a rate limit window resets')
+    parser.add_argument('--error_rate', type=float, default=0.0, help='share of requests answered with a 502')
+    parser.add_argument('--debug', action='store_true')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO)
+
+    repos = []
+    for idx, full_name in enumerate(args.repo or ['ansible/ansible']):
+        logging.info('generating %s with %s issues and %s pullrequests' % (full_name, args.issues, args.pulls))
+        repos.append(SyntheticRepo(
+            full_name,
+            issues=args.issues,
+            pulls=args.pulls,
+            open_ratio=args.open_ratio,
+            events=args.events,
+            users=args.users,
+            seed=args.seed + idx,
+        ))
+
+    server = GithubSimulator(
+        (args.host, args.port),
+        repos,
+        latency=args.latency_ms / 1000.0,
+        jitter=args.jitter_ms / 1000.0,
+        rate_limit=args.rate_limit,
+        rate_window=args.rate_window,
+        error_rate=args.error_rate,
+        seed=args.seed,
+    )
+    logging.info('serving %s on %s' % (', '.join(sorted(server.repos)), server.base_url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        logging.info('served %s' % json.dumps(server.stats, sort_keys=True))
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,435 @@
+#!/usr/bin/env python
+'''Replay recorded issues and pullrequests through the triage pipeline
+
+Runs AnsibleTriager.process() and create_actions() over the yaml issue
+recordings in tests/fixtures (or any other corpus) against a local
+ansible checkout, without touching the network, and reports issues per
+second, per stage latency percentiles and peak RSS.
+
+    python -m benchmarks.triage_bench run --checkout ~/src/ansible --commit v2.13.0 --output base.json
+    git checkout my-branch
+    python -m benchmarks.triage_bench run --checkout ~/src/ansible --commit v2.13.0 --output head.json
+    python -m benchmarks.triage_bench compare base.json head.json
+'''
+
+import argparse
+import datetime
+import glob
+import json
+import logging
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+from collections import namedtuple
+
+import yaml
+
+import ansibullbot.constants as C
+
+from ansibullbot.ansibletriager import AnsibleActions, AnsibleTriager
+from ansibullbot.ci.base import BaseCI
+from ansibullbot.exceptions import NoCIError
+from ansibullbot.historywrapper import HistoryWrapper
+from ansibullbot.issuewrapper import IssueWrapper
+from ansibullbot.utils.git_tools import GitRepoWrapper
+from ansibullbot.utils.instrumentation import STATS
+
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tests', 'fixtures')
+
+PERCENTILES = (50, 90, 99)
+
+Ref = namedtuple('Ref', ['sha', 'ref', 'repo'])
+Committer = namedtuple('Committer', ['date', 'login'])
+GitCommit = namedtuple('GitCommit', ['committer', 'message'])
+
+
+class ActorStub:
+    def __init__(self, login):
+        self.id = None
+        self.login = login
+
+
+class LabelStub:
+    def __init__(self, name):
+        self.name = name
+
+
+class CommitStub:
+    '''A recorded commit event with the api data of its files'''
+
+    def __init__(self, event):
+        self.commit = GitCommit(committer=Committer(date=event['created_at'], login=event['actor']['login']), message='')
+        self.committer = self.commit.committer
+        self.sha = None
+        self.files = [file_data(x) for x in event.get('files', [])] or None
+
+
+class RequesterStub:
+    '''Answers the reactions request with an empty list'''
+
+    def requestJson(self, method, url, headers=None):
+        return 200, {}, '[]'
+
+
+class IssueStub:
+    '''The pygithub issue of a yaml recording'''
+
+    def __init__(self, datafile):
+        with open(datafile, 'rb') as f:
+            ydata = yaml.safe_load(f.read()) or {}
+
+        self.assignee = None
+        self.body = ydata.get('body', '')
+        self.closed_at = None
+        self.closed_by = None
+        self.comments_url = None
+        self.created_at = ydata.get('created_at')
+        self.events = ydata.get('events', [])
+        self.events_url = None
+        self.files = None
+        self.html_url = ydata.get('html_url', 'https://github.com/ansible/ansible/issues/1')
+        self.number = self.id = int(ydata.get('number', 1))
+        self.labels_url = None
+        self.milestone = None
+        self.pull_request = None
+        self.repository = None
+        self.reactions = []
+        self.state = ydata.get('state', 'open')
+        self.title = ydata.get('title', '')
+        self.updated_at = None
+        self.url = 'https://api.github.com/repos/ansible/ansible/issues/%s' % self.number
+        self.user = ActorStub(ydata.get('submitter', 'nobody'))
+        self._identity = self.number
+        self._requester = RequesterStub()
+
+        self.commits = [CommitStub(x) for x in self.events if x['event'] == 'committed']
+        # labels are only ever added in the recordings
+        self.labels = []
+        for event in self.events:
+            if event['event'] == 'labeled' and event['label']['name'] not in [x.name for x in self.labels]:
+                self.labels.append(LabelStub(event['label']['name']))
+
+    def get_events(self):
+        return self.events
+
+    def is_pullrequest(self):
+        return 'pull' in self.html_url
+
+
+class PullRequestStub:
+    '''The PR data the plugins read, for a clean and mergeable PR'''
+
+    def __init__(self, issue, sha):
+        self.state = issue.state
+        self.draft = False
+        self.mergeable = True
+        self.mergeable_state = 'clean'
+        # the version indexer looks the base up in the checkout
+        self.head = Ref(sha=sha, ref='feature', repo=None)
+        self.base = Ref(sha=sha, ref='devel', repo=None)
+        self.raw_data = {'author_association': 'CONTRIBUTOR'}
+
+    def get_reviews(self):
+        return []
+
+    def get_commits(self):
+        return []
+
+
+class FileStub:
+    '''A pullrequest file as the api returns it'''
+
+    def __init__(self, raw_data):
+        self.filename = raw_data['filename']
+        self.status = raw_data['status']
+        self.patch = raw_data['patch']
+        self.raw_data = raw_data
+
+
+def file_data(cfile):
+    '''The api data of a recorded commit file'''
+    return {
+        'filename': cfile['filename'],
+        'status': cfile['status'],
+        'patch': cfile['patch'],
+        'changes': len((cfile['patch'] or '').splitlines()),
+    }
+
+
+class SubRepoStub:
+    def __init__(self):
+        self.assignees = []
+
+    def has_in_assignees(self, user):
+        return user in self.assignees
+
+
+class RepoStub:
+    '''A repo without assignees, with the labels the corpus uses'''
+
+    def __init__(self, labels):
+        self.repo = SubRepoStub()
+        self.repo_path = 'ansible/ansible'
+        self.assignees = []
+        self.labels = labels
+
+    def get_issue(self, number):
+        return None
+
+    def get_pullrequest(self, number):
+        return namedtuple('PullRequest', ['draft'])(draft=False)
+
+    def has_in_assignees(self, login):
+        return True
+
+    def is_pr_merged(self, number):
+        return False
+
+
+class CIStub(BaseCI):
+    '''A PR without any CI run, rebuilds and cancels are only recorded'''
+
+    name = 'offline'
+    state = None
+    updated_at = None
+    last_run = None
+    build_id = None
+
+    def __init__(self):
+        self.calls = []
+
+    def get_last_full_run_date(self):
+        raise NoCIError('no CI when replaying offline')
+
+    def get_test_results(self):
+        return False, []
+
+    def rebuild(self, run_id, failed_only=False):
+        self.calls.append(('rebuild', run_id, failed_only))
+
+    def cancel(self, run_id):
+        self.calls.append(('cancel', run_id))
+
+    def cancel_on_branch(self, branch):
+        self.calls.append(('cancel_on_branch', branch))
+
+
+def find_corpus(paths):
+    '''Return the recorded issue files under each path'''
+    files = []
+    for path in paths:
+        if os.path.isfile(path):
+            files.append(path)
+        else:
+            files.extend(glob.glob(os.path.join(path, '**', '*_issue.yml'), recursive=True))
+    return sorted(files)
+
+
+def load_issue(datafile, cachedir, gitrepo, sha, repo):
+    '''Build an IssueWrapper from a recording without any api calls'''
+    issue = IssueStub(datafile)
+
+    iw = IssueWrapper(repo=repo, cachedir=cachedir, issue=issue, gitrepo=gitrepo)
+    iw._events = iw._parse_events(issue.events)
+    iw._commits = issue.commits
+    if iw.is_pullrequest():
+        iw._pr = PullRequestStub(issue, sha)
+        iw._pr_reviews = []
+        # the newest version of each file the recorded commits touch
+        iw._pr_files = []
+        for commit in sorted(iw._commits, key=lambda x: x.commit.committer.date, reverse=True):
+            if commit.files is None:
+                continue
+            for cfile in commit.files:
+                if cfile['filename'] not in [x.filename for x in iw._pr_files]:
+                    iw._pr_files.append(FileStub(cfile))
+        # the recorded commits carry no raw data to find renames in
+        iw._renamed_files = {}
+        iw._merge_commits = []
+        iw._committer_emails = []
+    else:
+        iw.load_update_fetch_files = lambda: []
+
+    iw._history = HistoryWrapper(iw.events, iw.labels, iw.updated_at, cachedir=cachedir, usecache=False)
+    if iw._commits:
+        iw._history.merge_commits(iw._commits)
+
+    return iw
+
+
+def percentile(samples, pct):
+    '''Nearest rank percentile'''
+    if not samples:
+        return None
+    samples = sorted(samples)
+    rank = max(1, int(round(pct / 100.0 * len(samples))))
+    return samples[rank - 1]
+
+
+def stage_walls():
+    return {name: data['wall'] for name, data in STATS.snapshot().items()}
+
+
+def run(args):
+    corpus = find_corpus(args.corpus or [DEFAULT_CORPUS])
+    if not corpus:
+        sys.exit('no recorded issues found in %s' % (args.corpus or [DEFAULT_CORPUS]))
+
+    cachedir = tempfile.mkdtemp(prefix='ansibullbot_bench_')
+    try:
+        gitrepo = GitRepoWrapper(cachedir, os.path.abspath(os.path.expanduser(args.checkout)), commit=args.commit)
+
+        triager = AnsibleTriager(args=[
+            '--cachedir=%s' % cachedir,
+            '--dry-run',
+            '--force',
+            '--ignore_galaxy',
+            '--ignore_module_commits',
+        ])
+        # the maintainer team comes from the github api
+        triager._maintainer_team = []
+        # the triager logs every step at info, which would dominate the timings
+        logging.getLogger().setLevel(logging.WARNING)
+
+        STATS.reset()
+        ts = time.perf_counter()
+        triager.build_indexers({'gitrepo': gitrepo})
+        index_time = time.perf_counter() - ts
+        head = gitrepo.head
+
+        repo = RepoStub(args.labels)
+        samples = {}
+        errors = {}
+        count = 0
+        elapsed = 0.0
+        for iteration in range(args.iterations):
+            for datafile in corpus:
+                issuedir = tempfile.mkdtemp(dir=cachedir)
+                iw = load_issue(datafile, issuedir, gitrepo, head, repo)
+                labels = sorted(set(iw.labels) | set(repo.labels))
+
+                before = stage_walls()
+                ts = time.perf_counter()
+                try:
+                    triager.ci = CIStub() if iw.is_pullrequest() else None
+                    triager.fact_memo = {}
+                    with STATS.stage('process'):
+                        triager.process(iw, labels)
+                    with STATS.stage('create_actions'):
+                        triager.create_actions(iw, AnsibleActions(), labels)
+                except Exception as e:
+                    logging.warning('replaying %s failed' % datafile, exc_info=True)
+                    errors.setdefault(datafile, repr(e))
+                    continue
+                finally:
+                    shutil.rmtree(issuedir)
+                elapsed += time.perf_counter() - ts
+                count += 1
+
+                for name, wall in stage_walls().items():
+                    samples.setdefault(name, []).append(wall - before.get(name, 0.0))
+
+        result = {
+            'created_at': datetime.datetime.now().isoformat(),
+            'bot_version': C.ANSIBULLBOT_VERSION,
+            'checkout_commit': head,
+            'corpus': len(corpus),
+            'iterations': args.iterations,
+            'issues': count,
+            'errors': errors,
+            'index_seconds': index_time,
+            'seconds': elapsed,
+            'issues_per_second': count / elapsed if elapsed else None,
+            'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            'stages': {
+                name: dict(
+                    [('count', len(values)), ('mean', sum(values) / len(values))] +
+                    [('p%s' % x, percentile(values, x)) for x in PERCENTILES]
+                ) for name, values in samples.items()
+            },
+        }
+    finally:
+        shutil.rmtree(cachedir)
+
+    print_result(result)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2, sort_keys=True)
+    return 1 if result['errors'] else 0
+
+
+def print_result(result):
+    print('bot %s, ansible %s' % (result['bot_version'], result['checkout_commit']))
+    print('%s issues in %.2fs, %.1f issues/s, indexers built in %.2fs, peak rss %s KB' % (
+        result['issues'], result['seconds'], result['issues_per_second'] or 0,
+        result['index_seconds'], result['peak_rss_kb'],
+    ))
+    for datafile, error in sorted(result['errors'].items()):
+        print('error replaying %s: %s' % (datafile, error))
+
+    print('%-32s %7s' % ('stage', 'count') + ''.join(' %9s' % ('p%s' % x) for x in PERCENTILES))
+    stages = result['stages']
+    for name in sorted(stages, key=lambda x: stages[x]['mean'], reverse=True):
+        print('%-32s %7d' % (name, stages[name]['count']) + ''.join(
+            ' %8.2fms' % (stages[name]['p%s' % x] * 1000) for x in PERCENTILES
+        ))
+
+
+def compare(args):
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.head) as f:
+        head = json.load(f)
+
+    regressed = False
+
+    ratio = (head['issues_per_second'] or 0) / (base['issues_per_second'] or 1)
+    print('issues/s: %.1f -> %.1f (%+.1f%%)' % (base['issues_per_second'] or 0, head['issues_per_second'] or 0, (ratio - 1) * 100))
+    if ratio < 1 - args.threshold / 100.0:
+        regressed = True
+    print('peak rss: %s KB -> %s KB' % (base['peak_rss_kb'], head['peak_rss_kb']))
+
+    print('%-32s %12s %12s %9s' % ('stage', 'base p50', 'head p50', 'change'))
+    for name in sorted(set(base['stages']) | set(head['stages'])):
+        old = base['stages'].get(name, {}).get('p50')
+        new = head['stages'].get(name, {}).get('p50')
+        if old is None or new is None:
+            print('%-32s %12s %12s' % (name, old is not None and '%.2fms' % (old * 1000) or '-', new is not None and '%.2fms' % (new * 1000) or '-'))
+            continue
+        change = (new - old) / old * 100 if old else 0.0
+        flag = ' <' if change > args.threshold else ''
+        print('%-32s %10.2fms %10.2fms %+8.1f%%%s' % (name, old * 1000, new * 1000, change, flag))
+
+    return 1 if regressed else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline triage benchmark')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='replay the corpus and report throughput')
+    run_parser.add_argument('--checkout', required=True, help='path to a local ansible git checkout')
+    run_parser.add_argument('--commit', help='pin the checkout to this commit')
+    run_parser.add_argument('--corpus', action='append', help='directory or file of recorded *_issue.yml issues [tests/fixtures]')
+    run_parser.add_argument('--iterations', type=int, default=3, help='replay the corpus N times')
+    run_parser.add_argument('--labels', action='append', default=[], help='extra labels the repo has')
+    run_parser.add_argument('--output', help='write the results to this json file')
+    run_parser.set_defaults(func=run)
+
+    compare_parser = subparsers.add_parser('compare', help='compare the results of two runs')
+    compare_parser.add_argument('base')
+    compare_parser.add_argument('head')
+    compare_parser.add_argument('--threshold', type=float, default=10.0, help='percent slowdown reported as a regression')
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    sys.exit(args.func(args))
+
+
+if __name__ == '__main__':
+    main()
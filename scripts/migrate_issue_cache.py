@@ -0,0 +1,32 @@
+#!/usr/bin/env python
+'''Import the per issue cache files into the single file issue stores
+
+    scripts/migrate_issue_cache.py ~/.ansibullbot/cache --remove
+'''
+
+import argparse
+import glob
+import logging
+import os
+
+from ansibullbot.utils.issue_store import migrate_issue_cache
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('cachedir', nargs='?', default='~/.ansibullbot/cache', help='the bot\'s --cachedir')
+    parser.add_argument('--remove', action='store_true', help='delete the files once they are in the store')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    cachedir = os.path.expanduser(args.cachedir)
+    for issuesdir in sorted(glob.glob(os.path.join(cachedir, '*', '*', 'issues'))):
+        repo_cachedir = os.path.dirname(issuesdir)
+        repo = os.path.relpath(repo_cachedir, cachedir)
+        count = migrate_issue_cache(repo_cachedir, repo, remove=args.remove)
+        logging.info('imported %s records for %s' % (count, repo))
+
+
+if __name__ == '__main__':
+    main()
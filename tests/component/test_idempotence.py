@@ -1,5 +1,3 @@
-import glob
-import json
 import logging
 import os
 
@@ -8,6 +6,7 @@ import pytest
 from tests.utils.componentmocks import BotMockManager
 
 from ansibullbot.ansibletriager import AnsibleTriager
+from ansibullbot.utils.issue_store import get_issue_store
 
 
 class TestIdempotence:
@@ -76,15 +75,12 @@ class TestIdempotence:
 
             print('# issuedb %s' % id(mm.issuedb))
 
-            # /tmp/ansibot.test.isxYlS/ansible/ansible/issues/1/meta.json                
-            metafiles = glob.glob('%s/*/meta.json' % os.path.join(mm.cachedir, 'ansible', 'ansible', 'issues'))
-            metafiles = sorted(metafiles)
-            for mf in metafiles:
+            store = get_issue_store(os.path.join(mm.cachedir, 'ansible', 'ansible'))
+            for number in store.numbers('ansible/ansible', 'meta'):
 
-                with open(mf) as f:
-                    meta = json.loads(f.read())
+                meta = store.get('ansible/ansible', number, 'meta')
 
-                print('checking %s' % mf)
+                print('checking %s' % number)
 
                 # ensure no actions were created on the last run
                 for k,v in meta['actions'].items():
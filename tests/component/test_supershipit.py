@@ -1,5 +1,3 @@
-import glob
-import json
 import os
 
 import pytest
@@ -9,6 +7,7 @@ from tests.utils.componentmocks import BotMockManager
 from tests.utils.componentmocks import get_custom_timestamp
 
 from ansibullbot.ansibletriager import AnsibleTriager
+from ansibullbot.utils.issue_store import get_issue_store
 
 
 class TestSuperShipit:
@@ -79,17 +78,12 @@ class TestSuperShipit:
             AT = AnsibleTriager(args=bot_args)
             AT.run()
 
-            # /tmp/ansibot.test.isxYlS/ansible/ansible/issues/1/meta.json                
-            metafiles = glob.glob('%s/*/meta.json' % os.path.join(mm.cachedir, 'ansible', 'ansible', 'issues'))
-            metafiles = sorted(metafiles)
-            for mf in metafiles:
+            store = get_issue_store(os.path.join(mm.cachedir, 'ansible', 'ansible'))
+            for number in store.numbers('ansible/ansible', 'meta'):
 
-                number = int(mf.split('/')[-2])
+                meta = store.get('ansible/ansible', number, 'meta')
 
-                with open(mf) as f:
-                    meta = json.loads(f.read())
-
-                print(mf)
+                print(number)
                 print('shipit: %s' % ('shipit' in meta['actions']['newlabel']))
                 print('automerge: %s' % ('automerge' in meta['actions']['newlabel']))
                 print('merge: %s' % meta['actions']['merge'])
@@ -1,6 +1,6 @@
 from unittest.mock import patch
 
-from ansibullbot.utils.github import get_rate_limit
+from ansibullbot.utils.github import TokenPool, get_rate_limit
 
 
 class RequestsResponseMock:
@@ -23,8 +23,8 @@ def SleepMock(duration):
 @patch('ansibullbot.utils.github.C.DEFAULT_GITHUB_TOKEN', 'abcde12345')
 @patch('ansibullbot.utils.github.C.DEFAULT_GITHUB_URL', None)
 @patch('ansibullbot.utils.github.time.sleep', SleepMock)
-@patch('ansibullbot.utils.github.requests.get')
-def test_get_rate_limit(mock_requests_get):
+@patch('ansibullbot.utils.github.get_session')
+def test_get_rate_limit(mock_get_session):
 
     '''Basic check of get_rate_limit api'''
 
@@ -39,7 +39,7 @@ def test_get_rate_limit(mock_requests_get):
             }
         }
     }
-    mock_requests_get.return_value = rr
+    mock_get_session.return_value.get.return_value = rr
 
     limit = get_rate_limit()
 
@@ -51,3 +51,39 @@ def test_get_rate_limit(mock_requests_get):
     assert 'reset' in limit['resources']['core']
     assert limit['resources']['core']['limit'] == 5000
     assert limit['resources']['core']['remaining'] == 5000
+
+
+def _headers(remaining, reset=2**40):
+    return {
+        'x-ratelimit-limit': '5000',
+        'x-ratelimit-remaining': str(remaining),
+        'x-ratelimit-reset': str(reset),
+        'x-ratelimit-resource': 'core',
+    }
+
+
+@patch('ansibullbot.utils.github.ADB')
+@patch.dict('ansibullbot.utils.github._LIMITERS', clear=True)
+def test_token_pool_picks_largest_budget(mock_adb):
+    mock_adb.get_rate_limit_rawjson.return_value = None
+    pool = TokenPool(['a', 'b', 'a', None])
+    assert pool.tokens == ['a', 'b']
+
+    pool.update('a', _headers(200))
+    pool.update('b', _headers(4000))
+    assert pool.acquire() == 'b'
+    assert pool.remaining() == 200 + 3999
+
+    # the budgets are written back to the rate_limit table
+    tokens = [x[1]['token'] for x in mock_adb.set_rate_limit.call_args_list]
+    assert tokens == ['a', 'b']
+
+
+@patch('ansibullbot.utils.github.ADB')
+@patch.dict('ansibullbot.utils.github._LIMITERS', clear=True)
+def test_token_pool_prefers_earliest_reset_when_exhausted(mock_adb):
+    mock_adb.get_rate_limit_rawjson.return_value = None
+    pool = TokenPool(['a', 'b'])
+    pool.update('a', _headers(0, reset=2**40))
+    pool.update('b', _headers(0, reset=2**39))
+    assert pool.choose() == 'b'
@@ -0,0 +1,66 @@
+import threading
+
+from unittest import mock
+
+import pytest
+
+from benchmarks.github_sim import GithubSimulator, SyntheticRepo
+
+from ansibullbot.ghapiwrapper import GithubWrapper, RepoWrapper
+from ansibullbot.utils.gh_gql_client import GithubGraphQLClient
+from ansibullbot.utils.issue_store import flush_issue_stores
+from ansibullbot.utils.net_tools import get_session
+from ansibullbot.utils.sqlite_utils import AnsibullbotDatabase
+
+
+@pytest.fixture
+def simulator():
+    repo = SyntheticRepo('ansible/ansible', issues=20, pulls=10, events=5, users=10)
+    server = GithubSimulator(('127.0.0.1', 0), [repo])
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        # drop the keep-alive connections before the server goes away
+        get_session().close()
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def adb(tmp_path):
+    unc = 'sqlite:///%s/test.db' % tmp_path
+    with mock.patch('ansibullbot.utils.sqlite_utils.C.DEFAULT_DATABASE_UNC', unc):
+        adb = AnsibullbotDatabase(cachedir=str(tmp_path))
+    with mock.patch('ansibullbot.ghapiwrapper.ADB', adb):
+        yield adb
+
+
+@mock.patch('ansibullbot.utils.gh_gql_client.post_to_receiver', mock.Mock())
+def test_graphql_client_against_the_simulator(simulator):
+    gqlc = GithubGraphQLClient('token', server=simulator.base_url)
+
+    summaries = gqlc.get_issue_summaries('ansible/ansible')
+    open_numbers = summaries.select(state='open')
+    assert open_numbers
+    assert summaries.select(type='pullrequest')
+
+    numbers = sorted(open_numbers)[:5]
+    hydrated = gqlc.hydrate_issues('ansible/ansible', numbers)
+    assert sorted(hydrated) == numbers
+    for data in hydrated.values():
+        assert isinstance(data['labels'], list)
+
+
+def test_rest_api_against_the_simulator(simulator, adb, tmp_path):
+    ghw = GithubWrapper(url=simulator.base_url, token='token', cachedir=str(tmp_path))
+    repo = RepoWrapper(ghw.gh, 'ansible/ansible', cachedir=str(tmp_path))
+
+    issue = repo.get_issue(1)
+    assert issue.number == 1
+    assert ghw.get_request(issue.url + '/timeline')
+
+    flush_issue_stores()
+    # PyGithub keeps its connection open for as long as the requester lives
+    ghw.gh._Github__requester._Requester__connection.session.close()
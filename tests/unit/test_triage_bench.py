@@ -0,0 +1,59 @@
+import argparse
+import json
+import logging
+import os
+import subprocess
+
+from benchmarks import triage_bench
+
+
+BOTMETA = '''
+macros:
+  team_core: bcoca
+files:
+  lib/ansible/modules/ping.py:
+    maintainers: jdoe
+'''
+
+
+def _checkout(path):
+    os.makedirs(os.path.join(path, '.github'))
+    os.makedirs(os.path.join(path, 'lib', 'ansible', 'modules'))
+    with open(os.path.join(path, '.github', 'BOTMETA.yml'), 'w') as f:
+        f.write(BOTMETA)
+    with open(os.path.join(path, 'lib', 'ansible', 'release.py'), 'w') as f:
+        f.write("__version__ = '2.14.0.dev0'\n")
+    with open(os.path.join(path, 'lib', 'ansible', 'modules', 'ping.py'), 'w') as f:
+        f.write("'''ping'''\n")
+
+    git = ['git', '-c', 'user.name=ansibot', '-c', 'user.email=ansibot@example.com']
+    subprocess.check_call(git + ['init', '-q'], cwd=path)
+    subprocess.check_call(git + ['add', '.'], cwd=path)
+    subprocess.check_call(git + ['commit', '-q', '-m', 'init'], cwd=path)
+    subprocess.check_call(git + ['tag', 'v2.13.0'], cwd=path)
+
+
+def test_run_replays_a_recorded_pullrequest(tmp_path):
+    checkout = str(tmp_path / 'ansible')
+    _checkout(checkout)
+    output = str(tmp_path / 'result.json')
+    args = argparse.Namespace(
+        corpus=[os.path.join(triage_bench.DEFAULT_CORPUS, 'shipit', '0_issue.yml')],
+        checkout=checkout,
+        commit=None,
+        iterations=1,
+        labels=[],
+        output=output,
+    )
+
+    level = logging.getLogger().level
+    try:
+        assert triage_bench.run(args) == 0
+    finally:
+        logging.getLogger().setLevel(level)
+
+    with open(output) as f:
+        result = json.load(f)
+    assert result['issues'] == 1
+    assert result['errors'] == {}
+    assert result['stages']['process']['count'] == 1
@@ -0,0 +1,94 @@
+import tempfile
+
+from unittest import mock
+
+import pytest
+
+from ansibullbot.defaulttriager import DefaultActions, DefaultTriager
+from ansibullbot.historywrapper import COMMENT_BREAK
+
+
+@pytest.fixture
+def triager():
+    with tempfile.TemporaryDirectory() as cachedir:
+        triager = DefaultTriager(args=['--cachedir=%s' % cachedir, '--force'])
+        triager.CLOSING_LABELS = ['bot_closed']
+        yield triager
+
+
+def _issue(labels, current=None):
+    iw = mock.Mock()
+    iw.labels = labels
+    iw.get_current_labels.return_value = list(labels if current is None else current)
+    return iw
+
+
+def test_relabel_is_one_call(triager):
+    iw = _issue(['bug', 'needs_triage', 'affects_2.9'])
+    actions = DefaultActions()
+    actions.unlabel = ['needs_triage', 'affects_2.9']
+    actions.newlabel = ['module', 'affects_2.12', 'support:core']
+
+    triager.execute_actions(iw, actions)
+
+    iw.set_labels.assert_called_once_with(['bug', 'module', 'affects_2.12', 'support:core'])
+    iw.add_labels.assert_not_called()
+    iw.close.assert_not_called()
+
+
+def test_labels_set_since_the_triage_are_kept(triager):
+    iw = _issue(['bug', 'needs_triage'], current=['bug', 'needs_triage', 'P2'])
+    actions = DefaultActions()
+    actions.unlabel = ['needs_triage']
+    actions.newlabel = ['module']
+
+    triager.execute_actions(iw, actions)
+
+    iw.set_labels.assert_called_once_with(['bug', 'P2', 'module'])
+
+
+def test_only_new_labels_are_added(triager):
+    iw = _issue(['bug'])
+    actions = DefaultActions()
+    actions.newlabel = ['module', 'bug']
+
+    triager.execute_actions(iw, actions)
+
+    iw.add_labels.assert_called_once_with(['module'])
+    iw.set_labels.assert_not_called()
+    iw.get_current_labels.assert_not_called()
+
+
+def test_close_sets_the_labels_and_state_together(triager):
+    iw = _issue(['bug', 'needs_info'])
+    actions = DefaultActions()
+    actions.close = True
+    actions.unlabel = ['needs_info']
+    actions.newlabel = ['bot_closed', 'module']
+
+    triager.execute_actions(iw, actions)
+
+    iw.close.assert_called_once_with(labels=['bug', 'bot_closed'])
+    iw.set_labels.assert_not_called()
+    iw.add_labels.assert_not_called()
+
+
+def test_comments_are_posted_as_one(triager):
+    iw = _issue([])
+    actions = DefaultActions()
+    actions.comments = ['first\n<!--- boilerplate: a --->', 'second\n<!--- boilerplate: b --->']
+
+    triager.execute_actions(iw, actions)
+
+    assert iw.add_comment.call_count == 1
+    comment = iw.add_comment.call_args[1]['comment']
+    assert comment.split(COMMENT_BREAK)[0].startswith('first')
+    assert comment.split(COMMENT_BREAK)[1].strip() == 'second\n<!--- boilerplate: b --->'
+    iw.set_labels.assert_not_called()
+    iw.add_labels.assert_not_called()
+
+
+def test_async_actions_require_force():
+    with tempfile.TemporaryDirectory() as cachedir:
+        with pytest.raises(ValueError):
+            DefaultTriager(args=['--cachedir=%s' % cachedir, '--async_actions'])
@@ -0,0 +1,56 @@
+import tempfile
+import time
+
+from functools import partial
+from unittest import mock
+
+from ansibullbot.ansibletriager import AnsibleTriager
+from ansibullbot.utils.issue_store import flush_issue_stores
+from ansibullbot.utils.prefetch import Prefetcher
+
+
+def test_prefetch_skips_what_triage_would_skip():
+    with tempfile.TemporaryDirectory() as cachedir:
+        triager = AnsibleTriager(args=['--cachedir=%s' % cachedir, '--dry-run'])
+        repodata = {'issuecache': mock.Mock(), 'repo': mock.Mock(), 'stale': [], 'summaries': {}}
+
+        with mock.patch.object(AnsibleTriager, '_inputs_unchanged', return_value=True):
+            assert triager.prefetch_number('ansible/ansible', repodata, 1) is None
+
+        repodata['issuecache'].get.assert_not_called()
+        repodata['repo'].get_issue.assert_not_called()
+
+
+def test_concurrent_prefetches_only_use_the_session_requests():
+    numbers = list(range(1, 9))
+    url = 'https://api.github.com/repos/ansible/ansible/issues/%s'
+
+    def get_request(request_url):
+        # let the other prefetches interleave with this one
+        time.sleep(0.01)
+        number = int(request_url.split('/')[-2])
+        return [{'id': number, 'event': 'labeled', 'created_at': '2021-01-01T00:00:00Z'}]
+
+    with tempfile.TemporaryDirectory() as cachedir:
+        triager = AnsibleTriager(args=['--cachedir=%s' % cachedir, '--dry-run', '--ignore_fingerprint'])
+        triager.ghw = mock.Mock()
+        triager.ghw.get_request.side_effect = get_request
+        repodata = {
+            'issuecache': {
+                x: mock.Mock(number=x, url=url % x, html_url='https://github.com/ansible/ansible/pull/%s' % x)
+                for x in numbers
+            },
+            'repo': mock.Mock(),
+            'gitrepo': None,
+            'stale': [],
+            'summaries': {str(x): {'updated_at': '2021-01-01T00:00:00Z'} for x in numbers},
+        }
+
+        prefetcher = Prefetcher(partial(triager.prefetch_number, 'ansible/ansible', repodata), numbers, lookahead=4)
+        prefetched = dict(prefetcher)
+
+        assert [prefetched[x].events[0]['id'] for x in numbers] == numbers
+        # the PyGithub objects are left for the triage thread
+        assert repodata['repo'].mock_calls == []
+
+        flush_issue_stores()
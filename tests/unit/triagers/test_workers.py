@@ -0,0 +1,55 @@
+import os
+import tempfile
+
+from unittest import mock
+
+import pytest
+
+from ansibullbot.ansibletriager import AnsibleTriager
+
+
+def _record_number(self, repopath, repodata, number):
+    with open(os.path.join(repodata['outdir'], str(number)), 'w') as f:
+        f.write(str(os.getpid()))
+
+
+def test_workers_require_force_or_dry_run():
+    with tempfile.TemporaryDirectory() as cachedir:
+        with pytest.raises(ValueError):
+            AnsibleTriager(args=['--cachedir=%s' % cachedir, '--workers=2'])
+
+
+def test_run_workers_triages_each_number_once():
+    with tempfile.TemporaryDirectory() as cachedir:
+        triager = AnsibleTriager(args=['--cachedir=%s' % cachedir, '--workers=3', '--dry-run'])
+        triager._maintainer_team = []
+
+        outdir = os.path.join(cachedir, 'out')
+        os.makedirs(outdir)
+        repodata = {'numbers': list(range(1, 21)), 'outdir': outdir}
+
+        with mock.patch.object(AnsibleTriager, 'triage_number', _record_number):
+            triager.run_workers('ansible/ansible', repodata)
+
+        assert sorted(int(x) for x in os.listdir(outdir)) == repodata['numbers']
+
+
+def test_workers_can_not_run_with_async_actions():
+    with tempfile.TemporaryDirectory() as cachedir:
+        with pytest.raises(ValueError):
+            AnsibleTriager(args=['--cachedir=%s' % cachedir, '--workers=2', '--force', '--async_actions'])
+
+
+def test_run_workers_records_the_resume_position():
+    with tempfile.TemporaryDirectory() as cachedir:
+        triager = AnsibleTriager(args=['--cachedir=%s' % cachedir, '--workers=3', '--dry-run', '--resume'])
+        triager._maintainer_team = []
+
+        outdir = os.path.join(cachedir, 'out')
+        os.makedirs(outdir)
+        repodata = {'numbers': list(range(1, 21)), 'outdir': outdir}
+
+        with mock.patch.object(AnsibleTriager, 'triage_number', _record_number):
+            triager.run_workers('ansible/ansible', repodata)
+
+        assert triager.get_resume() == {'repo': 'ansible/ansible', 'number': 20}
@@ -0,0 +1,106 @@
+import json
+import tempfile
+
+from unittest import mock
+
+import pytest
+
+from ansibullbot.defaulttriager import DefaultTriager
+from ansibullbot.utils.action_queue import ActionExecutor
+from ansibullbot.utils.sqlite_utils import AnsibullbotDatabase
+
+
+@pytest.fixture
+def adb():
+    with tempfile.TemporaryDirectory() as cachedir:
+        unc = 'sqlite:///' + cachedir + '/test.db'
+        with mock.patch('ansibullbot.utils.sqlite_utils.C.DEFAULT_DATABASE_UNC', unc):
+            adb = AnsibullbotDatabase(cachedir=cachedir)
+        with mock.patch('ansibullbot.utils.action_queue.ADB', adb):
+            yield adb
+
+
+def _actions(**kwargs):
+    return json.dumps(kwargs, sort_keys=True)
+
+
+def test_newer_actions_supersede_pending_ones(adb):
+    assert adb.enqueue_actions('ansible/ansible', 1, 'a', _actions(newlabel=['bug']))
+    assert adb.enqueue_actions('ansible/ansible', 2, 'a', _actions(newlabel=['bug']))
+    assert adb.enqueue_actions('ansible/ansible', 1, 'b', _actions(newlabel=['feature']))
+
+    entries = adb.claim_actions()
+    assert [(x['number'], x['fingerprint'], x['actions']) for x in entries] == [
+        (2, 'a', {'newlabel': ['bug']}),
+        (1, 'b', {'newlabel': ['feature']}),
+    ]
+
+
+def test_same_actions_are_queued_once(adb):
+    assert adb.enqueue_actions('ansible/ansible', 1, 'a', _actions(close=True))
+    assert not adb.enqueue_actions('ansible/ansible', 1, 'a', _actions(close=True))
+
+    # nor while they are being executed
+    assert len(adb.claim_actions()) == 1
+    assert not adb.enqueue_actions('ansible/ansible', 1, 'a', _actions(close=True))
+
+
+def test_a_number_is_claimed_once_its_previous_actions_finished(adb):
+    adb.enqueue_actions('ansible/ansible', 1, 'a', _actions(newlabel=['bug']))
+    first = adb.claim_actions()
+    adb.enqueue_actions('ansible/ansible', 1, 'b', _actions(unlabel=['bug']))
+
+    assert adb.claim_actions() == []
+    adb.finish_actions(first[0]['id'])
+    assert [x['fingerprint'] for x in adb.claim_actions()] == ['b']
+
+
+def test_failed_actions_are_retried_then_dropped(adb):
+    adb.enqueue_actions('ansible/ansible', 1, 'a', _actions(close=True))
+    execute = mock.Mock(side_effect=Exception('boom'))
+    executor = ActionExecutor(execute, max_attempts=2, retry_delay=0)
+
+    executor.execute_entry(adb.claim_actions()[0])
+    entries = adb.claim_actions()
+    assert entries[0]['attempts'] == 1
+
+    executor.execute_entry(entries[0])
+    assert adb.claim_actions() == []
+    assert execute.call_count == 2
+
+
+def test_stop_drains_the_due_actions(adb):
+    adb.enqueue_actions('ansible/ansible', 1, 'a', _actions(close=True))
+    adb.enqueue_actions('ansible/ansible', 2, 'a', _actions(close=True))
+    executed = []
+    executor = ActionExecutor(lambda entry: executed.append(entry['number']), interval=0.01)
+    executor.start()
+    executor.stop(timeout=10)
+
+    assert not executor.is_alive()
+    assert executed == [1, 2]
+
+
+def test_retries_resume_after_the_executed_steps(adb):
+    with tempfile.TemporaryDirectory() as cachedir:
+        triager = DefaultTriager(args=['--cachedir=%s' % cachedir, '--force'])
+    triager.action_repos['ansible/ansible'] = mock.Mock()
+    iw = mock.Mock()
+    iw.labels = ['needs_triage']
+    iw.get_current_labels.return_value = ['needs_triage']
+    iw.set_labels.side_effect = [Exception('boom'), None]
+
+    adb.enqueue_actions('ansible/ansible', 1, 'a', _actions(
+        comments=['hello'], unlabel=['needs_triage'], newlabel=['bug'], uncomment=[], close=False, merge=False
+    ))
+    executor = ActionExecutor(triager.execute_queued_actions, retry_delay=0)
+    with mock.patch('ansibullbot.defaulttriager.ADB', adb), \
+            mock.patch('ansibullbot.defaulttriager.IssueWrapper', return_value=iw):
+        executor.execute_entry(adb.claim_actions()[0])
+        entry = adb.claim_actions()[0]
+        assert entry['done'] == ['uncomment', 'comment']
+        executor.execute_entry(entry)
+
+    assert iw.add_comment.call_count == 1
+    assert iw.set_labels.call_count == 2
+    assert adb.claim_actions() == []
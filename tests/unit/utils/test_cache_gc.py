@@ -0,0 +1,56 @@
+import datetime
+import os
+import time
+
+from ansibullbot.utils.cache_gc import CacheNamespace, collect_closed_issues, collect_namespace
+from ansibullbot.utils.issue_store import get_issue_store
+from ansibullbot.utils.summary_store import SummaryStore
+
+
+def _write(path, size, days_old):
+    path.write_binary(b'x' * size, ensure=True)
+    ts = time.time() - days_old * 86400
+    os.utime(str(path), (ts, ts))
+
+
+def test_old_files_go_first_then_the_least_recently_used(tmpdir):
+    runs = tmpdir.join('azp.runs')
+    _write(runs.join('timeline_1.pickle'), 100, days_old=20)
+    _write(runs.join('timeline_2.pickle'), 100, days_old=3)
+    _write(runs.join('timeline_3.pickle'), 100, days_old=2)
+    _write(runs.join('timeline_4.pickle'), 100, days_old=1)
+
+    namespace = CacheNamespace('azp', ['azp.runs/*.pickle'], max_bytes=250, max_days=14)
+    assert collect_namespace(str(tmpdir), namespace) == 200
+    assert sorted(os.listdir(str(runs))) == ['timeline_3.pickle', 'timeline_4.pickle']
+
+
+def test_emptied_directories_are_removed(tmpdir):
+    _write(tmpdir.join('ansible', 'ansible', 'issues', '1', 'files.pickle'), 10, days_old=60)
+
+    namespace = CacheNamespace('issue_files', ['*/*/issues/*/*'], max_days=30)
+    assert collect_namespace(str(tmpdir), namespace) == 10
+    assert not tmpdir.join('ansible').exists()
+
+
+def test_closed_issues_are_evicted(tmpdir):
+    now = datetime.datetime.now(datetime.timezone.utc)
+    old = (now - datetime.timedelta(days=60)).strftime('%Y-%m-%dT%H:%M:%SZ')
+    store = SummaryStore(str(tmpdir), 'ansible/ansible')
+    store.summaries.update({
+        '1': {'number': 1, 'state': 'closed', 'updated_at': old, 'type': 'issue'},
+        '2': {'number': 2, 'state': 'open', 'updated_at': old, 'type': 'issue'},
+        '3': {'number': 3, 'state': 'closed', 'updated_at': now.strftime('%Y-%m-%dT%H:%M:%SZ'), 'type': 'issue'},
+        '4': {'number': 4, 'state': 'merged', 'updated_at': old, 'type': 'pullrequest'},
+    })
+    store.save()
+
+    issues = get_issue_store(str(tmpdir.join('ansible', 'ansible')))
+    for number in (1, 2, 3, 4):
+        issues.put('ansible/ansible', number, 'meta', {'body': 'x' * 100000})
+        issues.put('ansible/ansible', number, 'timeline', [str(x) * 1000 for x in range(100)])
+    issues.flush()
+
+    assert collect_closed_issues(str(tmpdir)) > 0
+    assert issues.numbers('ansible/ansible', 'meta') == [2, 3]
+    assert issues.numbers('ansible/ansible', 'timeline') == [2, 3]
@@ -0,0 +1,70 @@
+import threading
+
+import pytest
+
+from ansibullbot.utils.fact_graph import FactGraph, FactPlugin
+
+
+def _plugins(calls):
+    def record(name, facts):
+        def _func(meta):
+            calls.append(name)
+            return facts(meta)
+        return _func
+
+    return [
+        FactPlugin('a', record('a', lambda meta: {'x': 1, 'y': 1}), provides=('x', 'y')),
+        FactPlugin('b', record('b', lambda meta: {'z': meta['x'] + 1}), requires=('x',), provides=('z',)),
+        FactPlugin('c', record('c', lambda meta: {'y': 2, 'seen': sorted(meta)}), provides=('y',), inputs=('body',)),
+        FactPlugin('d', record('d', lambda meta: {'sum': meta['y'] + meta['z']}), requires=('y', 'z')),
+    ]
+
+
+def test_facts_merge_in_registration_order():
+    calls = []
+    graph = FactGraph(_plugins(calls))
+
+    assert graph.depends == [set(), {0}, set(), {0, 1, 2}]
+
+    meta = graph.run(inputs={'body': lambda: 'body'})
+    assert meta == {'x': 1, 'y': 2, 'z': 2, 'seen': [], 'sum': 4}
+    assert calls == ['a', 'b', 'c', 'd']
+
+
+def test_facts_concurrently():
+    calls = []
+    meta = FactGraph(_plugins(calls)).run(inputs={'body': lambda: 'body'}, workers=4)
+    assert meta == {'x': 1, 'y': 2, 'z': 2, 'seen': [], 'sum': 4}
+    assert sorted(calls) == ['a', 'b', 'c', 'd']
+
+
+def test_independent_facts_overlap():
+    barrier = threading.Barrier(2, timeout=5)
+
+    def _wait(meta):
+        barrier.wait()
+        return {}
+
+    graph = FactGraph([FactPlugin('a', _wait), FactPlugin('b', _wait)])
+    assert graph.run(workers=2) == {}
+
+
+def test_facts_are_memoized_by_inputs():
+    calls = []
+    memo = {}
+    body = ['one']
+    graph = FactGraph(_plugins(calls))
+
+    graph.run(inputs={'body': lambda: body[0]}, memo=memo)
+    graph.run(inputs={'body': lambda: body[0]}, memo=memo)
+    assert calls == ['a', 'b', 'c', 'd']
+
+    body[0] = 'two'
+    meta = graph.run(inputs={'body': lambda: body[0]}, memo=memo)
+    assert calls == ['a', 'b', 'c', 'd', 'c']
+    assert meta['sum'] == 4
+
+
+def test_plugin_names_are_unique():
+    with pytest.raises(ValueError):
+        FactGraph([FactPlugin('a', dict), FactPlugin('a', dict)])
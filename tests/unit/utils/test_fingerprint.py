@@ -0,0 +1,46 @@
+import datetime
+
+from ansibullbot.utils.fingerprint import get_fingerprint, time_bucket
+
+
+SUMMARY = {
+    'number': 1,
+    'updated_at': '2021-01-01T00:00:00Z',
+    'ci_updated_at': None,
+}
+
+META = {
+    'labels': ['needs_info'],
+    'history': [
+        {'event': 'labeled', 'label': 'needs_info', 'created_at': '2021-01-01T00:00:00+00:00'},
+    ],
+}
+
+
+def test_fingerprint_is_stable():
+    now = datetime.datetime(2021, 1, 2, tzinfo=datetime.timezone.utc)
+    fp = get_fingerprint(SUMMARY, META, 'abc', 'def', now=now)
+
+    assert fp == get_fingerprint(dict(SUMMARY), dict(META), 'abc', 'def', now=now)
+    assert fp != get_fingerprint(dict(SUMMARY, updated_at='2021-01-01T00:00:01Z'), META, 'abc', 'def', now=now)
+    assert fp != get_fingerprint(SUMMARY, META, 'abd', 'def', now=now)
+    assert fp != get_fingerprint(SUMMARY, META, 'abc', 'deg', now=now)
+
+
+def test_fingerprint_changes_when_a_timer_fires():
+    before = datetime.datetime(2021, 1, 2, tzinfo=datetime.timezone.utc)
+    later = datetime.datetime(2021, 1, 10, tzinfo=datetime.timezone.utc)
+    after = datetime.datetime(2021, 2, 1, tzinfo=datetime.timezone.utc)
+
+    assert time_bucket(META, SUMMARY, now=before) == 0
+    assert time_bucket(META, SUMMARY, now=after) == 1
+    assert get_fingerprint(SUMMARY, META, 'abc', 'def', now=before) == get_fingerprint(SUMMARY, META, 'abc', 'def', now=later)
+    assert get_fingerprint(SUMMARY, META, 'abc', 'def', now=before) != get_fingerprint(SUMMARY, META, 'abc', 'def', now=after)
+
+
+def test_ci_results_go_stale():
+    summary = dict(SUMMARY, ci_updated_at='2021-01-01T00:00:00Z')
+    now = datetime.datetime(2021, 1, 20, tzinfo=datetime.timezone.utc)
+
+    assert time_bucket({}, summary, now=now) == 1
+    assert time_bucket({}, SUMMARY, now=now) == 0
@@ -0,0 +1,226 @@
+from unittest import mock
+
+from ansibullbot.utils.gh_gql_client import GithubGraphQLClient
+
+
+def _issue_node(number, typename='Issue', has_next_page=False):
+    return {
+        '__typename': typename,
+        'number': number,
+        'state': 'OPEN',
+        'labels': {'nodes': [{'name': 'bug'}, {'name': 'needs_triage'}]},
+        'assignees': {'nodes': [{'login': 'jane'}]},
+        'timelineItems': {
+            'pageInfo': {'hasNextPage': has_next_page},
+            'nodes': [
+                {
+                    '__typename': 'IssueComment',
+                    'id': 'IC_1',
+                    'databaseId': 1001,
+                    'author': {'login': 'jane'},
+                    'body': 'needs_info',
+                    'createdAt': '2021-01-01T00:00:00Z',
+                },
+                {
+                    '__typename': 'LabeledEvent',
+                    'id': 'LE_1',
+                    'actor': None,
+                    'createdAt': '2021-01-02T00:00:00Z',
+                    'label': {'name': 'bug'},
+                },
+                {
+                    '__typename': 'CrossReferencedEvent',
+                    'id': 'CRE_1',
+                    'actor': {'login': 'joe'},
+                    'createdAt': '2021-01-03T00:00:00Z',
+                    'source': {'number': 5, 'url': 'https://github.com/ansible/ansible/pull/5'},
+                },
+            ],
+        },
+    }
+
+
+def _pull_node(number, runs_next_page=False):
+    node = _issue_node(number, typename='PullRequest')
+    node['reviews'] = {
+        'pageInfo': {'hasNextPage': False},
+        'nodes': [{
+            'databaseId': 2001,
+            'author': {'login': 'joe'},
+            'state': 'APPROVED',
+            'body': '',
+            'submittedAt': '2021-01-04T00:00:00Z',
+            'commit': {'oid': 'abc123'},
+        }],
+    }
+    node['commits'] = {'nodes': [{'commit': {'oid': 'abc123', 'checkSuites': {'pageInfo': {'hasNextPage': False}, 'nodes': [{
+        'checkRuns': {'pageInfo': {'hasNextPage': runs_next_page}, 'nodes': [{
+            'databaseId': 3001,
+            'name': 'CI',
+            'status': 'COMPLETED',
+            'conclusion': 'SUCCESS',
+            'detailsUrl': 'https://dev.azure.com/ansible/ansible/_build/results?buildId=1',
+        }]}
+    }]}}}]}
+    return node
+
+
+def test_hydrate_issues():
+    response = mock.Mock()
+    response.json.return_value = {'data': {'repository': {
+        'n1': _issue_node(1),
+        'n2': _pull_node(2),
+        'n3': None,
+        'n4': _issue_node(4, has_next_page=True),
+        'n5': _pull_node(5, runs_next_page=True),
+    }}}
+
+    gqlc = GithubGraphQLClient('token')
+    with mock.patch.object(gqlc, 'post_request', return_value=response) as post_request:
+        hydrated = gqlc.hydrate_issues('ansible/ansible', [1, 2, 3, 4, 5])
+
+    query = post_request.call_args[0][0]['query']
+    assert 'n1: issueOrPullRequest(number: 1)' in query
+    assert 'n4: issueOrPullRequest(number: 4)' in query
+
+    assert sorted(hydrated.keys()) == [1, 2, 4, 5]
+
+    assert hydrated[1]['type'] == 'issue'
+    assert hydrated[1]['labels'] == ['bug', 'needs_triage']
+    assert hydrated[1]['assignees'] == ['jane']
+    assert hydrated[1]['reviews'] is None
+    events = hydrated[1]['events']
+    assert [x['event'] for x in events] == ['commented', 'labeled', 'cross-referenced']
+    assert events[0]['id'] == 1001
+    assert events[0]['node_id'] == 'IC_1'
+    assert 'id' not in events[1]
+    assert events[1]['node_id'] == 'LE_1'
+    assert events[0]['actor'] == {'login': 'jane'}
+    assert events[1]['actor'] is None
+    assert events[1]['label'] == {'name': 'bug'}
+    assert events[2]['source']['issue']['html_url'] == 'https://github.com/ansible/ansible/pull/5'
+
+    assert hydrated[2]['type'] == 'pullrequest'
+    assert hydrated[2]['reviews'][0]['user'] == {'login': 'joe'}
+    assert hydrated[2]['reviews'][0]['commit_id'] == 'abc123'
+    assert hydrated[2]['check_runs'][0].details_url.endswith('buildId=1')
+    assert hydrated[2]['check_runs'][0].id == 3001
+    assert hydrated[2]['check_runs'][0].conclusion == 'success'
+
+    # the timeline did not fit in a single page
+    assert hydrated[4]['events'] is None
+
+    # nor did the check runs, they are left to the REST api
+    assert hydrated[5]['check_runs'] is None
+    assert hydrated[5]['reviews'] is not None
+
+
+def _summary_node(number, updated_at, state='OPEN'):
+    return {'node': {
+        'id': 'I_%s' % number,
+        'url': 'https://github.com/ansible/ansible/issues/%s' % number,
+        'number': number,
+        'state': state,
+        'createdAt': '2021-01-01T00:00:00Z',
+        'updatedAt': updated_at,
+        'repository': {'nameWithOwner': 'ansible/ansible'},
+        'timelineItems': {'updatedAt': '2021-01-01T00:00:00Z'},
+    }}
+
+
+def _summary_page(otype, edges, has_next_page=True):
+    response = mock.Mock()
+    response.ok = True
+    response.json.return_value = {'data': {'repository': {otype: {
+        'pageInfo': {'hasNextPage': has_next_page, 'endCursor': 'abc'},
+        'edges': edges,
+    }}}}
+    return response
+
+
+@mock.patch('ansibullbot.utils.gh_gql_client.post_to_receiver', mock.Mock())
+def test_sync_issue_summaries_is_incremental(tmpdir):
+    cachedir = str(tmpdir)
+    gqlc = GithubGraphQLClient('token')
+
+    full = {
+        '1': dict(_summary_node(1, '2021-02-01T00:00:00Z')['node'], issue_updated_at='2021-02-01T00:00:00Z', state='open'),
+        '2': dict(_summary_node(2, '2021-03-01T00:00:00Z')['node'], issue_updated_at='2021-03-01T00:00:00Z', state='open'),
+    }
+    with mock.patch.object(gqlc, 'get_issue_summaries', return_value=full):
+        summaries = gqlc.sync_issue_summaries('ansible/ansible', cachedir)
+    assert sorted(summaries) == ['1', '2']
+
+    pages = [
+        # issue 1 was closed, issue 3 is new, issue 2 is older than the cursor
+        _summary_page('issues', [
+            _summary_node(3, '2021-04-02T00:00:00Z'),
+            _summary_node(1, '2021-04-01T00:00:00Z', state='CLOSED'),
+            _summary_node(2, '2021-02-15T00:00:00Z'),
+        ]),
+        _summary_page('pullRequests', [
+            _summary_node(4, '2021-04-03T00:00:00Z', state='MERGED'),
+        ], has_next_page=False),
+        _summary_page('pullRequests', [], has_next_page=False),
+    ]
+    with mock.patch.object(gqlc, 'get_issue_summaries') as get_issue_summaries, \
+            mock.patch.object(gqlc, 'post_request', side_effect=pages) as post_request:
+        summaries = gqlc.sync_issue_summaries('ansible/ansible', cachedir)
+
+    assert not get_issue_summaries.called
+    assert post_request.call_count == 3
+    assert 'UPDATED_AT' in post_request.call_args_list[0][0][0]['query']
+    assert 'states' not in post_request.call_args_list[0][0][0]['query']
+    assert sorted(summaries) == ['1', '2', '3', '4']
+    assert summaries['1']['state'] == 'closed'
+    assert summaries['3']['state'] == 'open'
+    assert summaries['4']['state'] == 'merged'
+    assert summaries.select(state='closed') == {1, 4}
+
+    # a forced full sync ignores the store
+    with mock.patch.object(gqlc, 'get_issue_summaries', return_value=full) as get_issue_summaries:
+        gqlc.sync_issue_summaries('ansible/ansible', cachedir, full=True)
+    assert get_issue_summaries.called
+
+
+def _ci_node(number, ci_updated_at):
+    return {'node': {
+        'number': number,
+        'commits': {'nodes': [{'commit': {'checkSuites': {'nodes': [{'updatedAt': ci_updated_at}]}}}]},
+    }}
+
+
+@mock.patch('ansibullbot.utils.gh_gql_client.post_to_receiver', mock.Mock())
+def test_sync_issue_summaries_refreshes_ci_updated_at(tmpdir):
+    cachedir = str(tmpdir)
+    gqlc = GithubGraphQLClient('token')
+
+    full = {
+        str(x): dict(
+            _summary_node(x, '2021-02-01T00:00:00Z')['node'],
+            issue_updated_at='2021-02-01T00:00:00Z',
+            updated_at='2021-02-01T00:00:00Z',
+            ci_updated_at='2021-02-01T00:00:00Z',
+            state='open',
+            type='pullrequest',
+        ) for x in (1, 2)
+    }
+    with mock.patch.object(gqlc, 'get_issue_summaries', return_value=full):
+        gqlc.sync_issue_summaries('ansible/ansible', cachedir)
+
+    pages = [
+        # nothing was updated, but a new CI run finished on PR 1
+        _summary_page('issues', [], has_next_page=False),
+        _summary_page('pullRequests', [], has_next_page=False),
+        _summary_page('pullRequests', [
+            _ci_node(1, '2021-03-01T00:00:00Z'),
+            _ci_node(2, '2021-02-01T00:00:00Z'),
+        ], has_next_page=False),
+    ]
+    with mock.patch.object(gqlc, 'post_request', side_effect=pages) as post_request:
+        summaries = gqlc.sync_issue_summaries('ansible/ansible', cachedir)
+
+    assert 'states: OPEN' in post_request.call_args_list[2][0][0]['query']
+    assert summaries['1']['ci_updated_at'] == '2021-03-01T00:00:00Z'
+    assert summaries['1']['updated_at'] == '2021-03-01T00:00:00Z'
+    assert summaries['2']['updated_at'] == '2021-02-01T00:00:00Z'
@@ -0,0 +1,97 @@
+import github
+import pytest
+import requests
+
+from requests.adapters import BaseAdapter
+
+from ansibullbot.ghapiwrapper import ConditionalRequester
+from ansibullbot.utils import http_archive
+from ansibullbot.utils.http_archive import HttpArchive, RecordingAdapter, ReplayAdapter, request_key
+from ansibullbot.utils.instrumentation import STATS
+from ansibullbot.utils.net_tools import get_session
+
+
+class CountingAdapter(BaseAdapter):
+    '''Answer with the number of requests seen so far'''
+
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+
+    def send(self, request, **kwargs):
+        self.calls += 1
+        response = requests.Response()
+        response.status_code = 200
+        response.reason = 'OK'
+        response.headers['ETag'] = '"%s"' % self.calls
+        response._content = ('{"call": %s}' % self.calls).encode('utf-8')
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+def _session(adapter):
+    session = requests.Session()
+    session.mount('https://', adapter)
+    return session
+
+
+def test_request_key_ignores_query_order_and_headers():
+    assert request_key('get', 'https://api.github.com/x?b=2&a=1') == request_key('GET', 'https://API.github.com:443/x?a=1&b=2')
+    assert request_key('POST', 'https://api.github.com/graphql', '{"q": 1}') != \
+        request_key('POST', 'https://api.github.com/graphql', '{"q": 2}')
+
+
+def test_record_then_replay(tmpdir):
+    archive = HttpArchive(str(tmpdir.join('traffic.jsonl.gz')))
+    recorder = _session(RecordingAdapter(archive, CountingAdapter()))
+    recorder.get('https://api.github.com/repos/ansible/ansible', headers={'Authorization': 'token secret'})
+    recorder.get('https://api.github.com/repos/ansible/ansible')
+    recorder.post('https://api.github.com/graphql', data='{"query": "x"}')
+
+    with open(archive.path, 'rb') as f:
+        assert b'secret' not in f.read()
+
+    replayer = _session(ReplayAdapter(archive, latency=0))
+    assert replayer.get('https://api.github.com/repos/ansible/ansible').json() == {'call': 1}
+    assert replayer.get('https://api.github.com/repos/ansible/ansible').json() == {'call': 2}
+    # the last recorded response is served once the recording runs out
+    rr = replayer.get('https://api.github.com/repos/ansible/ansible')
+    assert rr.json() == {'call': 2}
+    assert rr.headers['etag'] == '"2"'
+    assert replayer.post('https://api.github.com/graphql', data='{"query": "x"}').json() == {'call': 3}
+
+    with pytest.raises(requests.exceptions.ConnectionError):
+        replayer.get('https://api.github.com/rate_limit')
+
+
+def test_install_routes_the_shared_session(tmpdir):
+    path = str(tmpdir.join('traffic.jsonl.gz'))
+    _session(RecordingAdapter(HttpArchive(path), CountingAdapter())).get('https://dev.azure.com/ansible/_apis/build')
+
+    http_archive.install('replay', path, latency=0)
+    try:
+        assert get_session().get('https://dev.azure.com/ansible/_apis/build').json() == {'call': 1}
+    finally:
+        http_archive.uninstall()
+    assert not isinstance(get_session().get_adapter('https://'), ReplayAdapter)
+
+
+def test_replayed_github_requests_are_counted_once(tmpdir):
+    path = str(tmpdir.join('traffic.jsonl.gz'))
+    _session(RecordingAdapter(HttpArchive(path), CountingAdapter())).get('https://api.github.com/repos/ansible/ansible')
+
+    http_archive.install('replay', path, latency=0)
+    try:
+        gh = github.Github()
+        ConditionalRequester.install(gh._Github__requester, None)
+        STATS.reset()
+        with STATS.stage('replay'):
+            gh.get_repo('ansible/ansible')
+            get_session().get('https://api.github.com/repos/ansible/ansible')
+    finally:
+        http_archive.uninstall()
+    assert STATS.snapshot()['replay']['calls']['github'] == 2
@@ -0,0 +1,86 @@
+import json
+import os
+import tempfile
+
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from ansibullbot.utils.instrumentation import Instrumentation, classify_url
+
+
+def test_classify_url():
+    assert classify_url('https://api.github.com/repos/ansible/ansible/issues') == 'github'
+    assert classify_url('https://dev.azure.com/ansible/ansible/_apis/build/builds') == 'azp'
+    assert classify_url('https://galaxy.ansible.com/api') == 'http'
+
+
+@mock.patch('ansibullbot.constants.DEFAULT_GITHUB_URL', 'https://github.example.com/api/v3')
+def test_classify_url_github_enterprise():
+    assert classify_url('https://github.example.com/api/v3/repos/ansible/ansible') == 'github'
+    assert classify_url('https://github.example.com/api/graphql') == 'github'
+    assert classify_url('https://example.com/api/v3') == 'http'
+
+
+def test_stages_count_calls_inclusively():
+    stats = Instrumentation()
+    with stats.stage('triage'):
+        stats.count('github')
+        with stats.stage('fact.shipit'):
+            stats.count('github')
+            stats.count('git')
+    stats.count('azp')
+
+    stages = stats.snapshot()
+    assert stages['triage']['count'] == 1
+    assert stages['triage']['calls']['github'] == 2
+    assert stages['triage']['calls']['git'] == 1
+    assert stages['fact.shipit']['calls']['github'] == 1
+    assert stages['triage']['wall'] >= stages['fact.shipit']['wall']
+    assert all(x['calls']['azp'] == 0 for x in stages.values())
+
+
+def test_bound_threads_count_for_the_submitting_stage():
+    stats = Instrumentation()
+
+    def fetch(_):
+        stats.count('github')
+        with stats.stage('fact.shipit'):
+            stats.count('git')
+
+    with stats.stage('triage'):
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(stats.bind(fetch), range(8)))
+        # unbound work only counts for its own stages
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            executor.submit(fetch, 0).result()
+
+    stages = stats.snapshot()
+    assert stages['triage']['calls']['github'] == 8
+    assert stages['triage']['calls']['git'] == 8
+    assert stages['fact.shipit']['count'] == 9
+    assert stages['fact.shipit']['calls']['git'] == 9
+
+
+def test_merge_and_report():
+    stats = Instrumentation()
+    with stats.stage('triage'):
+        stats.count('github')
+
+    worker = Instrumentation()
+    with worker.stage('triage'):
+        worker.count('github')
+    with worker.stage('fetch'):
+        pass
+    stats.merge(worker.snapshot())
+
+    stages = stats.snapshot()
+    assert stages['triage']['count'] == 2
+    assert stages['triage']['calls']['github'] == 2
+    assert stages['fetch']['count'] == 1
+    assert stats.table()[0].startswith('stage')
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filename = os.path.join(tmpdir, 'stats', 'stats.json')
+        stats.report(filename)
+        with open(filename) as f:
+            assert json.load(f)['stages'] == stages
@@ -0,0 +1,51 @@
+from ansibullbot.issuewrapper import UnsetValue
+from ansibullbot.utils.issue_memory import CACHED_ATTRIBUTES, IssueMemory
+
+
+class Wrapper:
+    def __init__(self, number, **kwargs):
+        self.number = number
+        for name in CACHED_ATTRIBUTES:
+            setattr(self, name, kwargs.get(name, UnsetValue))
+
+
+SUMMARY = {'updated_at': '2021-01-01T00:00:00Z', 'ci_updated_at': None}
+
+
+def test_seeds_the_wrapper_while_the_summary_is_unchanged():
+    memory = IssueMemory(10, 10 ** 6)
+    memory.save(Wrapper(1, _events=[{'event': 'labeled'}]), 'ansible/ansible', SUMMARY)
+
+    iw = Wrapper(1)
+    assert memory.load(iw, 'ansible/ansible', SUMMARY)
+    assert iw._events == [{'event': 'labeled'}]
+    assert iw._history is UnsetValue
+
+    assert not memory.load(Wrapper(1), 'ansible/ansible', dict(SUMMARY, ci_updated_at='2021-01-02T00:00:00Z'))
+    # and the stale entry is gone
+    assert not memory.load(Wrapper(1), 'ansible/ansible', SUMMARY)
+    assert (memory.hits, memory.misses) == (1, 2)
+
+
+def test_least_recently_used_entries_are_dropped():
+    memory = IssueMemory(2, 10 ** 6)
+    for number in (1, 2):
+        memory.save(Wrapper(number, _events=[]), 'ansible/ansible', SUMMARY)
+    assert memory.load(Wrapper(1), 'ansible/ansible', SUMMARY)
+    memory.save(Wrapper(3, _events=[]), 'ansible/ansible', SUMMARY)
+
+    assert not memory.load(Wrapper(2), 'ansible/ansible', SUMMARY)
+    assert memory.load(Wrapper(1), 'ansible/ansible', SUMMARY)
+
+
+def test_bounded_by_size():
+    memory = IssueMemory(10, 5000)
+    memory.save(Wrapper(1, _events=['x' * 3000]), 'ansible/ansible', SUMMARY)
+    memory.save(Wrapper(2, _events=['y' * 3000]), 'ansible/ansible', SUMMARY)
+
+    assert len(memory) == 1
+    assert memory.size <= 5000
+    assert memory.load(Wrapper(2), 'ansible/ansible', SUMMARY)
+
+    memory.save(Wrapper(3, _events=['z' * 6000]), 'ansible/ansible', SUMMARY)
+    assert not memory.load(Wrapper(3), 'ansible/ansible', SUMMARY)
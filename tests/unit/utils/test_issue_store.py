@@ -0,0 +1,87 @@
+import json
+import os
+import pickle
+
+from unittest import mock
+
+from github import Github
+from github.Issue import Issue
+
+from ansibullbot.utils.issue_store import IssueStore, decode, encode, get_issue_store, migrate_issue_cache, raw_record
+
+
+def test_buffered_writes_are_read_back_and_committed_together(tmpdir):
+    path = str(tmpdir.join('issues.sqlite'))
+    store = IssueStore(path, batch_size=3)
+    store.put('ansible/ansible', 1, 'meta', {'actions': {}})
+    store.put('ansible/ansible', 2, 'meta', {'actions': {'close': True}})
+
+    assert store.get('ansible/ansible', 1, 'meta') == {'actions': {}}
+    assert IssueStore(path).get('ansible/ansible', 1, 'meta') is None
+
+    store.put('ansible/ansible', 3, 'meta', {})
+    assert IssueStore(path).get('ansible/ansible', 2, 'meta') == {'actions': {'close': True}}
+
+
+def test_records_do_not_share_state_with_the_caller(tmpdir):
+    store = IssueStore(str(tmpdir.join('issues.sqlite')))
+    data = [{'event': 'labeled'}]
+    store.put('ansible/ansible', 1, 'timeline', data)
+    data[0]['event'] = 'unlabeled'
+
+    assert store.get('ansible/ansible', 1, 'timeline') == [{'event': 'labeled'}]
+
+
+def test_records_of_another_version_are_missing(tmpdir):
+    store = IssueStore(str(tmpdir.join('issues.sqlite')))
+    store.put('ansible/ansible', 1, 'files', ['a'])
+    store.flush()
+
+    with mock.patch.dict('ansibullbot.utils.issue_store.RECORD_VERSIONS', {'files': 3}):
+        assert store.get('ansible/ansible', 1, 'files') is None
+        assert store.numbers('ansible/ansible', 'files') == []
+
+
+def test_api_objects_are_cached_as_their_raw_data(tmpdir):
+    gh = Github('token1')
+    issue = gh.create_from_raw_data(Issue, {'number': 1, 'title': 'x', 'url': 'https://api.github.com/repos/a/b/issues/1'}, {'etag': '"abc"'})
+
+    blob = encode('issue', raw_record(issue))
+    assert b'token1' not in blob
+
+    # picked up by a requester with another token
+    record = decode('issue', blob)
+    cached = Github('token2').create_from_raw_data(Issue, record['raw_data'], record['headers'])
+    assert cached.title == 'x'
+    assert cached.etag == '"abc"'
+
+
+def test_delete(tmpdir):
+    store = IssueStore(str(tmpdir.join('issues.sqlite')))
+    store.put('ansible/ansible', 1, 'issue', 'x')
+    store.put('ansible/ansible', 1, 'meta', {})
+    store.flush()
+    store.delete('ansible/ansible', 1)
+
+    assert store.get('ansible/ansible', 1, 'issue') is None
+    store.flush()
+    assert store.numbers('ansible/ansible', 'meta') == []
+
+
+def test_migrate_issue_cache(tmpdir):
+    issuedir = tmpdir.mkdir('ansible').mkdir('ansible').mkdir('issues').mkdir('1')
+    issuedir.join('meta.json').write(json.dumps({'updated_at': '2021-01-01T00:00:00', 'actions': {}}))
+    issuedir.join('timeline_data.json').write(json.dumps([{'event': 'labeled'}]))
+    issuedir.join('timeline_meta.json').write(json.dumps({'updated_at': '2021-01-01T00:00:00', 'url': 'x'}))
+    issuedir.join('history.pickle').write_binary(pickle.dumps({'version': 1.2, 'updated_at': None, 'history': []}))
+    issuedir.join('files.pickle').write_binary(b'garbage')
+
+    repo_cachedir = str(tmpdir.join('ansible', 'ansible'))
+    assert migrate_issue_cache(repo_cachedir, 'ansible/ansible', remove=True) == 3
+
+    store = get_issue_store(repo_cachedir)
+    assert store.get('ansible/ansible', 1, 'meta')['actions'] == {}
+    assert store.get('ansible/ansible', 1, 'timeline')['data'] == [{'event': 'labeled'}]
+    assert store.get('ansible/ansible', 1, 'history')['version'] == 1.2
+    # the unreadable file is left behind
+    assert os.listdir(str(issuedir)) == ['files.pickle']
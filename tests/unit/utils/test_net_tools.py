@@ -0,0 +1,35 @@
+from unittest import mock
+
+import ansibullbot.constants as C
+
+from ansibullbot.utils.net_tools import get_session
+
+
+def test_get_session_is_shared():
+    assert get_session() is get_session()
+
+
+def test_get_session_is_recreated_after_fork():
+    session = get_session()
+    with mock.patch('ansibullbot.utils.net_tools.os.getpid', return_value=-1):
+        assert get_session() is not session
+
+
+def test_get_session_retries():
+    adapter = get_session().get_adapter('https://api.github.com')
+    assert adapter.max_retries.total > 0
+    assert 502 in adapter.max_retries.status_forcelist
+
+
+def test_get_session_pools_per_host():
+    with mock.patch('ansibullbot.utils.net_tools.C.DEFAULT_RECEIVER_HOST', 'receiver.example.com'), \
+            mock.patch('ansibullbot.utils.net_tools.C.DEFAULT_RECEIVER_PORT', 5001), \
+            mock.patch('ansibullbot.utils.net_tools.os.getpid', return_value=-2):
+        session = get_session()
+
+    github = session.get_adapter('https://api.github.com/graphql')
+    receiver = session.get_adapter('http://receiver.example.com:5001/summaries')
+    other = session.get_adapter('https://dev.azure.com/ansible')
+    assert github._pool_maxsize == C.DEFAULT_HTTP_GITHUB_POOL_MAXSIZE
+    assert receiver._pool_maxsize == 1
+    assert other._pool_maxsize == C.DEFAULT_HTTP_POOL_MAXSIZE
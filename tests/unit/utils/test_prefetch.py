@@ -0,0 +1,33 @@
+import threading
+
+from ansibullbot.utils.prefetch import Prefetcher
+
+
+def test_prefetcher_keeps_order():
+    results = list(Prefetcher(lambda x: x * 2, range(1, 20), lookahead=4))
+    assert results == [(x, x * 2) for x in range(1, 20)]
+
+
+def test_prefetcher_failed_fetch_yields_none():
+    def fetch(x):
+        if x == 3:
+            raise Exception('boom')
+        return x
+
+    results = dict(Prefetcher(fetch, [1, 2, 3, 4], lookahead=2))
+    assert results == {1: 1, 2: 2, 3: None, 4: 4}
+
+
+def test_prefetcher_window_is_bounded():
+    started = []
+    lock = threading.Lock()
+
+    def fetch(x):
+        with lock:
+            started.append(x)
+        return x
+
+    prefetcher = iter(Prefetcher(fetch, range(1, 100), lookahead=3))
+    next(prefetcher)
+    # the consumed item plus the refilled window
+    assert len(started) <= 4
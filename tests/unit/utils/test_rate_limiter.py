@@ -0,0 +1,52 @@
+from ansibullbot.utils.rate_limiter import RateLimiter
+
+
+def _limiter(remaining, reset=1000, limit=5000, resource='core'):
+    limiter = RateLimiter()
+    limiter.update({
+        'x-ratelimit-limit': str(limit),
+        'x-ratelimit-remaining': str(remaining),
+        'x-ratelimit-reset': str(reset),
+        'x-ratelimit-resource': resource,
+    })
+    return limiter
+
+
+def test_unknown_budget_does_not_wait():
+    assert RateLimiter().schedule('core', now=0) == 0
+
+
+def test_plenty_of_budget_does_not_wait():
+    limiter = _limiter(4000)
+    assert limiter.schedule('core', now=0) == 0
+    assert limiter.remaining('core') == 3999
+
+
+def test_budgets_are_separate():
+    limiter = _limiter(4000)
+    limiter.update({'X-RateLimit-Remaining': '50', 'X-RateLimit-Reset': '1000', 'X-RateLimit-Resource': 'graphql'})
+    assert limiter.schedule('core', now=0) == 0
+    assert limiter.schedule('graphql', now=0) == 1001
+
+
+def test_low_budget_is_paced():
+    limiter = _limiter(RateLimiter.reserve + 100)
+    delays = [limiter.schedule('core', now=0) for x in range(3)]
+    assert delays[0] == 0
+    assert 0 < delays[1] < delays[2] < 1000
+
+
+def test_window_reset_restores_budget():
+    limiter = _limiter(0)
+    assert limiter.schedule('core', now=500) == 501
+    assert limiter.schedule('core', now=1000) == 0
+
+
+def test_rate_limit_json():
+    limiter = RateLimiter()
+    limiter.update_from_json({'resources': {
+        'core': {'limit': 5000, 'remaining': 4000, 'reset': 1000},
+        'graphql': {'limit': 5000, 'remaining': 10, 'reset': 1000},
+    }})
+    assert limiter.remaining('core') == 4000
+    assert limiter.remaining('graphql') == 10
@@ -0,0 +1,58 @@
+from ansibullbot.utils.summary_store import SummaryIndex
+
+
+def _node(number, state='open', _type='issue'):
+    return {
+        'number': number,
+        'state': state,
+        'type': _type,
+        'repository': {'nameWithOwner': 'ansible/ansible'},
+    }
+
+
+def test_summary_index_placeholders():
+    index = SummaryIndex({'2': _node(2), '5': _node(5, 'closed', 'pullRequest')})
+
+    assert len(index) == 2
+    assert index.keys() == ['2', '5']
+    assert index.max_number == 5
+    assert '3' in index
+    assert 6 not in index
+
+    placeholder = index['3']
+    assert placeholder['number'] == 3
+    assert placeholder['state'] == 'closed'
+    assert placeholder['type'] is None
+    assert placeholder['repository']['nameWithOwner'] == 'ansible/ansible'
+
+    assert index.get('6') is None
+
+
+def test_summary_index_select():
+    index = SummaryIndex({
+        '1': _node(1),
+        '3': _node(3, _type='pullrequest'),
+        '4': _node(4, 'closed', 'pullRequest'),
+    })
+
+    assert index.select() == {1, 2, 3, 4}
+    assert index.select(state='open') == {1, 3}
+    assert index.select(state='closed') == {2, 4}
+    assert index.select(type='pullrequest') == {3, 4}
+    assert index.select(state='open', type='issue') == {1}
+
+    # a number seen closed can be reopened
+    index['4'] = _node(4)
+    index['7'] = _node(7)
+    assert index.select(state='open') == {1, 3, 4, 7}
+    assert index.select(state='closed') == {2, 5, 6}
+    assert index.to_dict()['4']['state'] == 'open'
+
+
+def test_summary_index_merged_pullrequests_are_closed():
+    index = SummaryIndex({'1': _node(1, 'merged', 'pullrequest'), '2': _node(2, 'closed')})
+
+    assert index['1']['state'] == 'merged'
+    assert index.select(state='closed') == {1, 2}
+    assert index.select(state='merged') == {1}
+    assert index.select(state='open') == set()
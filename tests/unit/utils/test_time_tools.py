@@ -1,7 +1,9 @@
+import datetime
+
 import pytest
 
 from unittest import TestCase
-from ansibullbot.utils.timetools import strip_time_safely
+from ansibullbot.utils.timetools import parse_time_utc, strip_time_safely
 
 
 class TestTimeStrip(TestCase):
@@ -31,3 +33,10 @@ class TestTimeStrip(TestCase):
         ts = '2017-06-01T17:54:00ZDSFSDFDFSDFS'
         with pytest.raises(Exception):
             to = strip_time_safely(ts)
+
+
+def test_parse_time_utc():
+    to = parse_time_utc('2017-06-01T17:54:00Z')
+    assert to.tzinfo == datetime.timezone.utc
+    assert to.hour == 17
+    assert parse_time_utc('2017-06-01T19:54:00+02:00') == to
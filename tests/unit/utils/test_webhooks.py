@@ -0,0 +1,108 @@
+import hashlib
+import hmac
+import json
+import tempfile
+import urllib.error
+import urllib.request
+
+from unittest import mock
+
+import pytest
+
+from ansibullbot.utils.sqlite_utils import AnsibullbotDatabase
+from ansibullbot.utils.webhooks import get_event_numbers, start_webhook_listener, verify_signature
+
+
+SECRET = 'hunter2'
+
+
+def _sign(body, secret=SECRET):
+    return 'sha256=' + hmac.new(secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+
+
+@pytest.fixture
+def adb():
+    with tempfile.TemporaryDirectory() as cachedir:
+        unc = 'sqlite:///' + cachedir + '/test.db'
+        with mock.patch('ansibullbot.utils.sqlite_utils.C.DEFAULT_DATABASE_UNC', unc):
+            yield AnsibullbotDatabase(cachedir=cachedir)
+
+
+def test_verify_signature():
+    body = b'{"zen": "Keep it logically awesome."}'
+    assert verify_signature(SECRET, body, _sign(body))
+    assert not verify_signature(SECRET, body, _sign(body, secret='other'))
+    assert not verify_signature(SECRET, body, None)
+    assert not verify_signature('', body, _sign(body, secret=''))
+
+
+def test_get_event_numbers():
+    repository = {'full_name': 'ansible/ansible'}
+    assert get_event_numbers('issue_comment', {'repository': repository, 'issue': {'number': 1}}) == ('ansible/ansible', [1])
+    assert get_event_numbers('pull_request_review', {'repository': repository, 'pull_request': {'number': 2}}) == ('ansible/ansible', [2])
+    payload = {'repository': repository, 'check_suite': {'pull_requests': [{'number': 3}, {'number': 4}]}}
+    assert get_event_numbers('check_suite', payload) == ('ansible/ansible', [3, 4])
+
+
+def test_queue_coalesces_events_per_number(adb):
+    adb.enqueue_webhook_event('ansible/ansible', 2, 'issues')
+    adb.enqueue_webhook_event('ansible/ansible', 1, 'issue_comment')
+    adb.enqueue_webhook_event('ansible/ansible', 2, 'issue_comment')
+    adb.enqueue_webhook_event('ansible/ansible', 2, 'issues')
+
+    events = adb.claim_webhook_events()
+    assert [(x['repo'], x['number'], x['events']) for x in events] == [
+        ('ansible/ansible', 2, ['issues', 'issue_comment']),
+        ('ansible/ansible', 1, ['issue_comment']),
+    ]
+    assert adb.claim_webhook_events() == []
+
+
+def test_claimed_events_stay_queued_until_finished(adb):
+    adb.enqueue_webhook_event('ansible/ansible', 1, 'issues')
+    adb.enqueue_webhook_event('ansible/ansible', 2, 'issues')
+    events = adb.claim_webhook_events()
+
+    # an event for a number being triaged is queued again
+    adb.enqueue_webhook_event('ansible/ansible', 1, 'issue_comment')
+
+    # the triage failed, the numbers go back to the queue
+    adb.release_webhook_events([x['id'] for x in events])
+    events = adb.claim_webhook_events()
+    assert [(x['number'], x['events']) for x in events] == [
+        (1, ['issues', 'issue_comment']),
+        (2, ['issues']),
+    ]
+
+    adb.finish_webhook_events([x['id'] for x in events])
+    adb.release_webhook_events()
+    assert adb.claim_webhook_events() == []
+
+
+def test_listener_queues_signed_events(adb):
+    server = start_webhook_listener('127.0.0.1', 0, SECRET, ['ansible/ansible'], db=adb)
+    url = 'http://%s:%s/' % server.server_address[:2]
+
+    def post(event, payload, signature=None):
+        body = json.dumps(payload).encode('utf-8')
+        req = urllib.request.Request(url, data=body, method='POST', headers={
+            'X-GitHub-Event': event,
+            'X-Hub-Signature-256': signature or _sign(body),
+        })
+        try:
+            return urllib.request.urlopen(req).status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+    try:
+        issue = {'repository': {'full_name': 'ansible/ansible'}, 'issue': {'number': 10}}
+        assert post('issues', issue) == 202
+        assert post('issues', issue, signature='sha256=bad') == 401
+        assert post('ping', {'zen': 'x'}) == 204
+        other = {'repository': {'full_name': 'ansible/other'}, 'issue': {'number': 11}}
+        assert post('issues', other) == 202
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert [(x['repo'], x['number'], x['events']) for x in adb.claim_webhook_events()] == [('ansible/ansible', 10, ['issues'])]
@@ -0,0 +1,66 @@
+import datetime
+
+from ansibullbot.utils.work_queue import (
+    PRIORITY_CI,
+    PRIORITY_STALE,
+    PRIORITY_TIMER,
+    PRIORITY_UPDATED,
+    WorkQueue,
+    has_due_timer,
+)
+
+
+def test_ordered_by_priority_then_number():
+    queue = WorkQueue()
+    queue.add(5, PRIORITY_STALE)
+    queue.add(1, PRIORITY_TIMER)
+    queue.add(3, PRIORITY_UPDATED)
+    queue.add(2, PRIORITY_CI)
+    queue.add(4, PRIORITY_UPDATED)
+    assert queue.ordered() == [3, 4, 2, 1, 5]
+    assert queue.ordered(reverse=True) == [4, 3, 2, 1, 5]
+
+
+def test_most_urgent_priority_wins():
+    queue = WorkQueue()
+    queue.add('7', PRIORITY_STALE)
+    queue.add(7, PRIORITY_UPDATED)
+    queue.add(7, PRIORITY_CI)
+    assert queue.priority(7) == PRIORITY_UPDATED
+    assert len(queue) == 1
+
+
+def test_stale_oldest_first_and_limited():
+    queue = WorkQueue()
+    queue.add(1, PRIORITY_UPDATED)
+    queue.add(10, PRIORITY_STALE, key='2021-03-01T00:00:00')
+    queue.add(11, PRIORITY_STALE, key='2021-01-01T00:00:00')
+    queue.add(12, PRIORITY_STALE)
+    assert queue.ordered() == [1, 12, 11, 10]
+    assert queue.ordered(stale_limit=1) == [1, 12]
+    assert queue.ordered(numbers=[10, 11, 99]) == [11, 10]
+
+
+def test_needs_info_timer_due():
+    now = datetime.datetime(2021, 6, 1, tzinfo=datetime.timezone.utc)
+    meta = {
+        'time': '2021-05-25T00:00:00+00:00',
+        'labels': ['needs_info'],
+        'history': [
+            {'event': 'labeled', 'label': 'needs_info', 'created_at': '2021-04-20T00:00:00+00:00'},
+        ],
+    }
+    # the 30 day warning fell on 2021-05-20, before the last triage
+    assert not has_due_timer(meta, now=now)
+
+    meta['history'].append({
+        'event': 'commented',
+        'body': '<!--- boilerplate: needs_info_base --->',
+        'created_at': '2021-05-03T00:00:00+00:00',
+    })
+    # the expiry 30 days after the warning fell after the last triage
+    assert not has_due_timer(meta, now=now)
+    assert has_due_timer(meta, now=now + datetime.timedelta(days=1))
+
+    meta['labels'] = []
+    assert not has_due_timer(meta, now=now + datetime.timedelta(days=1))
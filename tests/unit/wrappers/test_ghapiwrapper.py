@@ -0,0 +1,123 @@
+import json
+
+from unittest import mock
+
+import pytest
+
+from ansibullbot.ghapiwrapper import GithubWrapper, RequestCache
+from ansibullbot.utils.sqlite_utils import AnsibullbotDatabase
+
+
+@pytest.fixture
+def adb(tmp_path):
+    unc = 'sqlite:///%s/test.db' % tmp_path
+    with mock.patch('ansibullbot.utils.sqlite_utils.C.DEFAULT_DATABASE_UNC', unc):
+        adb = AnsibullbotDatabase(cachedir=str(tmp_path))
+    with mock.patch('ansibullbot.ghapiwrapper.ADB', adb):
+        yield adb
+
+
+def test_request_cache_roundtrip(adb, tmp_path):
+    rc = RequestCache(str(tmp_path), token='abc')
+    url = 'https://api.github.com/repos/ansible/ansible/issues/1'
+
+    assert rc.conditional_headers(url) == ({}, None)
+
+    rc.save(url, {'etag': '"1"'}, json.dumps({'number': 1}))
+    headers, meta = rc.conditional_headers(url)
+    assert headers == {'If-None-Match': '"1"'}
+    assert json.loads(rc.load(meta)) == {'number': 1}
+
+    # a newer payload replaces the stored validators
+    rc.save(url, {'ETag': '"2"'}, json.dumps({'number': 2}))
+    headers, meta = rc.conditional_headers(url)
+    assert headers == {'If-None-Match': '"2"'}
+    assert json.loads(rc.load(meta)) == {'number': 2}
+
+
+def test_request_cache_skips_urls_that_are_not_read_again(adb, tmp_path):
+    rc = RequestCache(str(tmp_path / 'cached_requests'), token='abc')
+    url = 'https://api.github.com/search/issues?q=repo:ansible/ansible'
+
+    rc.save(url, {'etag': '"1"'}, json.dumps({'items': []}))
+    assert rc.conditional_headers(url) == ({}, None)
+    assert not (tmp_path / 'cached_requests').exists()
+
+
+def test_get_request_fetches_pages_in_order(tmp_path):
+    url = 'https://api.github.com/repos/ansible/ansible/issues/1/timeline'
+
+    def get_page(u):
+        page = int(u.split('&page=')[1]) if '&page=' in u else 1
+        links = {}
+        if page == 1:
+            links = {
+                'next': {'url': url + '?per_page=100&page=2'},
+                'last': {'url': url + '?per_page=100&page=5'},
+            }
+        return [page], links
+
+    gw = GithubWrapper(url='https://api.github.com', token='abc', cachedir=str(tmp_path))
+    with mock.patch.object(gw, '_get_page', side_effect=get_page) as m:
+        assert gw.get_request(url) == [1, 2, 3, 4, 5]
+    assert m.call_count == 5
+
+
+def test_get_request_walks_next_links_without_last(tmp_path):
+    url = 'https://api.github.com/search/issues'
+
+    def get_page(u):
+        page = int(u.split('cursor=')[1]) if 'cursor=' in u else 1
+        links = {}
+        if page < 3:
+            links = {'next': {'url': url + '?cursor=%s' % (page + 1)}}
+        return {'p%s' % page: page}, links
+
+    gw = GithubWrapper(url='https://api.github.com', token='abc', cachedir=str(tmp_path))
+    with mock.patch.object(gw, '_get_page', side_effect=get_page):
+        assert gw.get_request(url) == {'p1': 1, 'p2': 2, 'p3': 3}
+
+
+URL = 'https://api.github.com/repos/ansible/ansible/issues/1/timeline'
+
+
+def _paged_get(u, headers=None):
+    page = int(u.split('&page=')[1]) if '&page=' in u else 1
+    rr = mock.Mock(status_code=200, headers={}, text='[%s]' % page)
+    rr.json.return_value = [page]
+    rr.links = {}
+    if page == 1:
+        rr.links = {
+            'next': {'url': URL + '?per_page=100&page=2'},
+            'last': {'url': URL + '?per_page=100&page=4'},
+        }
+    return rr
+
+
+def _wrapper(tmp_path, token=None):
+    gw = GithubWrapper(url='https://api.github.com', token=token, cachedir=str(tmp_path))
+    # the pages are fetched on other threads, keep them off the database
+    gw.request_cache = mock.Mock()
+    gw.request_cache.conditional_headers.return_value = ({}, None)
+    return gw
+
+
+def test_every_page_takes_its_token_from_the_pool(tmp_path):
+    gw = _wrapper(tmp_path, token='abc')
+    with mock.patch('ansibullbot.ghapiwrapper.get_session') as get_session, \
+            mock.patch.object(gw.token_pool, 'update'), \
+            mock.patch.object(gw.token_pool, 'acquire', return_value='abc') as acquire:
+        get_session.return_value.get.side_effect = _paged_get
+        assert gw.get_request(URL) == [1, 2, 3, 4]
+    assert acquire.call_count == 4
+
+
+def test_pages_wait_on_the_limiter_without_a_token_pool(tmp_path):
+    gw = _wrapper(tmp_path)
+    assert gw.token_pool is None
+    with mock.patch('ansibullbot.ghapiwrapper.get_session') as get_session, \
+            mock.patch('ansibullbot.ghapiwrapper.get_limiter') as get_limiter:
+        get_session.return_value.get.side_effect = _paged_get
+        assert gw.get_request(URL) == [1, 2, 3, 4]
+    assert get_limiter.return_value.wait.call_count == 4
+    assert 'Authorization' not in get_session.return_value.get.call_args[1]['headers']
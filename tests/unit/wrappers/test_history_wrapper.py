@@ -3,7 +3,7 @@ import tempfile
 
 import pytest
 
-from ansibullbot.historywrapper import HistoryWrapper
+from ansibullbot.historywrapper import COMMENT_BREAK, HistoryWrapper
 
 
 def test_get_component_commands():
@@ -84,3 +84,26 @@ def test_ignore_events_without_dates_on_last_methods():
     res.append(hw.was_unlabeled('needs_info'))
 
     assert not [x for x in res if x is None]
+
+
+def test_get_boilerplate_comments_in_one_comment(tmp_path):
+    body = COMMENT_BREAK.join([
+        'files\n* lib/ansible/modules/foo.py\n<!--- boilerplate: components_banner --->\n',
+        '\nplease fill in the template\n<!--- boilerplate: needs_info_base --->',
+    ])
+    events = [
+        {
+            'id': 1,
+            'actor': 'ansibot',
+            'body': body,
+            'event': 'commented',
+            'created_at': datetime.datetime.utcnow(),
+        }
+    ]
+
+    hw = HistoryWrapper(events, [], datetime.datetime.utcnow(), cachedir=str(tmp_path), usecache=False)
+
+    bpcs = hw.get_boilerplate_comments()
+    assert [x[0] for x in bpcs] == ['components_banner', 'needs_info_base']
+    assert 'foo.py' in bpcs[0][1]
+    assert 'foo.py' not in bpcs[1][1]
@@ -0,0 +1,61 @@
+import datetime
+
+from unittest import mock
+
+from ansibullbot.issuewrapper import IssueWrapper
+from ansibullbot.utils.issue_store import IssueStore
+
+
+URL = 'https://api.github.com/repos/ansible/ansible/issues/1'
+
+
+def _event(number, **kwargs):
+    event = {'id': number, 'event': 'labeled', 'created_at': '2021-01-01T00:00:%02dZ' % (number % 60)}
+    event.update(kwargs)
+    return event
+
+
+def _wrapper(tmpdir, cached, responses):
+    store = IssueStore(str(tmpdir.join('issues.sqlite')))
+    store.put('ansible/ansible', 1, 'timeline', {'updated_at': '2021-01-01T00:00:00', 'url': URL + '/timeline', 'data': cached})
+
+    issue = mock.Mock(url=URL, html_url='https://github.com/ansible/ansible/issues/1', number=1)
+    github = mock.Mock()
+    github.get_request.side_effect = lambda url: responses[url]
+    iw = IssueWrapper(github=github, issue=issue, cachedir=str(tmpdir))
+    iw._records = store.records('ansible/ansible', 1)
+    iw.updated_at = datetime.datetime(2021, 1, 2)
+    return iw, store
+
+
+def test_timeline_fetches_only_the_new_pages(tmpdir):
+    cached = [_event(x) for x in range(150)]
+    edited = {'id': 149, 'body': 'edited'}
+    responses = {
+        URL + '/timeline?per_page=100&page=2': [_event(x) for x in range(100, 160)],
+        URL + '/comments?since=2021-01-01T00:00:00Z': [edited],
+    }
+    cached[149]['event'] = 'commented'
+    responses[URL + '/timeline?per_page=100&page=2'][49]['event'] = 'commented'
+    iw, store = _wrapper(tmpdir, cached, responses)
+
+    data = iw._get_timeline()
+
+    assert [x['id'] for x in data] == list(range(160))
+    assert data[149]['body'] == 'edited'
+    assert data[149]['event'] == 'commented'
+    assert iw.github.get_request.call_count == 2
+    assert store.get('ansible/ansible', 1, 'timeline')['updated_at'] == '2021-01-02T00:00:00'
+
+
+def test_timeline_is_refetched_when_an_event_was_deleted(tmpdir):
+    cached = [_event(x) for x in range(150)]
+    timeline = [_event(x) for x in range(150) if x != 10]
+    responses = {
+        URL + '/timeline?per_page=100&page=2': timeline[100:],
+        URL + '/timeline': timeline,
+    }
+    iw, _ = _wrapper(tmpdir, cached, responses)
+
+    assert iw._get_timeline() == timeline
+    assert iw.github.get_request.call_args_list[-1] == mock.call(URL + '/timeline')
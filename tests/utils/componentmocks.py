@@ -1410,9 +1410,9 @@ class BotMockManager:
         self.mocks.append(patch('ansibullbot.utils.github.C.DEFAULT_GITHUB_USERNAME', 'ansibot'))
         self.mocks.append(patch('ansibullbot.utils.github.C.DEFAULT_GITHUB_TOKEN', 'abc1234'))
         self.mocks.append(patch('github.Requester.requests', self.mr))
-        self.mocks.append(patch('ansibullbot.utils.github.requests', self.mr))
-        self.mocks.append(patch('ansibullbot.utils.gh_gql_client.requests', self.mr))
-        self.mocks.append(patch('ansibullbot.ghapiwrapper.requests', self.mr))
+        self.mocks.append(patch('ansibullbot.utils.github.get_session', lambda: self.mrs))
+        self.mocks.append(patch('ansibullbot.utils.gh_gql_client.get_session', lambda: self.mrs))
+        self.mocks.append(patch('ansibullbot.ghapiwrapper.get_session', lambda: self.mrs))
 
         for _m in self.mocks:
             _m.start()